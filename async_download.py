@@ -0,0 +1,290 @@
+import os
+import asyncio
+import logging
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import aiohttp
+from tqdm import tqdm
+
+import metrics
+
+from download_videos import (AUDIO_FORMATS, CHUNK_SIZE, DEFAULT_AUDIO_FORMAT, MAX_PER_HOST, MAX_RETRIES,
+                             PART_SUFFIX, REQUEST_TIMEOUT, DownloadVerificationError, _content_md5, _ffmpeg_command,
+                             _read_part_meta, _remove_part, _retry_after, _total_length, _verify_download,
+                             _write_part_meta, audio_filepath_for, collect_video_urls_files, convert_audio,
+                             ffmpeg_error, ffmpeg_times, group_by_media, next_retry, read_video_urls,
+                             video_filepath_for)
+from media_store import MEDIA_STORE_DIRECTORY, MediaStore
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+MAX_CONCURRENCY = 1000  # Maximale Anzahl gleichzeitiger Übertragungen auf der Event-Loop
+
+
+def classify_error(error):
+    """Return (HTTP status, Retry-After delay, network failure) of an error raised by an aiohttp transfer."""
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status, _retry_after(error) if error.headers is not None else None, False
+    return None, None, isinstance(error, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError,
+                                          asyncio.TimeoutError))
+
+
+async def with_retries(function, *args, max_retries=MAX_RETRIES, **kwargs):
+    """Await a transfer coroutine, retrying transient network and server errors like with_retries."""
+    for attempt in range(max_retries + 1):
+        try:
+            return await function(*args, **kwargs)
+        except Exception as e:
+            delay = next_retry(e, attempt, max_retries, classify=classify_error)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+
+
+def _part_state(part_filepath):
+    """Return the metadata and size of a partial download (blocking, run off the event loop)."""
+    meta = _read_part_meta(part_filepath)
+    return meta, os.path.getsize(part_filepath) if meta and os.path.exists(part_filepath) else 0
+
+
+def _finish_part(part_filepath, video_filepath):
+    """Give a verified partial download its final name (blocking, run off the event loop)."""
+    os.replace(part_filepath, video_filepath)
+    _remove_part(part_filepath)
+
+
+def _remove_if_exists(filepath):
+    if os.path.exists(filepath):
+        os.remove(filepath)
+
+
+class AsyncDownloadEngine:
+    """
+    Download engine running all transfers on one event loop.
+
+    One aiohttp session limits the connections in total and per host; FFmpeg conversions and
+    hashing run on a separate executor sized to the number of CPU cores. Other blocking file
+    operations (chunk writes, renames, links) run in threads via asyncio.to_thread.
+    """
+
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, max_per_host=MAX_PER_HOST, cpu_workers=None):
+        self.max_concurrency = max_concurrency
+        self.max_per_host = max_per_host
+        self.cpu_executor = ThreadPoolExecutor(max_workers=cpu_workers or os.cpu_count() or 1)
+        self.session = None
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_concurrency, limit_per_host=self.max_per_host),
+            timeout=aiohttp.ClientTimeout(sock_connect=REQUEST_TIMEOUT[0], sock_read=REQUEST_TIMEOUT[1]),
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+        self.cpu_executor.shutdown(wait=True)
+
+    async def run_cpu(self, fn, *args):
+        """Run a blocking function on the CPU executor."""
+        return await asyncio.get_running_loop().run_in_executor(self.cpu_executor, fn, *args)
+
+    async def download(self, url, audio_download_path, counter, chunk_size=CHUNK_SIZE):
+        """Download a video like download_video, resuming and retrying interrupted transfers."""
+        video_filepath = video_filepath_for(url, audio_download_path, counter)
+        if await asyncio.to_thread(os.path.exists, video_filepath):
+            logging.info(f"Already downloaded: {video_filepath}")
+            return video_filepath
+        try:
+            return await with_retries(self._download_attempt, url, video_filepath, chunk_size)
+        except Exception as e:
+            logging.error(f"Failed to download {url}: {e}")
+            return None
+
+    async def _download_attempt(self, url, video_filepath, chunk_size):
+        """Run a single (possibly resumed) download attempt, raising on any failure."""
+        part_filepath = video_filepath + PART_SUFFIX
+        meta, offset = await asyncio.to_thread(_part_state, part_filepath)
+        headers = {}
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+            validator = meta.get('etag') or meta.get('last_modified')
+            if validator:
+                headers['If-Range'] = validator  # Server sends the full file if it changed meanwhile
+
+        with metrics.span('download', url, offset=offset) as span:
+            async with self.session.get(url, headers=headers) as response:
+                if response.status == 416 and offset:
+                    logging.info(f"Partial download of {url} is already complete.")
+                else:
+                    response.raise_for_status()
+                    if response.status != 206:
+                        offset = 0
+                        meta = {
+                            'url': url,
+                            'etag': response.headers.get('ETag'),
+                            'last_modified': response.headers.get('Last-Modified'),
+                            'length': _total_length(response, 0),
+                            'md5': _content_md5(response),
+                        }
+                        await asyncio.to_thread(_write_part_meta, part_filepath, meta)
+                    else:
+                        logging.info(f"Resuming {url} at byte {offset}.")
+
+                    file = await asyncio.to_thread(open, part_filepath, 'ab' if offset else 'wb')
+                    try:
+                        async for chunk in response.content.iter_chunked(chunk_size):
+                            await asyncio.to_thread(file.write, chunk)
+                            span.add('bytes', len(chunk))
+                    finally:
+                        await asyncio.to_thread(file.close)
+
+        try:
+            await self.run_cpu(_verify_download, part_filepath, meta)
+        except DownloadVerificationError:
+            await asyncio.to_thread(_remove_part, part_filepath)  # Start from scratch next time
+            raise
+        await asyncio.to_thread(_finish_part, part_filepath, video_filepath)
+        return video_filepath
+
+    async def stream(self, url, audio_download_path, counter, audio_format=DEFAULT_AUDIO_FORMAT,
+                     chunk_size=CHUNK_SIZE):
+        """Pipe the response body into FFmpeg like stream_to_audio; raises CalledProcessError if FFmpeg fails."""
+        audio_filepath = audio_filepath_for(video_filepath_for(url, audio_download_path, counter), audio_format)
+        part_filepath = audio_filepath + PART_SUFFIX
+        process = None
+        try:
+            with metrics.span('stream', url, audio_format=audio_format) as span:
+                async with self.session.get(url) as response:
+                    response.raise_for_status()
+                    process = await asyncio.create_subprocess_exec(
+                        *_ffmpeg_command('pipe:0', part_filepath, AUDIO_FORMATS[audio_format]['args']),
+                        stdin=subprocess.PIPE,
+                        stdout=subprocess.DEVNULL,
+                        stderr=subprocess.PIPE
+                    )
+                    stderr = asyncio.ensure_future(process.stderr.read())
+                    try:
+                        async for chunk in response.content.iter_chunked(chunk_size):
+                            process.stdin.write(chunk)
+                            span.add('bytes', len(chunk))
+                            await process.stdin.drain()
+                    except (BrokenPipeError, ConnectionResetError):
+                        pass  # FFmpeg stopped reading; its exit code tells why
+                    except BaseException:
+                        process.kill()  # Never let FFmpeg finalize a truncated input
+                        raise
+                    finally:
+                        process.stdin.close()
+
+                returncode = await process.wait()
+                span.set(**ffmpeg_times(await stderr))
+                if returncode != 0:
+                    raise subprocess.CalledProcessError(returncode, 'ffmpeg', stderr=await stderr)
+            await asyncio.to_thread(os.replace, part_filepath, audio_filepath)
+            return audio_filepath
+        finally:
+            if process is not None and process.returncode is None:
+                process.kill()
+                await process.wait()
+            await asyncio.to_thread(_remove_if_exists, part_filepath)
+
+    async def download_and_convert(self, url, audio_download_path, counter, stream=False,
+                                   audio_format=DEFAULT_AUDIO_FORMAT):
+        """Download a video and extract its audio like download_and_convert, converting on the CPU executor."""
+        audio_filepath = audio_filepath_for(video_filepath_for(url, audio_download_path, counter), audio_format)
+        if await asyncio.to_thread(os.path.exists, audio_filepath):
+            logging.info(f"Already converted: {audio_filepath}")
+            return audio_filepath
+
+        if stream:
+            try:
+                return await with_retries(self.stream, url, audio_download_path, counter, audio_format)
+            except subprocess.CalledProcessError as e:
+                message = ffmpeg_error(e.stderr) if e.stderr else e
+                logging.warning(f"Streaming conversion of {url} failed ({message}), downloading it instead.")
+            except Exception as e:
+                logging.error(f"Failed to stream {url}: {e}")
+                return None
+
+        video_filepath = await self.download(url, audio_download_path, counter)
+        if video_filepath:
+            return await self.run_cpu(convert_audio, video_filepath, audio_format)
+        return None
+
+    async def fetch_and_link(self, store, key, occurrences, stream=False, audio_format=DEFAULT_AUDIO_FORMAT,
+                             ledger=None):
+        """Fetch a media asset into the store once and link it into every lesson directory like fetch_and_link."""
+        async def fetch():
+            object_path = await asyncio.to_thread(store.lookup, key, audio_format)
+            if object_path:
+                return object_path
+            staged_filepath = await self.download_and_convert(
+                occurrences[0][0], store.staging_directory, store.staging_counter(key), stream, audio_format
+            )
+            return await self.run_cpu(store.add, key, audio_format, staged_filepath) if staged_filepath else None
+
+        object_path = await _run_job(ledger, f"{key}:{audio_format}", fetch)
+        if object_path:
+            for url, audio_download_path, counter in occurrences:
+                target_path = audio_filepath_for(video_filepath_for(url, audio_download_path, counter), audio_format)
+                await asyncio.to_thread(store.link, object_path, target_path)
+        return object_path
+
+
+async def _run_job(ledger, asset, fetch):
+    """Await a download job like JobLedger.run, skipping it if the ledger marks it as done."""
+    if ledger is None:
+        return await fetch()
+    claimed, result = await asyncio.to_thread(ledger.begin, 'download', asset)
+    if not claimed:
+        return result
+    try:
+        result = await fetch()
+    except BaseException as e:
+        await asyncio.to_thread(ledger.fail, 'download', asset, f"{type(e).__name__}: {e}")
+        raise
+    await asyncio.to_thread(ledger.record, 'download', asset, result)
+    return result
+
+
+async def wait_for_downloads(coroutines, desc="Downloading and converting videos"):
+    """Run download coroutines concurrently and log their results like wait_for_downloads."""
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    failed = 0
+    for task in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc=desc):
+        try:
+            result = await task
+        except Exception as e:
+            logging.error(f"Unexpected error while processing a video: {e}")
+            result = None
+        if result:
+            logging.info(f"Successfully processed: {result}")
+        else:
+            failed += 1
+    if failed:
+        logging.error(f"Failed to process {failed} of {len(tasks)} videos.")
+
+
+async def process_directory_async(source_directory, download_directory, max_concurrency=MAX_CONCURRENCY,
+                                  max_per_host=MAX_PER_HOST, stream=False, audio_format=DEFAULT_AUDIO_FORMAT,
+                                  use_store=True, ledger=None):
+    """Download and convert all videos of a links directory on one event loop, like process_directory."""
+    jobs = collect_video_urls_files(source_directory, download_directory)
+    async with AsyncDownloadEngine(max_concurrency, max_per_host) as engine:
+        if not use_store:
+            coroutines = []
+            for video_urls_file, audio_download_path in jobs:
+                for counter, url in enumerate(read_video_urls(video_urls_file), 1):
+                    asset = audio_filepath_for(video_filepath_for(url, audio_download_path, counter), audio_format)
+                    fetch = partial(engine.download_and_convert, url, audio_download_path, counter, stream, audio_format)
+                    coroutines.append(_run_job(ledger, asset, fetch))
+            await wait_for_downloads(coroutines)
+            return
+
+        store = MediaStore(os.path.join(download_directory, MEDIA_STORE_DIRECTORY))
+        await wait_for_downloads(
+            engine.fetch_and_link(store, key, key_occurrences, stream, audio_format, ledger)
+            for key, key_occurrences in group_by_media(jobs).items()
+        )
@@ -0,0 +1,591 @@
+"""
+Script Name: benchmark.py
+
+Zweck des Skripts:
+Offline-Benchmarks für Extraktion, Download, Audio-Konvertierung und Transkription. Das Skript erzeugt einen
+synthetischen Kurs (HTML-Seiten wie in "source" mit iframes, kalturaIframePackageData-JSON und Playlists),
+kleine Test-Clips mit ffmpeg und startet einen lokalen HTTP-Server, der die Clips mit einstellbarer Grösse,
+Latenz und Bandbreite (mit oder ohne Range-Unterstützung) ausliefert. Es wird kein Netzwerkzugriff benötigt.
+
+Hauptfunktionen und -methoden:
+- generate_course: Erzeugt synthetische Kursseiten.
+- generate_clip: Erzeugt einen kleinen MP4-Clip mit Ton (optional auf eine Grösse aufgefüllt).
+- SyntheticMediaServer: Lokaler HTTP-Server für die Download-Benchmarks.
+- bench_extract / bench_download / bench_convert / bench_transcribe: Die einzelnen Benchmarks für
+  extract_video_urls_from_file, process_directory, convert_to_mp3 und transcribe_mp4.
+- main: Führt die gewählten Benchmarks aus und schreibt die Ergebnisse als JSON.
+
+Hinweise auf spezielle Implementierungsentscheidungen oder Sicherheitsaspekte:
+- Jeder Benchmark läuft in einem eigenen Prozess, damit der gemessene Spitzen-Speicherbedarf (Peak RSS) nur
+  diesem Benchmark zugeordnet wird.
+- Die Ergebnisse enthalten Durchsatz, Latenz-Perzentile und Peak RSS. Mit --baseline werden sie mit einem
+  früheren Lauf verglichen; Verschlechterungen über der Toleranz führen zu einem Exit-Code ungleich 0.
+- Clips werden mit einem "free"-Atom am Dateiende auf die gewünschte Grösse gebracht; Player und ffmpeg
+  ignorieren es, der Download überträgt aber die volle Grösse.
+"""
+
+import argparse
+import base64
+import hashlib
+import http.server
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import re
+import shutil
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+# Logging configuration
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+BENCHMARKS = ('extract', 'download', 'convert', 'transcribe')
+DEFAULT_TOLERANCE = 0.2  # Relative deterioration tolerated when comparing with a baseline
+SERVER_CHUNK_SIZE = 64 * 1024  # Bytes written at once by the synthetic media server
+PARTNER_PATH = '/p/106/sp/10600'
+
+
+def latency_summary(seconds: List[float]) -> Dict[str, float]:
+    """
+    Summarize latencies.
+
+    :param seconds: Measured durations in seconds.
+    :return: Mean, percentiles and maximum in milliseconds.
+    """
+    if not seconds:
+        return {}
+    ordered = sorted(seconds)
+
+    def percentile(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))] * 1000
+
+    return {
+        'mean': statistics.fmean(ordered) * 1000,
+        'p50': percentile(0.5),
+        'p90': percentile(0.9),
+        'p99': percentile(0.99),
+        'max': ordered[-1] * 1000,
+    }
+
+
+def peak_rss_mb() -> Dict[str, float]:
+    """
+    :return: Peak resident set size of this process and of its largest child process in MiB.
+    """
+    import resource
+    unit = 1024 ** 2 if sys.platform == 'darwin' else 1024  # ru_maxrss is in bytes on macOS, KiB on Linux
+    return {
+        'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit / 1024 ** 2,
+        'children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit / 1024 ** 2,
+    }
+
+
+def _entry_id(rng: random.Random) -> str:
+    return '0_' + ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz0123456789') for _ in range(8))
+
+
+def _package_data(base_url: str, entry_ids: List[str], rng: random.Random) -> Dict[str, Any]:
+    """
+    Build a kalturaIframePackageData object with one entry and a playlist of further entries.
+
+    :param base_url: Base URL of the media server.
+    :param entry_ids: IDs of the entries; the first one is the entry of the player.
+    :param rng: Random number generator.
+    :return: The package data object.
+    """
+    def manifest(entry_id: str, kind: str) -> str:
+        return f"{base_url}{PARTNER_PATH}/playManifest/entryId/{entry_id}/format/{kind}/protocol/http"
+
+    flavors = [(0, 0, 0, 96), (2, 640, 360, 317), (6, 1280, 720, 706), (7, 1920, 1080, 1450)]
+    entry_id = entry_ids[0]
+    flavor_assets = [
+        {
+            'flavorParamsId': flavor_id, 'width': width, 'height': height, 'bitrate': bitrate,
+            'videoCodecId': 'avc1' if width else None, 'status': 2, 'id': _entry_id(rng), 'entryId': entry_id,
+            'size': bitrate * 20, 'sizeInBytes': str(bitrate * 20 * 1024),
+            'tags': 'web,mbr' if width else 'audio_only', 'fileExt': 'mp4',
+        }
+        for flavor_id, width, height, bitrate in flavors
+    ]
+    items = [
+        {
+            'id': item_id, 'name': f"Lecture {index}", 'mediaType': 1, 'flavorParamsIds': '0,2,6,7',
+            'dataUrl': manifest(item_id, 'url'), 'downloadUrl': manifest(item_id, 'download') + '/flavorParamIds/0',
+            'duration': rng.randint(60, 1800), 'description': 'x' * rng.randint(50, 400),
+        }
+        for index, item_id in enumerate(entry_ids, 1)
+    ]
+    return {
+        'playerConfig': {'uiConfId': '23448423', 'plugins': {f"plugin{i}": {'plugin': True} for i in range(40)}},
+        'playlistResult': {entry_id: {'id': entry_id, 'name': 'Playlist', 'items': items}},
+        'entryResult': {
+            'meta': {
+                'id': entry_id, 'name': 'Lecture 1', 'dataUrl': manifest(entry_id, 'url'),
+                'downloadUrl': manifest(entry_id, 'download') + '/flavorParamIds/0', 'flavorParamsIds': '0,2,6,7',
+            },
+            'contextData': {'flavorAssets': flavor_assets},
+        },
+    }
+
+
+def generate_course(directory: str, base_url: str, lessons: int = 3, pages_per_lesson: int = 6,
+                    entries_per_page: int = 8, page_kb: int = 200, seed: int = 0) -> List[str]:
+    """
+    Write synthetic course pages shaped like the pages in "source".
+
+    :param directory: Directory receiving the lesson directories.
+    :param base_url: Base URL the media URLs point to.
+    :param lessons: Number of lesson directories.
+    :param pages_per_lesson: Number of HTML pages per lesson.
+    :param entries_per_page: Number of Kaltura entries per page (player entry plus playlist).
+    :param page_kb: Approximate size of a page in KiB.
+    :param seed: Seed of the random content.
+    :return: Paths of the written HTML files.
+    """
+    rng = random.Random(seed)
+    html_files = []
+    for lesson in range(1, lessons + 1):
+        lesson_directory = os.path.join(directory, f"{chr(96 + lesson)}) Lesson {lesson}")
+        os.makedirs(lesson_directory, exist_ok=True)
+        for page in range(1, pages_per_lesson + 1):
+            entry_ids = [_entry_id(rng) for _ in range(entries_per_page)]
+            package = json.dumps(_package_data(base_url, entry_ids, rng))
+            parts = [
+                '<!DOCTYPE html><html><head><meta charset="utf-8"><title>Lesson</title>',
+                '<style>' + ''.join(f".c{i}{{margin:{i}px;padding:{i % 7}px}}" for i in range(400)) + '</style>',
+                '<script type="text/javascript">var config = {"iframe": "<iframe src=\'http://ignored\'>"};</script>',
+                '</head><body>',
+                '<!-- <iframe src="http://commented.out/video"></iframe> -->',
+                f"<iframe frameborder='0' width='608' height='402' "
+                f"src='{base_url}{PARTNER_PATH}/embedIframeJs/uiconf_id/23448423/entry_id/{entry_ids[0]}'></iframe>",
+                f'<script type="text/javascript">window.kalturaIframePackageData = {package};</script>',
+            ]
+            size = sum(map(len, parts))
+            while size < page_kb * 1024:
+                paragraph = f"<div class=\"c{rng.randint(0, 399)}\"><p>{'Lorem ipsum dolor sit amet. ' * 20}</p></div>"
+                parts.append(paragraph)
+                size += len(paragraph)
+            parts.append('</body></html>')
+
+            html_file = os.path.join(lesson_directory, f"{page} Page {page}.html")
+            with open(html_file, 'w', encoding='utf-8') as file:
+                file.write(''.join(parts))
+            html_files.append(html_file)
+    return html_files
+
+
+def generate_links(directory: str, base_url: str, lessons: int = 3, files_per_lesson: int = 4,
+                   seed: int = 0) -> int:
+    """
+    Write link files (as produced by extract_videos.py) pointing to the synthetic media server.
+
+    :param directory: Directory receiving the lesson directories with the link files.
+    :param base_url: Base URL of the media server.
+    :param lessons: Number of lesson directories.
+    :param files_per_lesson: Number of videos per lesson.
+    :param seed: Seed of the entry IDs.
+    :return: The number of written URLs.
+    """
+    rng = random.Random(seed)
+    for lesson in range(1, lessons + 1):
+        lesson_directory = os.path.join(directory, f"Lesson {lesson}")
+        os.makedirs(lesson_directory, exist_ok=True)
+        urls = [
+            f"{base_url}{PARTNER_PATH}/playManifest/entryId/{_entry_id(rng)}/format/download/protocol/http/flavorParamIds/2"
+            for _ in range(files_per_lesson)
+        ]
+        with open(os.path.join(lesson_directory, 'Page.txt'), 'w', encoding='utf-8') as file:
+            file.write('\n'.join(urls) + '\n')
+    return lessons * files_per_lesson
+
+
+def generate_clip(path: str, seconds: float = 5.0, video: bool = True, pad_to: Optional[int] = None) -> str:
+    """
+    Generate a small MP4 clip with a tone and noise as audio track.
+
+    :param path: Path of the clip.
+    :param seconds: Duration of the clip.
+    :param video: Include a tiny test video stream.
+    :param pad_to: Pad the file with a trailing "free" atom to this size in bytes.
+    :return: The path of the clip.
+    """
+    inputs = ['-f', 'lavfi', '-i', f"sine=frequency=440:duration={seconds}",
+              '-f', 'lavfi', '-i', f"anoisesrc=amplitude=0.05:duration={seconds}"]
+    if video:
+        inputs += ['-f', 'lavfi', '-i', f"testsrc=size=160x120:rate=10:duration={seconds}"]
+    command = [
+        'ffmpeg', '-y', '-loglevel', 'error', *inputs,
+        '-filter_complex', '[0:a][1:a]amix=inputs=2[a]', '-map', '[a]', *(['-map', '2:v'] if video else []),
+        '-c:a', 'aac', '-b:a', '64k', *(['-c:v', 'mpeg4'] if video else []), '-movflags', '+faststart', path
+    ]
+    subprocess.run(command, check=True)
+    padding = (pad_to or 0) - os.path.getsize(path)
+    if padding >= 8:
+        with open(path, 'ab') as file:
+            file.write(struct.pack('>I', padding) + b'free' + bytes(padding - 8))
+    return path
+
+
+class SyntheticMediaServer:
+    """
+    Local HTTP server answering every GET with the same media payload.
+
+    Latency delays the response headers, bandwidth throttles every connection, and Range requests
+    (with If-Range against the ETag) can be switched off to mimic simple servers.
+    """
+
+    def __init__(self, payload: bytes, latency: float = 0.0, bandwidth: Optional[float] = None,
+                 range_support: bool = True):
+        self.payload = payload
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.range_support = range_support
+        self.etag = f'"{hashlib.md5(payload).hexdigest()}"'
+        self.content_md5 = base64.b64encode(hashlib.md5(payload).digest()).decode()
+        self.requests = 0
+        self._server: Optional[http.server.ThreadingHTTPServer] = None
+
+    def __enter__(self) -> "SyntheticMediaServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+    @property
+    def url(self) -> str:
+        """Base URL of the running server."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> None:
+        """Start serving on a free local port in a background thread."""
+        media_server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                media_server.requests += 1
+                if media_server.latency:
+                    time.sleep(media_server.latency)
+                payload = media_server.payload
+                start, end = 0, len(payload) - 1
+                match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+                if match and media_server.range_support \
+                        and self.headers.get('If-Range', media_server.etag) == media_server.etag:
+                    start = int(match.group(1))
+                    end = min(int(match.group(2) or end), end)
+                    if start > end:
+                        self.send_response(416)
+                        self.send_header('Content-Range', f"bytes */{len(payload)}")
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header('Content-Range', f"bytes {start}-{end}/{len(payload)}")
+                else:
+                    self.send_response(200)
+                    self.send_header('Content-MD5', media_server.content_md5)
+                self.send_header('Content-Type', 'video/mp4')
+                self.send_header('Content-Length', str(end - start + 1))
+                self.send_header('ETag', media_server.etag)
+                if media_server.range_support:
+                    self.send_header('Accept-Ranges', 'bytes')
+                self.end_headers()
+
+                began = time.monotonic()
+                sent = 0
+                for offset in range(start, end + 1, SERVER_CHUNK_SIZE):
+                    chunk = payload[offset:min(offset + SERVER_CHUNK_SIZE, end + 1)]
+                    try:
+                        self.wfile.write(chunk)
+                    except (BrokenPipeError, ConnectionResetError):
+                        return
+                    sent += len(chunk)
+                    if media_server.bandwidth:
+                        ahead = sent / media_server.bandwidth - (time.monotonic() - began)
+                        if ahead > 0:
+                            time.sleep(ahead)
+
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        """Stop the server."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def bench_extract(html_files: List[str], repeat: int = 3) -> Dict[str, Any]:
+    """
+    Benchmark extract_video_urls_from_file on the synthetic pages.
+
+    :param html_files: The pages to parse.
+    :param repeat: Number of passes over all pages.
+    :return: The benchmark result.
+    """
+    from extract_videos import extract_video_urls_from_file
+    logging.disable(logging.INFO)
+    durations = []
+    urls = 0
+    began = time.perf_counter()
+    for _ in range(repeat):
+        for html_file in html_files:
+            start = time.perf_counter()
+            urls += len(extract_video_urls_from_file(html_file))
+            durations.append(time.perf_counter() - start)
+    elapsed = time.perf_counter() - began
+    size = sum(map(os.path.getsize, html_files)) * repeat
+    return {
+        'items': len(durations), 'seconds': elapsed, 'items_per_second': len(durations) / elapsed,
+        'mib_per_second': size / 1024 ** 2 / elapsed, 'urls': urls, 'latency_ms': latency_summary(durations),
+    }
+
+
+def bench_download(links_directory: str, work_directory: str, urls: int, payload_size: int, stream: bool = False,
+                   audio_format: str = 'mp3', backend: str = 'threads') -> Dict[str, Any]:
+    """
+    Benchmark process_directory against the synthetic media server.
+
+    Per-asset latencies are taken from a job ledger written during the run.
+
+    :param links_directory: Directory with the link files.
+    :param work_directory: Scratch directory for downloads and the ledger.
+    :param urls: Number of URLs in the link files.
+    :param payload_size: Size of one served file in bytes.
+    :param stream: Stream the downloads into FFmpeg.
+    :param audio_format: Output format of the audio extraction.
+    :param backend: Download backend of process_directory.
+    :return: The benchmark result.
+    """
+    from download_videos import process_directory
+    from job_ledger import JobLedger
+    download_directory = os.path.join(work_directory, 'downloads')
+    shutil.rmtree(download_directory, ignore_errors=True)
+    ledger_path = os.path.join(work_directory, 'download-jobs.sqlite')
+    for path in (ledger_path, ledger_path + '-wal', ledger_path + '-shm'):
+        if os.path.exists(path):
+            os.remove(path)
+    ledger = JobLedger(ledger_path)
+
+    began = time.perf_counter()
+    process_directory(links_directory, download_directory, stream=stream, audio_format=audio_format,
+                      use_store=False, ledger=ledger, backend=backend)
+    elapsed = time.perf_counter() - began
+    jobs = ledger.jobs('download')
+    ledger.close()
+    durations = [job['duration'] for job in jobs if job['state'] == 'done' and job['duration'] is not None]
+    return {
+        'items': len(durations), 'failed': urls - len(durations), 'seconds': elapsed,
+        'items_per_second': len(durations) / elapsed,
+        'mib_per_second': len(durations) * payload_size / 1024 ** 2 / elapsed,
+        'latency_ms': latency_summary(durations),
+    }
+
+
+def bench_convert(clip: str, work_directory: str, repeat: int = 5) -> Dict[str, Any]:
+    """
+    Benchmark convert_to_mp3 on a clip (the copy made before every run is not timed).
+
+    :param clip: The MP4 clip.
+    :param work_directory: Scratch directory.
+    :param repeat: Number of conversions.
+    :return: The benchmark result.
+    """
+    from download_videos import convert_to_mp3
+    durations = []
+    for index in range(repeat):
+        video = shutil.copy(clip, os.path.join(work_directory, f"convert-{index}.mp4"))
+        start = time.perf_counter()
+        if convert_to_mp3(video) is None:
+            raise RuntimeError(f"conversion of {video} failed")
+        durations.append(time.perf_counter() - start)
+    return {
+        'items': repeat, 'seconds': sum(durations), 'items_per_second': repeat / sum(durations),
+        'latency_ms': latency_summary(durations),
+    }
+
+
+def bench_transcribe(clip: str, clip_seconds: float, repeat: int = 3, model_name: str = 'tiny') -> Dict[str, Any]:
+    """
+    Benchmark transcribe_mp4 with a small Whisper model.
+
+    :param clip: The audio or video clip.
+    :param clip_seconds: Duration of the clip, for the real-time factor.
+    :param repeat: Number of transcriptions.
+    :param model_name: Whisper model to use.
+    :return: The benchmark result, or the reason why it was skipped.
+    """
+    try:
+        from transcribe_videos import load_worker_model, transcribe_mp4
+    except ImportError as e:
+        return {'skipped': f"transcription dependencies missing: {e}"}
+    start = time.perf_counter()
+    model = load_worker_model(model_name)
+    model_load = time.perf_counter() - start
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        if not transcribe_mp4(clip, model=model):
+            raise RuntimeError(f"transcription of {clip} failed")
+        durations.append(time.perf_counter() - start)
+    return {
+        'items': repeat, 'seconds': sum(durations), 'items_per_second': repeat / sum(durations),
+        'model_load_seconds': model_load, 'real_time_factor': statistics.fmean(durations) / clip_seconds,
+        'latency_ms': latency_summary(durations),
+    }
+
+
+def _measured(function: Callable[..., Dict[str, Any]], *args: Any) -> Dict[str, Any]:
+    """Run a benchmark and add the peak RSS of the process it runs in."""
+    result = function(*args)
+    result['peak_rss_mib'] = peak_rss_mb()
+    return result
+
+
+def run_isolated(function: Callable[..., Dict[str, Any]], *args: Any) -> Dict[str, Any]:
+    """
+    Run a benchmark in a fresh process so that its peak RSS is not mixed with other benchmarks.
+
+    :param function: The benchmark function.
+    :return: The benchmark result, or the error that made it fail.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        try:
+            return executor.submit(_measured, function, *args).result()
+        except Exception as e:
+            logging.error(f"Benchmark {function.__name__} failed: {e}")
+            return {'error': f"{type(e).__name__}: {e}"}
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """
+    Compare benchmark results with a baseline run.
+
+    :param results: The current results.
+    :param baseline: The results of the baseline run.
+    :param tolerance: Relative deterioration tolerated before a metric counts as regression.
+    :return: Descriptions of the regressions.
+    """
+    regressions = []
+    for name, result in results['benchmarks'].items():
+        before = baseline.get('benchmarks', {}).get(name, {})
+        if 'items_per_second' in result and before.get('items_per_second'):
+            change = result['items_per_second'] / before['items_per_second'] - 1
+            if change < -tolerance:
+                regressions.append(f"{name}: throughput {change:+.0%}")
+        p50, previous_p50 = result.get('latency_ms', {}).get('p50'), before.get('latency_ms', {}).get('p50')
+        if p50 and previous_p50 and p50 / previous_p50 - 1 > tolerance:
+            regressions.append(f"{name}: p50 latency {p50 / previous_p50 - 1:+.0%}")
+    return regressions
+
+
+def main() -> None:
+    """
+    Command line interface running the benchmarks and writing their results as JSON.
+    """
+    parser = argparse.ArgumentParser(description="Run the offline benchmarks.")
+    parser.add_argument('benchmarks', nargs='*', default=list(BENCHMARKS),
+                        help=f"Benchmarks to run, any of {', '.join(BENCHMARKS)} (default: all).")
+    parser.add_argument('--output', help="Write the results to this JSON file instead of stdout.")
+    parser.add_argument('--work-dir', help="Scratch directory (default: a temporary directory).")
+    parser.add_argument('--baseline', help="Results of an earlier run to compare with.")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help="Tolerated deterioration.")
+    parser.add_argument('--repeat', type=int, default=3, help="Repetitions of the extract/convert/transcribe runs.")
+    parser.add_argument('--lessons', type=int, default=3, help="Lessons of the synthetic course.")
+    parser.add_argument('--pages', type=int, default=6, help="Pages per lesson.")
+    parser.add_argument('--entries', type=int, default=8, help="Kaltura entries per page.")
+    parser.add_argument('--page-kb', type=int, default=200, help="Approximate page size in KiB.")
+    parser.add_argument('--videos', type=int, default=4, help="Videos per lesson in the download benchmark.")
+    parser.add_argument('--clip-seconds', type=float, default=10.0, help="Duration of the generated clips.")
+    parser.add_argument('--media-size', type=int, default=2 * 1024 ** 2, help="Size of the served media in bytes.")
+    parser.add_argument('--latency-ms', type=float, default=20.0, help="Response latency of the media server.")
+    parser.add_argument('--bandwidth', type=float, default=None, help="Bandwidth per connection in bytes/s.")
+    parser.add_argument('--no-range', action='store_true', help="Ignore Range requests like a simple server.")
+    parser.add_argument('--stream', action='store_true', help="Stream downloads into FFmpeg.")
+    parser.add_argument('--audio-format', default='mp3', help="Audio format of the download benchmark.")
+    parser.add_argument('--download-backend', default='threads', help="Backend of process_directory.")
+    parser.add_argument('--model', default='tiny', help="Whisper model of the transcription benchmark.")
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    work_directory = args.work_dir or tempfile.mkdtemp(prefix='benchmark-')
+    os.makedirs(work_directory, exist_ok=True)
+    # Clips need FFmpeg; only generate those the selected benchmarks use
+    clip = None
+    if {'convert', 'transcribe'} & set(args.benchmarks):
+        clip = generate_clip(os.path.join(work_directory, 'clip.mp4'), args.clip_seconds)
+    payload = b''  # The extract benchmark only needs the server's URL
+    if 'download' in args.benchmarks:
+        media = generate_clip(os.path.join(work_directory, 'media.mp4'), args.clip_seconds, pad_to=args.media_size)
+        with open(media, 'rb') as file:
+            payload = file.read()
+
+    results: Dict[str, Any] = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'arguments': vars(args),
+        'benchmarks': {},
+    }
+    with SyntheticMediaServer(payload, args.latency_ms / 1000, args.bandwidth, not args.no_range) as server:
+        if 'extract' in args.benchmarks:
+            course_directory = os.path.join(work_directory, 'course')
+            shutil.rmtree(course_directory, ignore_errors=True)
+            html_files = generate_course(course_directory, server.url, args.lessons, args.pages, args.entries,
+                                         args.page_kb)
+            results['benchmarks']['extract'] = run_isolated(bench_extract, html_files, args.repeat)
+        if 'download' in args.benchmarks:
+            links_directory = os.path.join(work_directory, 'links')
+            shutil.rmtree(links_directory, ignore_errors=True)
+            urls = generate_links(links_directory, server.url, args.lessons, args.videos)
+            results['benchmarks']['download'] = run_isolated(
+                bench_download, links_directory, work_directory, urls, len(payload), args.stream, args.audio_format,
+                args.download_backend
+            )
+        if 'convert' in args.benchmarks:
+            results['benchmarks']['convert'] = run_isolated(bench_convert, clip, work_directory, args.repeat)
+        if 'transcribe' in args.benchmarks:
+            results['benchmarks']['transcribe'] = run_isolated(bench_transcribe, clip, args.clip_seconds,
+                                                               args.repeat, args.model)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+    if not args.work_dir:
+        shutil.rmtree(work_directory, ignore_errors=True)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            logging.error(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
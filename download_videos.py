@@ -1,104 +1,748 @@
 import os
+import re
+import json
+import time
+import random
+import asyncio
+import base64
+import binascii
+import hashlib
+import threading
 import requests
 import logging
+from email.utils import parsedate_to_datetime
+from contextlib import contextmanager, nullcontext
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
 from concurrent.futures import ThreadPoolExecutor, as_completed
-import dask
-from dask import delayed, compute
+from functools import partial
+from collections import defaultdict
 import subprocess
 
+import metrics
+from job_ledger import JobLedger
+from media_store import MEDIA_STORE_DIRECTORY, MediaStore, kaltura_entry_id, media_key
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-MAX_WORKERS = 100  # Maximale Anzahl der Threads für parallele Downloads
+MAX_WORKERS = 16  # Maximale Anzahl gleichzeitiger Downloads und Konvertierungen (global)
+MAX_PER_HOST = 6  # Maximale Anzahl gleichzeitiger Verbindungen zu einem Host
+CHUNK_SIZE = 1024 * 1024  # Bytes pro Schreibvorgang beim Herunterladen
+REQUEST_TIMEOUT = (10, 60)  # Verbindungs- und Lese-Timeout in Sekunden
+PART_SUFFIX = '.part'  # Endung unvollständiger Dateien
+FFMPEG_BENCHMARK = re.compile(rb'bench: utime=([\d.]+)s stime=([\d.]+)s rtime=([\d.]+)s')  # Ausgabe von -benchmark
+
+# Wiederholungen und adaptive Parallelität
+MAX_RETRIES = 5  # Wiederholungen eines Downloads bei vorübergehenden Fehlern
+BACKOFF_BASE = 1.0  # Sekunden; die Wartezeit verdoppelt sich je Versuch (mit zufälliger Streuung)
+MAX_BACKOFF = 60.0  # Obergrenze der Wartezeit in Sekunden, auch für Retry-After
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+THROTTLE_STATUS_CODES = {429, 503}  # Der Server signalisiert Überlastung oder Drosselung
+ADAPT_INTERVAL = 2.0  # Sekunden pro Messfenster der adaptiven Parallelität
+MAX_ERROR_RATE = 0.2  # Anteil fehlgeschlagener Versuche pro Fenster, ab dem die Parallelität halbiert wird
+
+# Ausgabeformate der Audio-Extraktion. "m4a" kopiert die vorhandene AAC-Spur ohne Neukodierung und kodiert nur
+# neu, wenn das nicht möglich ist; "wav" und "flac" liefern 16 kHz Mono, wie es Whisper direkt verarbeitet.
+AUDIO_FORMATS = {
+    'mp3': {'extension': '.mp3', 'args': ['-q:a', '0', '-f', 'mp3']},
+    'm4a': {
+        'extension': '.m4a',
+        'args': ['-c:a', 'copy', '-f', 'ipod'],
+        'fallback': ['-c:a', 'aac', '-b:a', '128k', '-f', 'ipod'],
+    },
+    'wav': {'extension': '.wav', 'args': ['-ac', '1', '-ar', '16000', '-c:a', 'pcm_s16le', '-f', 'wav']},
+    'flac': {'extension': '.flac', 'args': ['-ac', '1', '-ar', '16000', '-c:a', 'flac', '-f', 'flac']},
+}
+DEFAULT_AUDIO_FORMAT = 'mp3'
+DOWNLOAD_BACKENDS = ('threads', 'asyncio')  # "asyncio" erfordert aiohttp (siehe async_download.py)
+
 
+class DownloadVerificationError(Exception):
+    """Raised when a finished download does not match the size or Content-MD5 announced by the server."""
 
-def download_video(url, audio_download_path, counter):
-    """Download a video from the given URL."""
+
+def video_filepath_for(url, audio_download_path, counter):
+    """Return the local path of the video downloaded from the given URL."""
+    filename = kaltura_entry_id(url) or os.path.basename(url)  # playManifest URLs end in a flavor ID
+    if not filename.endswith('.mp4'):
+        filename += '.mp4'
+    filename = f"{counter}_{filename}"  # Make filename unique by adding a counter
+    return os.path.join(audio_download_path, filename)
+
+
+def _read_part_meta(part_filepath):
+    """Read the validators stored next to a partial download."""
     try:
-        response = requests.get(url, stream=True)
-        filename = os.path.basename(url)
-        if not filename.endswith('.mp4'):
-            filename += '.mp4'
-        filename = f"{counter}_{filename}"  # Make filename unique by adding a counter
-        video_filepath = os.path.join(audio_download_path, filename)
-
-        with open(video_filepath, 'wb') as file:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    file.write(chunk)
+        with open(part_filepath + '.json', 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_part_meta(part_filepath, meta):
+    """Store the validators of a partial download so it can be resumed safely."""
+    with open(part_filepath + '.json', 'w') as file:
+        json.dump(meta, file)
+
+
+def _remove_part(part_filepath):
+    """Remove a partial download and its validators."""
+    for path in (part_filepath, part_filepath + '.json'):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _total_length(response, offset):
+    """Return the full size of the resource from Content-Range or Content-Length, if known."""
+    content_range = response.headers.get('Content-Range', '')
+    match = re.match(r'bytes \d+-\d+/(\d+)', content_range)
+    if match:
+        return int(match.group(1))
+    content_length = response.headers.get('Content-Length')
+    return offset + int(content_length) if content_length is not None else None
+
+
+def _content_md5(response):
+    """Return the MD5 announced in the Content-MD5 header of a response as hex digest, or None."""
+    value = response.headers.get('Content-MD5')
+    try:
+        digest = base64.b64decode(value, validate=True) if value else b''
+    except (binascii.Error, ValueError):
+        return None
+    return digest.hex() if len(digest) == 16 else None
+
+
+def _verify_download(filepath, meta):
+    """
+    Check a finished download against the Content-Length and, if the server sent one, the Content-MD5.
+
+    ETags are not taken for MD5 digests: many CDNs use 32 hex digits that are not the content hash.
+    """
+    expected_length = meta.get('length')
+    size = os.path.getsize(filepath)
+    if expected_length is not None and size != expected_length:
+        raise DownloadVerificationError(f"expected {expected_length} bytes, got {size}")
+
+    if meta.get('md5'):
+        digest = hashlib.md5()
+        with open(filepath, 'rb') as file:
+            while chunk := file.read(CHUNK_SIZE):
+                digest.update(chunk)
+        if digest.hexdigest() != meta['md5']:
+            raise DownloadVerificationError(f"MD5 {digest.hexdigest()} does not match Content-MD5 {meta['md5']}")
+
+
+def _retry_after(response):
+    """Return the delay requested by a Retry-After header in seconds, or None."""
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(error):
+    """
+    Return (HTTP status, Retry-After delay, network failure) of an error raised by a requests transfer.
+
+    The status and delay are None for errors without a response; network failure is True for
+    connection errors, timeouts and broken transfers.
+    """
+    if isinstance(error, requests.HTTPError):
+        response = error.response
+        return (response.status_code if response is not None else None), _retry_after(response), False
+    return None, None, isinstance(error, (requests.ConnectionError, requests.Timeout,
+                                          requests.exceptions.ChunkedEncodingError))
+
+
+def _retry_delay(error, attempt, classify=classify_error):
+    """Return the seconds to wait before retrying after the given error, or None if it is not transient."""
+    status, retry_after, network = classify(error)
+    if status is not None:
+        if status not in RETRY_STATUS_CODES:
+            return None
+        if retry_after is not None:
+            return min(retry_after, MAX_BACKOFF)
+    elif not network and not isinstance(error, DownloadVerificationError):
+        return None
+    return random.uniform(0, min(MAX_BACKOFF, BACKOFF_BASE * 2 ** attempt))  # Full jitter
+
+
+def next_retry(error, attempt, max_retries=MAX_RETRIES, monitor=None, classify=classify_error):
+    """
+    Account a failed transfer attempt and return the seconds to wait before the next one, or None to give up.
+
+    Only failures that tell something about the host (network errors, 429 and 5xx responses) are
+    reported to the monitor; local errors such as a failing FFmpeg or a full disk are not.
+    """
+    status, _, network = classify(error)
+    if monitor is not None and (network or status == 429 or (status or 0) >= 500):
+        monitor.record_error(status in THROTTLE_STATUS_CODES)
+    delay = _retry_delay(error, attempt, classify)
+    if delay is None or attempt == max_retries:
+        return None
+    logging.warning(f"Attempt {attempt + 1} failed ({error}), retrying in {delay:.1f}s.")
+    return delay
+
+
+def with_retries(function, *args, monitor=None, slot=None, max_retries=MAX_RETRIES, **kwargs):
+    """
+    Call a transfer function, retrying transient network and server errors with jittered exponential backoff.
+
+    Retry-After headers of 429/503 responses are honored. The monitor (e.g. an AdaptiveLimiter) is passed
+    on to the function to account transferred bytes, and failed attempts are reported to it (see next_retry).
+    With slot, a context manager factory such as DownloadEngine.host_slot, every attempt holds a slot that
+    yields the monitor; the slot is released while waiting for the next attempt.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            with slot() if slot is not None else nullcontext(monitor) as monitor:
+                return function(*args, monitor=monitor, **kwargs)
+        except Exception as e:
+            delay = next_retry(e, attempt, max_retries, monitor)
+            if delay is None:
+                raise
+            time.sleep(delay)
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit that adapts to the measured throughput and error rate (AIMD).
+
+    The limit grows by one per measuring window while the aggregate throughput keeps improving and
+    workers are waiting for a slot. It shrinks by one if an added transfer made the throughput drop,
+    and is halved as soon as the server throttles (429/503) or too many attempts fail.
+    """
+
+    def __init__(self, initial=MAX_PER_HOST, minimum=1, maximum=MAX_WORKERS, name=''):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = max(minimum, min(initial, maximum))
+        self.name = name
+        self.in_flight = 0
+        self._waiting = 0
+        self._condition = threading.Condition()
+        self._window_start = time.monotonic()
+        self._bytes = 0
+        self._finished = 0
+        self._errors = 0
+        self._last_throughput = 0.0
+        self._last_decrease = float('-inf')
+
+    @contextmanager
+    def slot(self):
+        """Hold one of the currently allowed slots."""
+        with self._condition:
+            self._waiting += 1
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self._waiting -= 1
+            self.in_flight += 1
+            metrics.gauge('download_in_flight', self.in_flight, host=self.name)
+        try:
+            yield self
+        finally:
+            with self._condition:
+                self.in_flight -= 1
+                metrics.gauge('download_in_flight', self.in_flight, host=self.name)
+                self._finished += 1
+                self._adapt()
+                self._condition.notify_all()
+
+    def record_bytes(self, count):
+        """Account transferred bytes to the current measuring window."""
+        with self._condition:
+            self._bytes += count
+            self._adapt()
+
+    def record_error(self, throttled=False):
+        """Account a failed attempt; throttling responses halve the limit immediately (once per window)."""
+        with self._condition:
+            self._errors += 1
+            if throttled and time.monotonic() - self._last_decrease >= ADAPT_INTERVAL:
+                self._set_limit(self.limit // 2, "throttled by the server")
+                self._start_window(0.0)
+
+    def _set_limit(self, limit, reason):
+        limit = max(self.minimum, min(limit, self.maximum))
+        if limit < self.limit:
+            self._last_decrease = time.monotonic()
+        if limit != self.limit:
+            logging.info(f"Concurrency for {self.name or 'downloads'}: {self.limit} -> {limit} ({reason}).")
+            self.limit = limit
+            metrics.gauge('download_concurrency_limit', limit, host=self.name)
+            self._condition.notify_all()
+
+    def _start_window(self, throughput):
+        self._window_start = time.monotonic()
+        self._bytes = self._finished = self._errors = 0
+        self._last_throughput = throughput
+
+    def _adapt(self):
+        elapsed = time.monotonic() - self._window_start
+        if elapsed < ADAPT_INTERVAL:
+            return
+        throughput = self._bytes / elapsed
+        attempts = self._finished + self._errors
+        if attempts and self._errors / attempts > MAX_ERROR_RATE:
+            self._set_limit(self.limit // 2, f"{self._errors} of {attempts} attempts failed")
+        elif self._waiting and throughput > self._last_throughput * 1.05:
+            self._set_limit(self.limit + 1, f"{throughput / 1024 ** 2:.1f} MiB/s")
+        elif throughput < self._last_throughput * 0.9:
+            self._set_limit(self.limit - 1, f"throughput dropped to {throughput / 1024 ** 2:.1f} MiB/s")
+        self._start_window(throughput)
+
+
+class DownloadEngine:
+    """
+    Shared download engine: one worker pool, pooled keep-alive sessions and a per-host connection limit.
+
+    With adaptive=True the per-host limit starts at max_per_host and is tuned between 1 and
+    max_workers by an AdaptiveLimiter; otherwise it is fixed.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, max_per_host=MAX_PER_HOST, adaptive=True):
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.adaptive = adaptive
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._local = threading.local()
+        self._host_slots = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Wait for all submitted work and shut the worker pool down."""
+        self.executor.shutdown(wait=True)
+
+    def submit(self, fn, *args, **kwargs):
+        """Run a function on the shared worker pool."""
+        return self.executor.submit(fn, *args, **kwargs)
+
+    @property
+    def session(self):
+        """Return the keep-alive session of the current worker thread."""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.max_per_host)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._local.session = session
+        return session
 
+    @contextmanager
+    def host_slot(self, url):
+        """Hold one of the connection slots of the URL's host; yields the host's limiter if adaptive."""
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = (
+                    AdaptiveLimiter(self.max_per_host, maximum=self.max_workers, name=host) if self.adaptive
+                    else threading.BoundedSemaphore(self.max_per_host)
+                )
+            slots = self._host_slots[host]
+        if self.adaptive:
+            with slots.slot() as limiter:
+                yield limiter
+        else:
+            with slots:
+                yield None
+
+    def download(self, url, audio_download_path, counter, chunk_size=CHUNK_SIZE):
+        """Download a video through the pooled session while respecting the per-host limit."""
+        return download_video(url, audio_download_path, counter, chunk_size, session=self.session,
+                              slot=partial(self.host_slot, url))
+
+    def stream(self, url, audio_download_path, counter, audio_format=DEFAULT_AUDIO_FORMAT, chunk_size=CHUNK_SIZE):
+        """Stream a video into FFmpeg through the pooled session while respecting the per-host limit."""
+        return with_retries(stream_to_audio, url, audio_download_path, counter, audio_format, chunk_size,
+                            session=self.session, slot=partial(self.host_slot, url))
+
+
+def download_video(url, audio_download_path, counter, chunk_size=CHUNK_SIZE, session=None, monitor=None, slot=None):
+    """
+    Download a video from the given URL, resuming an interrupted download with a Range request.
+
+    Transient failures are retried with backoff, each attempt continuing where the previous one stopped.
+    A slot (see with_retries) is only held during the attempts, not while waiting between them.
+    """
+    video_filepath = video_filepath_for(url, audio_download_path, counter)
+    if os.path.exists(video_filepath):
+        logging.info(f"Already downloaded: {video_filepath}")
         return video_filepath
+
+    try:
+        return with_retries(_download_attempt, url, video_filepath, chunk_size, session, monitor=monitor, slot=slot)
     except Exception as e:
         logging.error(f"Failed to download {url}: {e}")
         return None
 
 
+def _download_attempt(url, video_filepath, chunk_size, session, monitor=None):
+    """Run a single (possibly resumed) download attempt, raising on any failure."""
+    part_filepath = video_filepath + PART_SUFFIX
+    meta = _read_part_meta(part_filepath)
+    offset = os.path.getsize(part_filepath) if meta and os.path.exists(part_filepath) else 0
+    headers = {}
+    if offset:
+        headers['Range'] = f'bytes={offset}-'
+        validator = meta.get('etag') or meta.get('last_modified')
+        if validator:
+            headers['If-Range'] = validator  # Server sends the full file if it changed meanwhile
+
+    http = session or requests
+    with metrics.span('download', url, offset=offset) as span, \
+            http.get(url, stream=True, headers=headers, timeout=REQUEST_TIMEOUT) as response:
+        if response.status_code == 416 and offset:
+            logging.info(f"Partial download of {url} is already complete.")
+        else:
+            response.raise_for_status()
+            if response.status_code != 206:
+                offset = 0
+                meta = {
+                    'url': url,
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'length': _total_length(response, 0),
+                    'md5': _content_md5(response),
+                }
+                _write_part_meta(part_filepath, meta)
+            else:
+                logging.info(f"Resuming {url} at byte {offset}.")
+
+            with open(part_filepath, 'ab' if offset else 'wb') as file:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if chunk:
+                        file.write(chunk)
+                        span.add('bytes', len(chunk))
+                        if monitor is not None:
+                            monitor.record_bytes(len(chunk))
+
+    try:
+        _verify_download(part_filepath, meta)
+    except DownloadVerificationError:
+        _remove_part(part_filepath)  # Start from scratch next time
+        raise
+    os.replace(part_filepath, video_filepath)
+    _remove_part(part_filepath)
+    return video_filepath
+
+
+def audio_filepath_for(video_filepath, audio_format=DEFAULT_AUDIO_FORMAT):
+    """Return the path of the audio file produced from the given video file."""
+    return os.path.splitext(video_filepath)[0] + AUDIO_FORMATS[audio_format]['extension']
+
+
+def _ffmpeg_command(input_path, output_path, audio_args):
+    """Build the FFmpeg command writing only the first audio stream of the input (reporting its CPU time)."""
+    return ['ffmpeg', '-benchmark', '-y', '-i', input_path, '-vn', '-sn', '-dn', '-map', '0:a:0', *audio_args,
+            output_path]
+
+
+def ffmpeg_times(stderr):
+    """Return the user, system and wall time FFmpeg reported with -benchmark as span attributes."""
+    match = FFMPEG_BENCHMARK.search(stderr or b'')
+    if not match:
+        return {}
+    user, system, wall = (float(value) for value in match.groups())
+    return {'cpu_seconds': user + system, 'user_seconds': user, 'system_seconds': system, 'ffmpeg_seconds': wall}
+
+
+def ffmpeg_error(stderr):
+    """Return the last line of FFmpeg's error output, ignoring the -benchmark report."""
+    lines = [line for line in stderr.decode(errors='replace').strip().splitlines() if not line.startswith('bench:')]
+    return lines[-1] if lines else ''
+
+
+def convert_audio(video_filepath, audio_format=DEFAULT_AUDIO_FORMAT):
+    """Extract the audio of a video file into the given output format using FFmpeg."""
+    audio_filepath = audio_filepath_for(video_filepath, audio_format)
+    part_filepath = audio_filepath + PART_SUFFIX
+    output = AUDIO_FORMATS[audio_format]
+    attempts = [output['args']] + ([output['fallback']] if output.get('fallback') else [])
+    for attempt, audio_args in enumerate(attempts, 1):
+        try:
+            with metrics.span('ffmpeg', video_filepath, audio_format=audio_format, attempt=attempt) as span:
+                result = subprocess.run(
+                    _ffmpeg_command(video_filepath, part_filepath, audio_args),
+                    check=True,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE
+                )
+                span.set(**ffmpeg_times(result.stderr))
+            os.replace(part_filepath, audio_filepath)  # Only complete conversions get the final name
+            os.remove(video_filepath)  # Remove the video file after conversion
+            return audio_filepath
+        except subprocess.CalledProcessError as e:
+            if os.path.exists(part_filepath):
+                os.remove(part_filepath)
+            if attempt < len(attempts):
+                logging.info(f"Stream copy of {video_filepath} not possible, re-encoding the audio instead.")
+            else:
+                logging.error(f"Failed to convert {video_filepath} to {audio_format}: {e}")
+    return None
+
+
 def convert_to_mp3(video_filepath):
     """Convert a video file to MP3 using FFmpeg."""
+    return convert_audio(video_filepath, 'mp3')
+
+
+def stream_to_audio(url, audio_download_path, counter, audio_format=DEFAULT_AUDIO_FORMAT, chunk_size=CHUNK_SIZE,
+                    session=None, monitor=None):
+    """
+    Pipe the HTTP response body straight into FFmpeg so that only the audio file is written to disk.
+
+    Raises requests exceptions for network failures and CalledProcessError if FFmpeg fails, e.g. for
+    MP4 files whose index (moov atom) sits at the end and therefore cannot be read from a pipe, or
+    when the audio track cannot be stream-copied into the requested format.
+    """
+    audio_filepath = audio_filepath_for(video_filepath_for(url, audio_download_path, counter), audio_format)
+    part_filepath = audio_filepath + PART_SUFFIX
+    process = None
     try:
-        mp3_filepath = video_filepath.replace('.mp4', '.mp3')
-        subprocess.run(
-            ['ffmpeg', '-i', video_filepath, '-q:a', '0', '-map', 'a', mp3_filepath],
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-        os.remove(video_filepath)  # Remove the video file after conversion
-        return mp3_filepath
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Failed to convert {video_filepath} to MP3: {e}")
-        return None
+        http = session or requests
+        with metrics.span('stream', url, audio_format=audio_format) as span, \
+                http.get(url, stream=True, timeout=REQUEST_TIMEOUT) as response:
+            response.raise_for_status()
+            process = subprocess.Popen(
+                _ffmpeg_command('pipe:0', part_filepath, AUDIO_FORMATS[audio_format]['args']),
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE
+            )
+            stderr = []
+            stderr_reader = threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True)
+            stderr_reader.start()
+            try:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if chunk:
+                        process.stdin.write(chunk)
+                        span.add('bytes', len(chunk))
+                        if monitor is not None:
+                            monitor.record_bytes(len(chunk))
+            except BrokenPipeError:
+                pass  # FFmpeg stopped reading; its exit code tells why
+            except BaseException:
+                process.kill()  # Never let FFmpeg finalize a truncated input
+                raise
+            finally:
+                try:
+                    process.stdin.close()
+                except BrokenPipeError:
+                    pass
+
+            returncode = process.wait()
+            stderr_reader.join()
+            span.set(**ffmpeg_times(b''.join(stderr)))
+            if returncode != 0:
+                raise subprocess.CalledProcessError(returncode, 'ffmpeg', stderr=b''.join(stderr))
+        os.replace(part_filepath, audio_filepath)
+        return audio_filepath
+    finally:
+        if process is not None and process.poll() is None:
+            process.kill()
+            process.wait()
+        if os.path.exists(part_filepath):
+            os.remove(part_filepath)
+
 
+def download_and_convert(url, audio_download_path, counter, engine=None, stream=False,
+                         audio_format=DEFAULT_AUDIO_FORMAT):
+    """
+    Download a video and extract its audio, skipping videos that were already converted.
 
-def download_and_convert(url, audio_download_path, counter):
-    """Download a video and convert it to MP3."""
-    video_filepath = download_video(url, audio_download_path, counter)
+    In streaming mode the video is piped into FFmpeg without touching the disk; if FFmpeg cannot
+    read the stream, the video is downloaded to disk and converted from there instead.
+    """
+    audio_filepath = audio_filepath_for(video_filepath_for(url, audio_download_path, counter), audio_format)
+    if os.path.exists(audio_filepath):
+        logging.info(f"Already converted: {audio_filepath}")
+        return audio_filepath
+
+    if stream:
+        try:
+            if engine is not None:
+                return engine.stream(url, audio_download_path, counter, audio_format)
+            return with_retries(stream_to_audio, url, audio_download_path, counter, audio_format)
+        except subprocess.CalledProcessError as e:
+            message = ffmpeg_error(e.stderr) if e.stderr else e
+            logging.warning(f"Streaming conversion of {url} failed ({message}), downloading it instead.")
+        except Exception as e:
+            logging.error(f"Failed to stream {url}: {e}")
+            return None
+
+    if engine is not None:
+        video_filepath = engine.download(url, audio_download_path, counter)
+    else:
+        video_filepath = download_video(url, audio_download_path, counter)
     if video_filepath:
-        return convert_to_mp3(video_filepath)
+        return convert_audio(video_filepath, audio_format)
     return None
 
 
-def process_video_urls_file(video_urls_file, audio_download_path):
-    """Process a single video URLs file."""
+def read_video_urls(video_urls_file):
+    """Read the URLs of a video URLs file, one per line."""
     with open(video_urls_file, 'r') as file:
-        video_urls = [line.strip() for line in file.readlines()]
+        return [line.strip() for line in file if line.strip()]
 
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = [
-            executor.submit(download_and_convert, url, audio_download_path, counter)
-            for counter, url in enumerate(video_urls, 1)
-        ]
 
-        results = []
-        for future in tqdm(as_completed(futures), total=len(futures), desc="Downloading and converting videos"):
-            results.append(future.result())
+def submit_video_urls_file(engine, video_urls_file, audio_download_path, stream=False,
+                           audio_format=DEFAULT_AUDIO_FORMAT, ledger=None):
+    """Submit all videos of a video URLs file to the download engine, skipping jobs the ledger marks as done."""
+    futures = []
+    for counter, url in enumerate(read_video_urls(video_urls_file), 1):
+        args = (url, audio_download_path, counter, engine, stream, audio_format)
+        if ledger is None:
+            futures.append(engine.submit(download_and_convert, *args))
+        else:
+            asset = audio_filepath_for(video_filepath_for(url, audio_download_path, counter), audio_format)
+            futures.append(engine.submit(ledger.run, 'download', asset, download_and_convert, *args))
+    return futures
+
+
+def fetch_into_store(store, key, url, engine=None, stream=False, audio_format=DEFAULT_AUDIO_FORMAT):
+    """Download and convert a media asset into the shared store unless it is already there."""
+    object_path = store.lookup(key, audio_format)
+    if object_path:
+        return object_path
+    staged_filepath = download_and_convert(
+        url, store.staging_directory, store.staging_counter(key), engine, stream, audio_format
+    )
+    return store.add(key, audio_format, staged_filepath) if staged_filepath else None
+
+
+def fetch_and_link(store, key, occurrences, engine=None, stream=False, audio_format=DEFAULT_AUDIO_FORMAT,
+                   ledger=None):
+    """Fetch a media asset once and link it into every lesson directory that references it."""
+    args = (store, key, occurrences[0][0], engine, stream, audio_format)
+    if ledger is None:
+        object_path = fetch_into_store(*args)
+    else:
+        object_path = ledger.run('download', f"{key}:{audio_format}", fetch_into_store, *args)
+    if object_path:
+        for url, audio_download_path, counter in occurrences:
+            target_path = audio_filepath_for(video_filepath_for(url, audio_download_path, counter), audio_format)
+            store.link(object_path, target_path)
+    return object_path
+
 
-    for result in results:
+def wait_for_downloads(futures, desc="Downloading and converting videos"):
+    """Wait for submitted downloads and log their results."""
+    failed = 0
+    for future in tqdm(as_completed(futures), total=len(futures), desc=desc):
+        try:
+            result = future.result()
+        except Exception as e:
+            logging.error(f"Unexpected error while processing a video: {e}")
+            result = None
         if result:
             logging.info(f"Successfully processed: {result}")
         else:
-            logging.error(f"Failed to process some videos.")
+            failed += 1
+    if failed:
+        logging.error(f"Failed to process {failed} of {len(futures)} videos.")
 
 
-def process_directory(source_directory, download_directory):
-    """Process each directory to download videos and convert them."""
-    tasks = []
+def process_video_urls_file(video_urls_file, audio_download_path, engine=None, stream=False,
+                            audio_format=DEFAULT_AUDIO_FORMAT, ledger=None):
+    """Process a single video URLs file."""
+    if engine is None:
+        with DownloadEngine() as engine:
+            wait_for_downloads(
+                submit_video_urls_file(engine, video_urls_file, audio_download_path, stream, audio_format, ledger)
+            )
+    else:
+        wait_for_downloads(
+            submit_video_urls_file(engine, video_urls_file, audio_download_path, stream, audio_format, ledger)
+        )
+
+
+def collect_video_urls_files(source_directory, download_directory):
+    """
+    Return (video URLs file, lesson download directory) pairs, creating the download directories.
+
+    Every link file gets its own directory named after the page, e.g. links/<chapter>/5 Statistik.txt
+    downloads into <download directory>/<chapter>/5 Statistik, so the lesson of a file stays recognizable.
+    """
+    jobs = []
     for root, _, files in os.walk(source_directory):
         for file in files:
             if file.endswith('.txt'):
                 video_urls_file = os.path.join(root, file)
-                relative_path = os.path.relpath(root, source_directory)
+                relative_path = os.path.relpath(os.path.splitext(video_urls_file)[0], source_directory)
                 audio_download_path = os.path.join(download_directory, relative_path)
 
                 if not os.path.exists(audio_download_path):
                     os.makedirs(audio_download_path)
 
-                tasks.append(delayed(process_video_urls_file)(video_urls_file, audio_download_path))
+                jobs.append((video_urls_file, audio_download_path))
+    return jobs
+
+
+def group_by_media(jobs):
+    """Group the links of all video URLs files by media key into (url, download directory, counter) lists."""
+    occurrences = defaultdict(list)
+    for video_urls_file, audio_download_path in jobs:
+        for counter, url in enumerate(read_video_urls(video_urls_file), 1):
+            occurrences[media_key(url)].append((url, audio_download_path, counter))
+    logging.info(f"{sum(map(len, occurrences.values()))} links reference {len(occurrences)} unique media.")
+    return occurrences
 
-    with tqdm(total=len(tasks), desc="Processing directories") as pbar:
-        results = compute(*tasks, scheduler='threads')
-        for _ in results:
-            pbar.update(1)
+
+def process_directory(source_directory, download_directory, max_workers=None, max_per_host=MAX_PER_HOST,
+                      stream=False, audio_format=DEFAULT_AUDIO_FORMAT, use_store=True, ledger=None, adaptive=True,
+                      backend='threads'):
+    """
+    Process each directory to download videos and convert them on one shared download engine.
+
+    With the media store, every unique asset (by normalized URL / Kaltura entry) is fetched and
+    converted exactly once and linked into all lesson directories that reference it. With a job
+    ledger, assets finished by an earlier (possibly crashed) run are not fetched again. With
+    adaptive=True, the number of parallel transfers per host is tuned to the measured throughput.
+    backend='asyncio' runs all transfers on one event loop instead (max_workers then bounds the
+    number of concurrent transfers, not threads). Without max_workers, the threads backend uses
+    MAX_WORKERS threads and the asyncio backend up to async_download.MAX_CONCURRENCY transfers.
+    """
+    if backend not in DOWNLOAD_BACKENDS:
+        raise ValueError(f"Unknown download backend '{backend}', expected one of {DOWNLOAD_BACKENDS}.")
+    if backend == 'asyncio':
+        from async_download import MAX_CONCURRENCY, process_directory_async
+        asyncio.run(process_directory_async(source_directory, download_directory, max_workers or MAX_CONCURRENCY,
+                                            max_per_host, stream, audio_format, use_store, ledger))
+        return
+
+    max_workers = max_workers or MAX_WORKERS
+    jobs = collect_video_urls_files(source_directory, download_directory)
+    with DownloadEngine(max_workers, max_per_host, adaptive) as engine:
+        if not use_store:
+            futures = [
+                future
+                for video_urls_file, audio_download_path in jobs
+                for future in submit_video_urls_file(engine, video_urls_file, audio_download_path, stream,
+                                                     audio_format, ledger)
+            ]
+            wait_for_downloads(futures)
+            return
+
+        store = MediaStore(os.path.join(download_directory, MEDIA_STORE_DIRECTORY))
+        occurrences = group_by_media(jobs)
+        futures = [
+            engine.submit(fetch_and_link, store, key, key_occurrences, engine, stream, audio_format, ledger)
+            for key, key_occurrences in occurrences.items()
+        ]
+        wait_for_downloads(futures)
 
 
 if __name__ == "__main__":
@@ -106,5 +750,10 @@ if __name__ == "__main__":
     source_directory = "/Users/python/Python Projekte/Studium Digitale/links"
     download_directory = "/Users/python/Python Projekte/Studium Digitale/Downloads"
 
-    # Process directories and download videos
-    process_directory(source_directory, download_directory)
+    # Process directories and stream the videos straight into FFmpeg, keeping the original AAC track;
+    # the ledger lets a rerun after a crash continue with the unfinished videos
+    ledger = JobLedger()
+    try:
+        process_directory(source_directory, download_directory, stream=True, audio_format='m4a', ledger=ledger)
+    finally:
+        ledger.close()
@@ -1,109 +1,602 @@
 import os
 import re
+import html
 import json
+import bisect
+import hashlib
 import logging
-from typing import List
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 from bs4 import BeautifulSoup
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import dask
 from dask import delayed, compute
 from tqdm import tqdm
 
+import metrics
+
 # Konfiguration des Loggings
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def extract_video_urls_from_file(html_file: str) -> List[str]:
+# Auswahl der Kaltura-Flavors (Renditionen) pro Eintrag:
+# - lowest_bitrate: Rendition mit der kleinsten Bitrate
+# - audio_only: reine Audio-Rendition, falls vorhanden, sonst die kleinste Bitrate
+# - max_resolution: beste Rendition, deren Höhe max_height nicht überschreitet
+# - all: alle Renditionen (bisheriges Verhalten)
+FLAVOR_POLICIES = ('lowest_bitrate', 'audio_only', 'max_resolution', 'all')
+DEFAULT_FLAVOR_POLICY = 'lowest_bitrate'
+FLAVOR_STATUS_READY = 2
+
+# Schnelle Extraktion: Markierungen und Regionen, die statt eines vollständigen HTML-Baums ausgewertet werden
+PARSERS = ('fast', 'bs4')
+BACKENDS = ('processes', 'threads')  # Parallelisierung in process_html_files
+MANIFEST_FILE = '.manifest.json'  # Manifest der inkrementellen Extraktion im Zielverzeichnis
+PACKAGE_MARKER = 'kalturaIframePackageData'
+_PACKAGE_ASSIGNMENT_RE = re.compile(r'window\.kalturaIframePackageData\s*=\s*(?=\{)')
+_JSON_DECODER = json.JSONDecoder()
+_MEDIA_TAG_RE = re.compile(rb"""<(?:iframe|video|source)\b((?:[^>"']|"[^"]*"|'[^']*')*)>""", re.IGNORECASE)
+_SCRIPT_TAG_RE = re.compile(rb"""<script\b((?:[^>"']|"[^"]*"|'[^']*')*)>""", re.IGNORECASE)
+_ATTRIBUTE_RE = re.compile(r"""([^\s"'>/=]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'=<>`]+)))?""")
+
+def parse_flavor(asset: Dict[str, Any]) -> Dict[str, Any]:
     """
-    Extrahiert Video-URLs aus einer gegebenen HTML-Datei.
+    Liest die für die Auswahl relevanten Metadaten eines Kaltura-Flavor-Assets.
 
-    :param html_file: Pfad zur HTML-Datei
-    :return: Liste der extrahierten Video-URLs
+    :param asset: Flavor-Asset aus dem kalturaIframePackageData-JSON
+    :return: Flavor mit ID, Bitrate (kbit/s), Grösse (Bytes), Abmessungen, Audio-Flag und Download-URL
     """
-    logging.info(f"Extrahiere Video-URLs aus {html_file}")
-    with open(html_file, 'r', encoding='utf-8') as file:
-        content = file.read()
+    width = int(asset.get('width') or 0)
+    height = int(asset.get('height') or 0)
+    tags = str(asset.get('tags') or '').split(',')
+    size = asset.get('sizeInBytes')
+    return {
+        'flavor_params_id': asset.get('flavorParamsId'),
+        'entry_id': asset.get('entryId'),
+        'bitrate': asset.get('bitrate'),
+        'size': int(size) if size else int(asset.get('size') or 0) * 1024 or None,
+        'width': width,
+        'height': height,
+        'audio_only': 'audio_only' in tags or (not width and not height and not asset.get('videoCodecId')),
+        'download_url': asset.get('downloadUrl'),
+    }
 
-    soup = BeautifulSoup(content, 'html.parser')
+def select_flavor(flavors: List[Dict[str, Any]], policy: str = DEFAULT_FLAVOR_POLICY,
+                  max_height: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """
+    Wählt gemäss der Richtlinie einen Flavor eines Eintrags aus.
+
+    :param flavors: Mit parse_flavor gelesene Flavors eines Eintrags
+    :param policy: Eine der FLAVOR_POLICIES (ausser "all")
+    :param max_height: Maximale Höhe in Pixeln für die Richtlinie "max_resolution" (None: keine Begrenzung)
+    :return: Der ausgewählte Flavor oder None, wenn keine Flavors vorhanden sind
+    """
+    if not flavors:
+        return None
+
+    def cost(flavor: Dict[str, Any]):
+        # Unbekannte Bitraten/Grössen ans Ende sortieren
+        return (flavor['bitrate'] is None, flavor['bitrate'] or 0, flavor['size'] is None, flavor['size'] or 0)
+
+    if policy == 'audio_only':
+        audio_flavors = [flavor for flavor in flavors if flavor['audio_only']]
+        return min(audio_flavors or flavors, key=cost)
+    if policy == 'max_resolution':
+        fitting = [flavor for flavor in flavors
+                   if not flavor['audio_only'] and (max_height is None or flavor['height'] <= max_height)]
+        if fitting:
+            return max(fitting, key=lambda flavor: (flavor['height'], flavor['bitrate'] or 0))
+    return min(flavors, key=cost)
+
+def flavor_download_url(download_url: str, flavor_params_id: Any) -> str:
+    """
+    Setzt die Flavor-ID in eine Kaltura-playManifest-URL ein.
+
+    :param download_url: playManifest-URL des Eintrags
+    :param flavor_params_id: Gewünschte flavorParamsId
+    :return: URL, die genau diesen Flavor liefert
+    """
+    if '/flavorParamIds/' in download_url:
+        return re.sub(r'/flavorParamIds/[^/?]+', f'/flavorParamIds/{flavor_params_id}', download_url)
+    return f"{download_url.rstrip('/')}/flavorParamIds/{flavor_params_id}"
+
+def _entry_flavor_urls(flavors: List[Dict[str, Any]], download_url: Optional[str], policy: str,
+                       max_height: Optional[int]) -> List[str]:
+    """
+    Bestimmt die Download-URLs eines Eintrags gemäss der Flavor-Richtlinie.
+
+    :param flavors: Flavors des Eintrags
+    :param download_url: playManifest-URL des Eintrags, aus der Flavor-URLs abgeleitet werden
+    :param policy: Eine der FLAVOR_POLICIES (ausser "all")
+    :param max_height: Maximale Höhe für "max_resolution"
+    :return: Liste mit höchstens einer Download-URL
+    """
+    def url_of(flavor: Dict[str, Any]) -> Optional[str]:
+        if flavor['download_url']:
+            return flavor['download_url']
+        if download_url and flavor['flavor_params_id'] is not None:
+            return flavor_download_url(download_url, flavor['flavor_params_id'])
+        return None
+
+    candidates = [flavor for flavor in flavors if url_of(flavor)]
+    selected = select_flavor(candidates, policy, max_height)
+    return [url_of(selected)] if selected else []
+
+def _flavor_profile(assets: Iterable[Any]) -> Dict[Any, Dict[str, Any]]:
+    """
+    Sammelt die Metadaten der Flavor-Parameter einer Seite, um Playlist-Einträge ohne eigene Flavor-Assets zu bewerten.
+
+    :param assets: Flavor-Assets der Seite
+    :return: Flavor-Metadaten nach flavorParamsId
+    """
+    return {
+        flavor['flavor_params_id']: flavor
+        for flavor in (parse_flavor(asset) for asset in assets if isinstance(asset, dict))
+        if flavor['flavor_params_id'] is not None
+    }
+
+def _parse_package_data(script_text: str) -> Optional[Dict[str, Any]]:
+    """
+    Liest das kalturaIframePackageData-Objekt aus dem Text eines Script-Tags.
+
+    :param script_text: Inhalt des Script-Tags
+    :return: Das JSON-Objekt oder None, wenn keine Zuweisung gefunden wurde
+    """
+    assignment = _PACKAGE_ASSIGNMENT_RE.search(script_text)
+    if not assignment:
+        return None
+    data, _ = _JSON_DECODER.raw_decode(script_text, assignment.end())
+    return data
+
+def _all_package_urls(data: Dict[str, Any]) -> List[str]:
+    """
+    Übernimmt alle URLs eines kalturaIframePackageData-Objekts unverändert (Richtlinie "all").
+
+    :param data: Das JSON-Objekt
+    :return: Alle downloadUrl der Flavor-Assets und alle dataUrl der Playlist-Einträge
+    """
     video_urls = [
+        asset.get('downloadUrl')
+        for asset in data.get('entryResult', {}).get('meta', {}).get('flavorAssets', [])
+        if isinstance(asset, dict) and asset.get('downloadUrl')
+    ]
+    for value in data.get('playlistResult', {}).values():
+        if isinstance(value, dict):
+            video_urls.extend(item.get('dataUrl') for item in value.get('items', []) if item.get('dataUrl'))
+    return video_urls
+
+def _package_data_urls(data: Dict[str, Any], flavor_policy: str, max_height: Optional[int],
+                       seen_entries: set) -> List[str]:
+    """
+    Bestimmt die Video-URLs eines kalturaIframePackageData-Objekts.
+
+    :param data: Das JSON-Objekt
+    :param flavor_policy: Eine der FLAVOR_POLICIES
+    :param max_height: Maximale Höhe in Pixeln für die Richtlinie "max_resolution"
+    :param seen_entries: Bereits übernommene Einträge der Seite (wird ergänzt)
+    :return: Liste der Video-URLs
+    """
+    if flavor_policy == 'all':
+        return _all_package_urls(data)
+
+    video_urls = []
+    entry_result = data.get('entryResult', {})
+    playlist_result = data.get('playlistResult', {})
+
+    meta = entry_result.get('meta') or {}
+    assets = [
+        asset
+        for asset in (meta.get('flavorAssets') or []) + (entry_result.get('contextData') or {}).get('flavorAssets', [])
+        if isinstance(asset, dict) and asset.get('status', FLAVOR_STATUS_READY) == FLAVOR_STATUS_READY
+    ]
+    profile = _flavor_profile(assets)
+
+    # Verarbeite entryResult für Video-URLs
+    entry_id = meta.get('id')
+    if entry_id is None or entry_id not in seen_entries:
+        seen_entries.add(entry_id)
+        video_urls.extend(_entry_flavor_urls(
+            [parse_flavor(asset) for asset in assets], meta.get('downloadUrl'), flavor_policy, max_height
+        ))
+
+    # Verarbeite playlistResult für Video-URLs
+    for key, value in playlist_result.items():
+        if isinstance(value, dict):
+            for item in value.get('items', []):
+                if not (data_url := item.get('dataUrl')) or item.get('id') in seen_entries:
+                    continue
+                seen_entries.add(item.get('id'))
+                flavor_ids = [
+                    flavor_id.strip() for flavor_id in str(item.get('flavorParamsIds') or '').split(',')
+                    if flavor_id.strip()
+                ]
+                known = [
+                    dict(profile[int(flavor_id)], download_url=None)
+                    for flavor_id in flavor_ids
+                    if flavor_id.isdigit() and int(flavor_id) in profile
+                ]
+                if not known:
+                    video_urls.append(data_url)  # Standard-Rendition des Players
+                else:
+                    video_urls.extend(_entry_flavor_urls(
+                        known, item.get('downloadUrl') or data_url, flavor_policy, max_height
+                    ))
+    return video_urls
+
+def _scan_with_soup(content: str) -> Tuple[List[str], List[str]]:
+    """
+    Sucht Medien-Tags und Kaltura-Scripts mit einem vollständigen BeautifulSoup-Baum.
+
+    :param content: HTML-Inhalt
+    :return: Tupel aus den URLs der Medien-Tags und den Texten der Kaltura-Scripts
+    """
+    soup = BeautifulSoup(content, 'html.parser')
+    tag_urls = [
         tag.get('src') or tag.get('data-src')
         for tag in soup.find_all(['iframe', 'video', 'source'])
         if (src := tag.get('src') or tag.get('data-src')) and 'http' in src
     ]
+    scripts = [
+        script.string
+        for script in soup.find_all('script', type='text/javascript')
+        if script.string and PACKAGE_MARKER in script.string
+    ]
+    return tag_urls, scripts
+
+def _tag_attributes(attributes: str) -> Dict[str, str]:
+    """
+    Liest die Attribute eines Start-Tags wie html.parser (Namen klein geschrieben, Entities aufgelöst).
+
+    :param attributes: Text zwischen Tag-Namen und schliessender Klammer
+    :return: Attribute nach Namen
+    """
+    return {
+        match.group(1).lower(): html.unescape(next((value for value in match.group(2, 3, 4) if value is not None), ''))
+        for match in _ATTRIBUTE_RE.finditer(attributes)
+    }
+
+def _opaque_spans(data: bytes, lower: bytes, with_package: bool) -> Tuple[List[Tuple[int, int]], List[str]]:
+    """
+    Bestimmt die Bereiche von Kommentaren und Script-Inhalten, in denen html.parser kein Markup erkennt.
+
+    :param data: HTML-Inhalt als Bytes
+    :param lower: Derselbe Inhalt mit ASCII-Kleinbuchstaben (gleiche Länge)
+    :param with_package: Texte der Kaltura-Scripts sammeln
+    :return: Tupel aus den sortierten Bereichen und den Texten der Kaltura-Scripts
+    """
+    spans = []
+    scripts = []
+    position = 0
+    comment = lower.find(b'<!--')
+    while True:
+        if 0 <= comment < position:
+            comment = lower.find(b'<!--', position)
+        script = lower.find(b'<script', position)
+        if comment < 0 and script < 0:
+            break
+        if comment >= 0 and (script < 0 or comment < script):
+            end = lower.find(b'-->', comment + 4)
+            end = len(data) if end < 0 else end + 3
+            spans.append((comment, end))
+            position = end
+            continue
+
+        tag = _SCRIPT_TAG_RE.match(data, script)
+        if tag is None:
+            position = script + len(b'<script')
+            continue
+        body_start = tag.end()
+        body_end = lower.find(b'</script', body_start)
+        body_end = len(data) if body_end < 0 else body_end
+        spans.append((body_start, body_end))
+        position = body_end
+        body = data[body_start:body_end]
+        if with_package and PACKAGE_MARKER.encode() in body \
+                and _tag_attributes(tag.group(1).decode('utf-8')).get('type') == 'text/javascript':
+            scripts.append(body.decode('utf-8'))
+    return spans, scripts
+
+def _scan_fast(data: bytes) -> Tuple[List[str], List[str]]:
+    """
+    Sucht Medien-Tags und Kaltura-Scripts, ohne die ganze Seite zu parsen.
 
-    # Extrahiere URLs aus JSON-Teilen in Script-Tags
-    for script in soup.find_all('script', type='text/javascript'):
-        if script.string and 'kalturaIframePackageData' in script.string:
-            json_text = re.search(r'window\.kalturaIframePackageData\s*=\s*(\{.*?\});', script.string, re.DOTALL)
-            if json_text:
-                data = json.loads(json_text.group(1))
-                entry_result = data.get('entryResult', {})
-                playlist_result = data.get('playlistResult', {})
-
-                # Verarbeite entryResult für Video-URLs
-                video_urls.extend(
-                    entry.get('downloadUrl')
-                    for entry in entry_result.get('meta', {}).get('flavorAssets', [])
-                    if isinstance(entry, dict) and (download_url := entry.get('downloadUrl'))
-                )
-
-                # Verarbeite playlistResult für Video-URLs
-                for key, value in playlist_result.items():
-                    if isinstance(value, dict):
-                        video_urls.extend(
-                            item.get('dataUrl')
-                            for item in value.get('items', [])
-                            if (download_url := item.get('dataUrl'))
-                        )
+    Die Rohdaten werden nach den Markierungen durchsucht; dekodiert und ausgewertet werden nur
+    die gefundenen Tags und Scripts. Tags innerhalb von Scripts und Kommentaren werden wie von
+    html.parser ignoriert.
+
+    :param data: HTML-Inhalt als Bytes
+    :return: Tupel aus den URLs der Medien-Tags und den Texten der Kaltura-Scripts
+    """
+    has_package = PACKAGE_MARKER.encode() in data
+    media_tags = list(_MEDIA_TAG_RE.finditer(data))
+    if not has_package and not media_tags:
+        return [], []
+
+    spans, scripts = _opaque_spans(data, data.lower(), has_package)
+    starts = [start for start, _ in spans]
+    tag_urls = []
+    for match in media_tags:
+        index = bisect.bisect_right(starts, match.start()) - 1
+        if index >= 0 and match.start() < spans[index][1]:
+            continue
+        attributes = _tag_attributes(match.group(1).decode('utf-8'))
+        src = attributes.get('src') or attributes.get('data-src')
+        if src and 'http' in src:
+            tag_urls.append(src)
+    return tag_urls, scripts
+
+def extract_video_urls_from_file(html_file: str, flavor_policy: str = DEFAULT_FLAVOR_POLICY,
+                                 max_height: Optional[int] = None, parser: str = 'fast') -> List[str]:
+    """
+    Extrahiert Video-URLs aus einer gegebenen HTML-Datei.
+
+    Für Kaltura-Einträge wird gemäss der Flavor-Richtlinie pro Eintrag nur eine Rendition übernommen.
+
+    :param html_file: Pfad zur HTML-Datei
+    :param flavor_policy: Eine der FLAVOR_POLICIES
+    :param max_height: Maximale Höhe in Pixeln für die Richtlinie "max_resolution"
+    :param parser: "fast" (Vorabsuche in den Rohdaten, BeautifulSoup nur als Rückfall) oder "bs4"
+    :return: Liste der extrahierten Video-URLs
+    """
+    if flavor_policy not in FLAVOR_POLICIES:
+        raise ValueError(f"Unbekannte Flavor-Richtlinie '{flavor_policy}', erwartet eine von {FLAVOR_POLICIES}.")
+    if parser not in PARSERS:
+        raise ValueError(f"Unbekannter Parser '{parser}', erwartet einer von {PARSERS}.")
+    logging.info(f"Extrahiere Video-URLs aus {html_file}")
+    with metrics.span('parse', html_file, parser=parser) as span:
+        with open(html_file, 'rb') as file:
+            data = file.read()
+
+        packages = None
+        if parser == 'fast':
+            try:
+                tag_urls, scripts = _scan_fast(data)
+                packages = [package for package in map(_parse_package_data, scripts) if package is not None]
+            except ValueError as e:
+                logging.warning(f"Schnelle Extraktion fehlgeschlagen für {html_file} ({e}), verwende BeautifulSoup.")
+
+        if packages is None:
+            tag_urls, scripts = _scan_with_soup(data.decode('utf-8'))
+            packages = []
+            for script in scripts:
+                try:
+                    package = _parse_package_data(script)
+                except ValueError as e:
+                    logging.error(f"Ungültige kalturaIframePackageData in {html_file}: {e}")
+                    continue
+                if package is not None:
+                    packages.append(package)
+
+        # Extrahiere URLs aus JSON-Teilen in Script-Tags
+        video_urls = list(tag_urls)
+        seen_entries = set()
+        for package in packages:
+            video_urls.extend(_package_data_urls(package, flavor_policy, max_height, seen_entries))
+        span.set(bytes=len(data), urls=len(video_urls))
 
     logging.info(f"Gefundene Video-URLs in {html_file}: {len(video_urls)}")
     return video_urls
 
-def process_file(html_file: str, source_directory: str, output_directory: str) -> None:
+def process_file(html_file: str, source_directory: str, output_directory: str,
+                 flavor_policy: str = DEFAULT_FLAVOR_POLICY, max_height: Optional[int] = None,
+                 parser: str = 'fast') -> List[str]:
     """
     Verarbeitet eine einzelne HTML-Datei, extrahiert Video-URLs und speichert sie in einem entsprechenden Verzeichnis.
 
+    Enthält die Seite keine Video-URLs (mehr), wird eine bestehende Link-Datei entfernt.
+
     :param html_file: Pfad zur HTML-Datei
     :param source_directory: Quellverzeichnis mit HTML-Dateien
     :param output_directory: Zielverzeichnis für die extrahierten Video-URLs
+    :param flavor_policy: Eine der FLAVOR_POLICIES
+    :param max_height: Maximale Höhe in Pixeln für die Richtlinie "max_resolution"
+    :param parser: Einer der PARSERS
+    :return: Liste der extrahierten Video-URLs
     """
     relative_path = os.path.relpath(html_file, source_directory)
-    lesson_directory = os.path.join(output_directory, os.path.dirname(relative_path))
-    os.makedirs(lesson_directory, exist_ok=True)
-    video_urls = extract_video_urls_from_file(html_file)
+    output_file = link_file_for(relative_path, output_directory)
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    video_urls = extract_video_urls_from_file(html_file, flavor_policy, max_height, parser)
 
     if video_urls:
-        output_file = os.path.join(lesson_directory, os.path.splitext(os.path.basename(html_file))[0] + '.txt')
         with open(output_file, 'w', encoding='utf-8') as file:
             file.write('\n'.join(video_urls) + '\n')
         logging.info(f"Video-URLs gespeichert in {output_file}.")
+    elif os.path.exists(output_file):
+        os.remove(output_file)
+    return video_urls
+
+def link_file_for(relative_path: str, output_directory: str) -> str:
+    """
+    Bestimmt die Link-Datei einer HTML-Datei.
+
+    :param relative_path: Pfad der HTML-Datei relativ zum Quellverzeichnis
+    :param output_directory: Zielverzeichnis für die extrahierten Video-URLs
+    :return: Pfad der Link-Datei
+    """
+    return os.path.join(output_directory, os.path.splitext(relative_path)[0] + '.txt')
+
+def load_manifest(output_directory: str) -> Dict[str, Any]:
+    """
+    Lädt das Manifest der inkrementellen Extraktion.
+
+    :param output_directory: Zielverzeichnis für die extrahierten Video-URLs
+    :return: Manifest mit den Extraktionsoptionen und den Einträgen der Seiten
+    """
+    try:
+        with open(os.path.join(output_directory, MANIFEST_FILE), 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {'options': None, 'pages': {}}
 
-def process_html_files(source_directory: str, output_directory: str) -> None:
+def save_manifest(output_directory: str, manifest: Dict[str, Any]) -> None:
+    """
+    Speichert das Manifest atomar.
+
+    :param output_directory: Zielverzeichnis für die extrahierten Video-URLs
+    :param manifest: Das Manifest
+    """
+    manifest_file = os.path.join(output_directory, MANIFEST_FILE)
+    with open(manifest_file + '.tmp', 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, ensure_ascii=False)
+    os.replace(manifest_file + '.tmp', manifest_file)
+
+def _file_sha256(path: str) -> str:
+    """
+    Berechnet den SHA-256 einer Datei.
+
+    :param path: Pfad zur Datei
+    :return: Hex-Digest des Inhalts
+    """
+    with open(path, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+def _pages_to_extract(html_files: List[str], source_directory: str, manifest: Dict[str, Any],
+                      options: Dict[str, Any]) -> List[str]:
+    """
+    Bestimmt die neuen und geänderten Seiten und aktualisiert Grösse/Änderungszeit unveränderter Seiten.
+
+    Grösse und Änderungszeit entscheiden zuerst; nur bei Abweichungen wird der Inhalt gehasht,
+    sodass z.B. ein blosses Neukopieren keine erneute Extraktion auslöst.
+
+    :param html_files: Alle HTML-Dateien im Quellverzeichnis
+    :param source_directory: Quellverzeichnis mit HTML-Dateien
+    :param manifest: Das Manifest (wird angepasst)
+    :param options: Extraktionsoptionen; weichen sie vom Manifest ab, werden alle Seiten neu extrahiert
+    :return: Die zu extrahierenden HTML-Dateien
+    """
+    if manifest.get('options') != options:
+        return html_files
+
+    pages = manifest['pages']
+    to_extract = []
+    for html_file in html_files:
+        page = pages.get(os.path.relpath(html_file, source_directory))
+        stat = os.stat(html_file)
+        if page and page['size'] == stat.st_size and page['mtime_ns'] == stat.st_mtime_ns:
+            continue
+        if page and page['size'] == stat.st_size and page['sha256'] == _file_sha256(html_file):
+            page['mtime_ns'] = stat.st_mtime_ns
+            continue
+        to_extract.append(html_file)
+    return to_extract
+
+def process_html_files(source_directory: str, output_directory: str,
+                       flavor_policy: str = DEFAULT_FLAVOR_POLICY, max_height: Optional[int] = None,
+                       parser: str = 'fast', backend: str = 'processes', max_workers: Optional[int] = None,
+                       incremental: bool = True) -> Dict[str, List[str]]:
     """
     Durchsucht rekursiv die Verzeichnisstruktur, extrahiert Video-URLs aus HTML-Dateien und speichert diese in entsprechenden Verzeichnissen.
 
+    Im inkrementellen Modus hält ein Manifest im Zielverzeichnis Grösse, Änderungszeit, Inhalts-Hash
+    und URLs jeder Seite fest: unveränderte Seiten werden übersprungen, geänderte neu extrahiert und
+    die Link-Dateien gelöschter Seiten entfernt. Fehlt das Quellverzeichnis oder enthält es keine HTML-Dateien,
+    bleiben Link-Dateien und Manifest unverändert.
+
+    Das Parsen ist CPU-gebunden; mit dem Backend "processes" läuft es daher in einem Prozess-Pool
+    statt in Threads, die sich den GIL teilen.
+
     :param source_directory: Quellverzeichnis mit HTML-Dateien
     :param output_directory: Zielverzeichnis für die extrahierten Video-URLs
+    :param flavor_policy: Eine der FLAVOR_POLICIES
+    :param max_height: Maximale Höhe in Pixeln für die Richtlinie "max_resolution"
+    :param parser: Einer der PARSERS
+    :param backend: Eines der BACKENDS
+    :param max_workers: Anzahl der Prozesse (Standard: Anzahl der CPU-Kerne)
+    :param incremental: Nur neue und geänderte Seiten verarbeiten
+    :return: Hinzugekommene ("added") und weggefallene ("removed") Video-URLs
     """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unbekanntes Backend '{backend}', erwartet eines von {BACKENDS}.")
+
+    if not os.path.isdir(source_directory):
+        raise FileNotFoundError(f"Quellverzeichnis {source_directory} nicht gefunden.")
+
+    # Ein unvollständig gelesenes Quellverzeichnis darf keine Seiten als gelöscht erscheinen lassen
     html_files = [
         os.path.join(root, file)
-        for root, _, files in os.walk(source_directory)
+        for root, _, files in os.walk(source_directory, onerror=_raise_walk_error)
         for file in files if file.endswith('.html')
     ]
 
     if not html_files:
         logging.info("Keine HTML-Dateien im Quellverzeichnis gefunden.")
-        return
+        return {'added': [], 'removed': []}
 
     os.makedirs(output_directory, exist_ok=True)
+    options = {'flavor_policy': flavor_policy, 'max_height': max_height}
+    manifest = load_manifest(output_directory) if incremental else {'options': None, 'pages': {}}
+    old_urls = {url for page in manifest['pages'].values() for url in page['urls']}
+    old_pages = manifest['pages'] if manifest.get('options') == options else {}
+    to_extract = _pages_to_extract(html_files, source_directory, manifest, options) if incremental else html_files
+
+    extracted = _extract_pages(to_extract, source_directory, output_directory, flavor_policy, max_height,
+                               parser, backend, max_workers)
+
+    pages = {}
+    for html_file in html_files:
+        relative_path = os.path.relpath(html_file, source_directory)
+        if html_file in extracted:
+            stat = os.stat(html_file)
+            pages[relative_path] = {
+                'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': _file_sha256(html_file),
+                'urls': extracted[html_file],
+            }
+        elif relative_path in old_pages:
+            pages[relative_path] = old_pages[relative_path]
+
+    for relative_path in set(manifest['pages']) - set(pages):
+        link_file = link_file_for(relative_path, output_directory)
+        if os.path.exists(link_file):
+            os.remove(link_file)
+            logging.info(f"Link-Datei der gelöschten Seite {relative_path} entfernt.")
+
+    if incremental:
+        save_manifest(output_directory, {'options': options, 'pages': pages})
+
+    new_urls = {url for page in pages.values() for url in page['urls']}
+    changes = {'added': sorted(new_urls - old_urls), 'removed': sorted(old_urls - new_urls)}
+    logging.info(f"{len(to_extract)} von {len(html_files)} Seiten extrahiert, "
+                 f"{len(changes['added'])} URLs hinzugekommen, {len(changes['removed'])} entfallen.")
+    return changes
+
+def _raise_walk_error(error: OSError) -> None:
+    """
+    Bricht das Durchsuchen des Quellverzeichnisses ab, statt ein unlesbares Verzeichnis zu überspringen.
+
+    :param error: Der Fehler von os.walk
+    """
+    raise error
+
+def _extract_pages(html_files: List[str], source_directory: str, output_directory: str, flavor_policy: str,
+                   max_height: Optional[int], parser: str, backend: str,
+                   max_workers: Optional[int]) -> Dict[str, List[str]]:
+    """
+    Extrahiert die Video-URLs mehrerer Seiten parallel und schreibt ihre Link-Dateien.
+
+    :return: Video-URLs nach HTML-Datei
+    """
+    if not html_files:
+        return {}
+
+    if backend == 'processes':
+        worker = partial(process_file, source_directory=source_directory, output_directory=output_directory,
+                         flavor_policy=flavor_policy, max_height=max_height, parser=parser)
+        workers = max_workers or os.cpu_count() or 1
+        chunksize = max(1, len(html_files) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(tqdm(executor.map(worker, html_files, chunksize=chunksize), total=len(html_files),
+                                desc="Verarbeitung der HTML-Dateien"))
+        return dict(zip(html_files, results))
 
     tasks = [
-        delayed(process_file)(html_file, source_directory, output_directory)
+        delayed(process_file)(html_file, source_directory, output_directory, flavor_policy, max_height, parser)
         for html_file in html_files
     ]
 
     with tqdm(total=len(tasks), desc="Verarbeitung der HTML-Dateien") as pbar:
-        for _ in compute(*tasks, scheduler='threads'):
-            pbar.update(1)
+        results = compute(*tasks, scheduler='threads')
+        pbar.update(len(results))
+    return dict(zip(html_files, results))
 
 def main() -> None:
     """
@@ -0,0 +1,350 @@
+"""
+Script Name: job_ledger.py
+
+Zweck des Skripts:
+Persistentes Auftragsbuch für alle Verarbeitungsstufen (Download, Audio, Transkription). Für jedes Medium und jede
+Stufe werden Zustand ("pending", "in_progress", "done", "failed"), Anzahl der Versuche, Bytes, Zeitstempel, Dauer,
+Ergebnis und letzte Fehlermeldung festgehalten. Nach einem Absturz übernehmen die Worker beim nächsten Lauf nur die
+unerledigten Aufträge, statt alles von vorne zu beginnen.
+
+Hauptfunktionen und -methoden:
+- JobLedger.claim: Übernimmt einen Auftrag, sofern er nicht erledigt ist oder von einem laufenden Prozess bearbeitet wird.
+- JobLedger.complete / JobLedger.fail: Schliessen einen Auftrag ab.
+- JobLedger.run: Führt eine Funktion als Auftrag aus und protokolliert Ergebnis, Dauer und Bytes
+  (JobLedger.begin / JobLedger.record für Aufträge, die keine gewöhnliche Funktion sind, z.B. Koroutinen).
+- JobLedger.retry: Setzt fehlgeschlagene (und optional hängengebliebene) Aufträge zurück.
+- main: Kommandozeile ("summary", "list", "retry").
+
+Hinweise auf spezielle Implementierungsentscheidungen oder Sicherheitsaspekte:
+- Die Datenbank läuft im WAL-Modus, sodass mehrere Threads und Prozesse gleichzeitig lesen und schreiben können.
+  Jeder Thread verwendet eine eigene Verbindung; Übernahmen laufen in einer "BEGIN IMMEDIATE"-Transaktion.
+- Ein Auftrag "in_progress" eines nicht mehr laufenden Prozesses desselben Rechners gilt als abgebrochen und wird
+  erneut übernommen.
+- Ist das Ergebnis eines erledigten Auftrags eine Datei oder ein Verzeichnis, das inzwischen fehlt, führt
+  JobLedger.run den Auftrag erneut aus.
+"""
+
+import argparse
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Logging configuration
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DEFAULT_LEDGER_PATH = os.path.expanduser("~/.cache/studium-digitale/jobs.sqlite")
+JOB_STATES = ('pending', 'in_progress', 'done', 'failed')
+BUSY_TIMEOUT = 30  # Seconds to wait for a lock held by another writer
+
+
+def _process_alive(pid: int) -> bool:
+    """
+    :param pid: A process ID on this host.
+    :return: True if the process is still running.
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobLedger:
+    """
+    Crash-safe record of the state of every asset in every pipeline stage.
+
+    An asset is identified per stage by a string chosen by the stage, e.g. the media key of a
+    download or the path of the file to transcribe.
+    """
+
+    def __init__(self, path: str = DEFAULT_LEDGER_PATH):
+        self.path = path
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._generation = 0  # Increased by close; connections of an older generation are closed
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        db = self._db
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                stage TEXT NOT NULL,
+                asset TEXT NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                bytes INTEGER,
+                result TEXT,
+                error TEXT,
+                owner TEXT,
+                created REAL NOT NULL,
+                started REAL,
+                finished REAL,
+                duration REAL,
+                PRIMARY KEY (stage, asset)
+            );
+            CREATE INDEX IF NOT EXISTS jobs_state ON jobs (stage, state);
+        """)
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        """Return the connection of the current thread."""
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.generation != self._generation:
+            # Only used by this thread, but close may be called from another one
+            db = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA synchronous=NORMAL")
+            with self._connections_lock:
+                self._connections.append(db)
+                self._local.db, self._local.generation = db, self._generation
+        return db
+
+    def close(self) -> None:
+        """Close the connections of all threads; threads using the ledger afterwards open new ones."""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+            self._generation += 1
+        for db in connections:
+            db.close()
+
+    def add(self, stage: str, asset: str) -> None:
+        """
+        Register an asset as pending unless the stage already knows it.
+
+        :param stage: Name of the stage.
+        :param asset: Identifier of the asset.
+        """
+        self._db.execute(
+            "INSERT OR IGNORE INTO jobs (stage, asset, state, created) VALUES (?, ?, 'pending', ?)",
+            (stage, asset, time.time())
+        )
+
+    def _claimable(self, row: Optional[sqlite3.Row]) -> bool:
+        if row is None or row['state'] in ('pending', 'failed'):
+            return True
+        if row['state'] != 'in_progress' or row['owner'] == self.owner:
+            return False
+        host, _, pid = (row['owner'] or '').rpartition(':')
+        return host == socket.gethostname() and pid.isdigit() and not _process_alive(int(pid))
+
+    def claim(self, stage: str, asset: str) -> bool:
+        """
+        Take over an unfinished job.
+
+        :param stage: Name of the stage.
+        :param asset: Identifier of the asset.
+        :return: True if the caller now owns the job, False if it is done or being processed elsewhere.
+        """
+        db = self._db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute("SELECT state, owner FROM jobs WHERE stage = ? AND asset = ?", (stage, asset)).fetchone()
+            claimable = self._claimable(row)
+            if claimable:
+                now = time.time()
+                db.execute(
+                    "INSERT INTO jobs (stage, asset, state, attempts, owner, created, started) "
+                    "VALUES (?, ?, 'in_progress', 1, ?, ?, ?) "
+                    "ON CONFLICT (stage, asset) DO UPDATE SET state = 'in_progress', attempts = attempts + 1, "
+                    "owner = excluded.owner, started = excluded.started, finished = NULL, error = NULL",
+                    (stage, asset, self.owner, now, now)
+                )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return claimable
+
+    def _finish(self, stage: str, asset: str, state: str, result: Optional[str], error: Optional[str],
+                size: Optional[int]) -> None:
+        now = time.time()
+        self._db.execute(
+            "UPDATE jobs SET state = ?, result = COALESCE(?, result), error = ?, bytes = COALESCE(?, bytes), "
+            "finished = ?, duration = ? - started, owner = NULL WHERE stage = ? AND asset = ?",
+            (state, result, error, size, now, now, stage, asset)
+        )
+
+    def complete(self, stage: str, asset: str, result: Optional[str] = None, size: Optional[int] = None) -> None:
+        """
+        Mark a claimed job as done.
+
+        :param stage: Name of the stage.
+        :param asset: Identifier of the asset.
+        :param result: Result of the job, e.g. the path of the produced file.
+        :param size: Number of bytes produced or transferred.
+        """
+        self._finish(stage, asset, 'done', result, None, size)
+
+    def fail(self, stage: str, asset: str, error: str) -> None:
+        """
+        Mark a claimed job as failed.
+
+        :param stage: Name of the stage.
+        :param asset: Identifier of the asset.
+        :param error: Description of the failure.
+        """
+        self._finish(stage, asset, 'failed', None, error, None)
+
+    def get(self, stage: str, asset: str) -> Optional[Dict[str, Any]]:
+        """
+        :param stage: Name of the stage.
+        :param asset: Identifier of the asset.
+        :return: The job record, or None if the stage does not know the asset.
+        """
+        row = self._db.execute("SELECT * FROM jobs WHERE stage = ? AND asset = ?", (stage, asset)).fetchone()
+        return dict(row) if row else None
+
+    def run(self, stage: str, asset: str, function: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Run a function as the job of an asset unless the job is already done.
+
+        A result of None counts as failure, an exception is recorded and re-raised. If the result is
+        the path of a file, its size is recorded as the bytes of the job. A result that is the path of a
+        file or directory is stored as absolute path; if it no longer exists, a finished job is run again.
+
+        :param stage: Name of the stage.
+        :param asset: Identifier of the asset.
+        :param function: The work to do.
+        :return: The result of the function, the stored result of a finished job, or None if another
+                 worker currently owns the job.
+        """
+        claimed, result = self.begin(stage, asset)
+        if not claimed:
+            return result
+        try:
+            result = function(*args, **kwargs)
+        except BaseException as e:
+            self.fail(stage, asset, f"{type(e).__name__}: {e}")
+            raise
+        self.record(stage, asset, result)
+        return result
+
+    def begin(self, stage: str, asset: str) -> Tuple[bool, Any]:
+        """
+        First half of run, for callers that cannot pass the work as a function (e.g. coroutines).
+
+        :param stage: Name of the stage.
+        :param asset: Identifier of the asset.
+        :return: (True, None) if the caller now owns the job and must finish it with record or fail,
+                 otherwise (False, stored result of a finished job or None).
+        """
+        while not self.claim(stage, asset):
+            job = self.get(stage, asset)
+            if job and job['state'] == 'done' and self._artifact_missing(job['result']):
+                logging.info(f"Result {job['result']} of {asset} is gone, running stage '{stage}' again.")
+                self._db.execute(
+                    "UPDATE jobs SET state = 'pending' WHERE stage = ? AND asset = ? AND state = 'done'",
+                    (stage, asset)
+                )
+                continue
+            if job and job['state'] == 'done':
+                logging.info(f"Skipping {asset}: stage '{stage}' already done.")
+                return False, job['result']
+            logging.info(f"Skipping {asset}: stage '{stage}' is processed by {job and job['owner']}.")
+            return False, None
+        return True, None
+
+    def record(self, stage: str, asset: str, result: Any) -> None:
+        """
+        Second half of run: mark a claimed job as done with its result, or as failed if there is none.
+
+        :param stage: Name of the stage.
+        :param asset: Identifier of the asset.
+        :param result: The result of the work.
+        """
+        if result is None:
+            self.fail(stage, asset, "no result")
+            return
+        size = os.path.getsize(result) if isinstance(result, str) and os.path.isfile(result) else None
+        stored = os.path.abspath(result) if isinstance(result, str) and os.path.exists(result) else str(result)
+        self.complete(stage, asset, stored, size)
+
+    @staticmethod
+    def _artifact_missing(result: Optional[str]) -> bool:
+        """Whether a stored result names a file or directory (see run) that no longer exists."""
+        return bool(result) and os.path.isabs(result) and not os.path.exists(result)
+
+    def jobs(self, stage: Optional[str] = None, state: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        :param stage: Only return jobs of this stage.
+        :param state: Only return jobs in this state.
+        :return: The matching job records.
+        """
+        rows = self._db.execute(
+            "SELECT * FROM jobs WHERE (? IS NULL OR stage = ?) AND (? IS NULL OR state = ?) ORDER BY stage, asset",
+            (stage, stage, state, state)
+        )
+        return [dict(row) for row in rows]
+
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        """
+        :return: Number of jobs per stage and state.
+        """
+        counts: Dict[str, Dict[str, int]] = {}
+        for stage, state, count in self._db.execute("SELECT stage, state, COUNT(*) FROM jobs GROUP BY stage, state"):
+            counts.setdefault(stage, {})[state] = count
+        return counts
+
+    def retry(self, stage: Optional[str] = None, assets: Optional[List[str]] = None,
+              include_in_progress: bool = False) -> int:
+        """
+        Reset failed jobs to pending so the next run processes them again.
+
+        :param stage: Only reset jobs of this stage.
+        :param assets: Only reset the jobs of these assets.
+        :param include_in_progress: Also reset jobs left in progress, e.g. by a crashed run on another host.
+        :return: The number of reset jobs.
+        """
+        states = ('failed', 'in_progress') if include_in_progress else ('failed',)
+        query = (f"UPDATE jobs SET state = 'pending', owner = NULL WHERE state IN ({', '.join('?' * len(states))}) "
+                 "AND (? IS NULL OR stage = ?)")
+        parameters: List[Any] = [*states, stage, stage]
+        if assets:
+            query += f" AND asset IN ({', '.join('?' * len(assets))})"
+            parameters += assets
+        return self._db.execute(query, parameters).rowcount
+
+
+def main() -> None:
+    """
+    Command line interface to inspect the ledger and retry failed jobs.
+    """
+    parser = argparse.ArgumentParser(description="Inspect and reset the pipeline job ledger.")
+    parser.add_argument('--ledger', default=DEFAULT_LEDGER_PATH, help="Path of the ledger database.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('summary', help="Show the number of jobs per stage and state.")
+    list_parser = commands.add_parser('list', help="List jobs.")
+    list_parser.add_argument('--stage', help="Only list jobs of this stage.")
+    list_parser.add_argument('--state', choices=JOB_STATES, default='failed', help="Only list jobs in this state.")
+    retry = commands.add_parser('retry', help="Reset failed jobs so the next run processes them again.")
+    retry.add_argument('assets', nargs='*', help="Assets to retry (default: all failed jobs).")
+    retry.add_argument('--stage', help="Only retry jobs of this stage.")
+    retry.add_argument('--in-progress', action='store_true', help="Also reset jobs left in progress.")
+    args = parser.parse_args()
+
+    ledger = JobLedger(args.ledger)
+    try:
+        if args.command == 'summary':
+            for stage, counts in sorted(ledger.summary().items()):
+                print(f"{stage}: " + ', '.join(f"{counts.get(state, 0)} {state}" for state in JOB_STATES))
+        elif args.command == 'list':
+            for job in ledger.jobs(args.stage, args.state):
+                duration = f"{job['duration']:.1f}s" if job['duration'] is not None else '-'
+                print(f"{job['stage']}\t{job['state']}\t{job['attempts']} attempts\t{duration}\t{job['asset']}"
+                      + (f"\t{job['error'].splitlines()[0]}" if job['error'] else ''))
+        elif args.command == 'retry':
+            count = ledger.retry(args.stage, args.assets or None, args.in_progress)
+            print(f"{count} jobs reset to pending.")
+    finally:
+        ledger.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,18 +2,204 @@
 
 
 import os
+import json
+import queue
+import threading
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox
 import shutil
 import ast
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+SCAN_WORKERS = 4  # Threads, die Verzeichnisse im Hintergrund lesen
+BATCH_SIZE = 500  # Einträge, die pro Durchlauf des Tk-Loops in den Baum eingefügt werden
+POLL_INTERVAL = 50  # Millisekunden zwischen zwei Durchläufen
+PLACEHOLDER = "Loading..."  # Platzhalter in noch nicht geladenen Verzeichnissen
+SYMBOL_CACHE_PATH = os.path.expanduser("~/.cache/studium-digitale/symbols.json")  # Zwischenspeicher des Symbolindex
+PARALLEL_PARSE_THRESHOLD = 8  # Ab so vielen geänderten Dateien wird im Prozess-Pool geparst
+
+# Häufige Verzeichnisse, die ausgeschlossen werden sollen
+EXCLUDED_DIRS = {
+    '.venv', '.idea', '__pycache__', '.git', 'node_modules', 'build', 'dist',
+    'env', 'envs', 'venv', 'venvs', 'Lib', 'lib', 'bin', 'include', 'share',
+    'tmp', 'temp', 'logs', 'log', '.DS_Store', '__MACOSX', 'subpages', 'outputs'
+}
+
+# Häufige Dateinamen und Dateitypen, die ausgeschlossen werden sollen
+EXCLUDED_FILES = {'__init__.py', 'creator.py', 'ArchivalZH'}
+EXCLUDED_FILES_EXTENSIONS = {
+    '.DS_Store', '.xls', '.xlsx', '.log', '.tmp', '.pyc', '.pyo', '.pyd', '.so', '.dll',
+    '.exe', '.db', '.sqlite', '.csv', '.json', '.xml', '.md', '.yaml',
+    '.yml', '.cfg', '.conf', '.ini', '.htm', '.css', '.js', '.map',
+    '.class', '.jar', '.war', '.ear', '.zip', '.tar', '.gz', '.bz2', '.rar',
+    '.7z', '.xz', '.iso', '.img', '.mov', '.mp4', '.flv', '.mpeg', '.pdf',
+    '.jpeg', '.jpg', '.png', '.gif'
+}
+
+
+def scan_directory(path, cancelled=lambda: False):
+    """Return the sorted (name, is_dir) entries of a directory that are not excluded, or None if cancelled."""
+    entries = []
+    try:
+        with os.scandir(path) as iterator:
+            for entry in iterator:
+                if cancelled():
+                    return None
+                try:
+                    isdir = entry.is_dir()  # Uses the file type from the directory listing, no extra stat
+                except OSError:
+                    isdir = False
+                file_extension = os.path.splitext(entry.name)[1]
+
+                if isdir and entry.name not in EXCLUDED_DIRS:
+                    entries.append((entry.name, True))
+                elif not isdir and entry.name not in EXCLUDED_FILES and file_extension not in EXCLUDED_FILES_EXTENSIONS:
+                    entries.append((entry.name, False))
+    except OSError as e:
+        print(f"Error reading {path}: {e}")
+    return sorted(entries)
+
+
+def parse_symbols(file_path):
+    """Return the classes (with their methods) and the functions defined in a Python file."""
+    with open(file_path, "r", encoding="utf-8") as file:
+        node = ast.parse(file.read(), filename=file_path)
+    return _symbols(node.body)
+
+
+def _symbols(body):
+    symbols = []
+    for item in body:
+        if isinstance(item, ast.ClassDef):
+            symbols.append(['class', item.name, _symbols(item.body)])
+        elif isinstance(item, ast.AsyncFunctionDef):
+            symbols.append(['async def', item.name, []])
+        elif isinstance(item, ast.FunctionDef):
+            symbols.append(['def', item.name, []])
+    return symbols
+
+
+def _parse_symbols_safely(file_path):
+    try:
+        return parse_symbols(file_path)
+    except Exception as e:
+        print(f"Error parsing {file_path}: {e}")
+        return []
+
+
+def _worker_context():
+    """Start method of the parser processes: "forkserver" where available, otherwise "spawn"."""
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+
+class SymbolIndex:
+    """
+    Classes, methods and functions of Python files, cached by path and modification time.
+
+    Only new or changed files are parsed, larger batches in a process pool. The cache is kept
+    in a JSON file, so a later session starts with the symbols of the previous one.
+    """
+
+    def __init__(self, cache_path=SYMBOL_CACHE_PATH, max_workers=None):
+        self.cache_path = cache_path
+        self.max_workers = max_workers
+        self.entries = self.load()  # Path -> {'key': [mtime_ns, size], 'symbols': [...]}
+        self.changed = False
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        """Write the cache atomically if it changed."""
+        with self.lock:
+            if not self.changed:
+                return
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            temporary_path = self.cache_path + '.tmp'
+            with open(temporary_path, 'w', encoding='utf-8') as file:
+                json.dump(self.entries, file)
+            os.replace(temporary_path, self.cache_path)
+            self.changed = False
+
+    def lookup(self, file_paths):
+        """Return the symbols of the given files, parsing only those that are new or changed."""
+        symbols, stale = {}, {}
+        with self.lock:
+            for file_path in file_paths:
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    continue
+                key = [stat.st_mtime_ns, stat.st_size]
+                entry = self.entries.get(file_path)
+                if entry and entry['key'] == key:
+                    symbols[file_path] = entry['symbols']
+                else:
+                    stale[file_path] = key
+
+        if stale:
+            parsed = dict(zip(stale, self.parse(list(stale))))
+            with self.lock:
+                for file_path, file_symbols in parsed.items():
+                    self.entries[file_path] = {'key': stale[file_path], 'symbols': file_symbols}
+                self.changed = True
+            symbols.update(parsed)
+        return symbols
+
+    def parse(self, file_paths):
+        if len(file_paths) < PARALLEL_PARSE_THRESHOLD:
+            return [_parse_symbols_safely(file_path) for file_path in file_paths]
+        with self.lock:
+            if self.executor is None:
+                # Called from the scan threads of the Tk app: a fork there could copy locks held by
+                # other threads into the workers, so they are started from a clean process instead
+                self.executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=_worker_context())
+        chunksize = max(1, len(file_paths) // (4 * (self.max_workers or os.cpu_count() or 1)))
+        return list(self.executor.map(_parse_symbols_safely, file_paths, chunksize=chunksize))
+
+    def close(self):
+        self.save()
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
 
 class DirectoryTreeApp(tk.Tk):
+    """
+    Directory tree that loads the children of a directory only when it is opened.
+
+    Directories are read on background threads; the Tk loop picks up their entries and
+    inserts them in batches, so the tree stays usable while large directories load.
+    """
+
     def __init__(self):
         super().__init__()
         self.title("Directory Tree Viewer")
         self.geometry("800x600")
         self.create_widgets()
         self.excluded_dirs = {'.venv', '.idea', '__pycache__', '.git'}
+        self.executor = ThreadPoolExecutor(max_workers=SCAN_WORKERS)
+        self.results = queue.Queue()  # Scanned directories, filled by the worker threads
+        self.batches = deque()  # Scanned directories whose entries are not inserted yet
+        self.pending = {}  # Directory nodes being loaded -> whether to expand them completely
+        self.generation = 0  # Incremented on cancel; results of older generations are dropped
+        self.index = SymbolIndex()
+        self.show_functions = False  # Copy of the toggle that the worker threads may read
+        self.python_files = {}  # Node of a Python file -> its path
+        self.symbol_nodes = {}  # Node of a Python file -> its top-level symbol nodes (detached while hidden)
+        self.symbol_batches = deque()  # (generation, file node, symbols) whose nodes are not inserted yet
+        self.unindexed = []  # (file node, path) inserted without symbols while the symbols are shown
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.after(POLL_INTERVAL, self.process_results)
 
     def create_widgets(self):
         self.frame = ttk.Frame(self)
@@ -25,6 +211,7 @@ class DirectoryTreeApp(tk.Tk):
         self.scrollbar = ttk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.tree.yview)
         self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.tree.configure(yscroll=self.scrollbar.set)
+        self.tree.bind('<<TreeviewOpen>>', self.on_open)
 
         self.button_frame = ttk.Frame(self)
         self.button_frame.pack(fill=tk.X)
@@ -51,14 +238,24 @@ class DirectoryTreeApp(tk.Tk):
         self.clear_button = ttk.Button(self.button_frame, text="Clear", command=self.clear_tree)
         self.clear_button.pack(side=tk.RIGHT, padx=5, pady=5)
 
+        self.cancel_button = ttk.Button(self.button_frame, text="Stop Loading", command=self.cancel_loading)
+        self.cancel_button.pack(side=tk.RIGHT, padx=5, pady=5)
+
+        self.status = tk.StringVar()
+        self.status_label = ttk.Label(self.button_frame, textvariable=self.status)
+        self.status_label.pack(side=tk.RIGHT, padx=5, pady=5)
+
         self.style = ttk.Style()
         self.style.configure("Treeview", font=("Helvetica", 10), foreground="black")
         self.style.configure("Treeview.Heading", font=("Helvetica", 12, "bold"))
         self.style.configure("TButton", font=("Helvetica", 10), padding=5)
 
     def clear_tree(self):
+        self.cancel_loading()
         for item in self.tree.get_children():
             self.tree.delete(item)
+        self.python_files.clear()
+        self.symbol_nodes.clear()
 
     def select_directory(self):
         path = filedialog.askdirectory()
@@ -67,40 +264,133 @@ class DirectoryTreeApp(tk.Tk):
             self.populate_tree(path)
 
     def populate_tree(self, startpath):
-        def insert_items(parent, path):
-            # Häufige Verzeichnisse, die ausgeschlossen werden sollen
-            excluded_dirs = {
-                '.venv', '.idea', '__pycache__', '.git', 'node_modules', 'build', 'dist',
-                'env', 'envs', 'venv', 'venvs', 'Lib', 'lib', 'bin', 'include', 'share',
-                'tmp', 'temp', 'logs', 'log', '.DS_Store', '__MACOSX', 'subpages', 'outputs'
-            }
-
-            # Häufige Dateinamen und Dateitypen, die ausgeschlossen werden sollen
-            excluded_files = {'__init__.py', 'creator.py', 'ArchivalZH'}
-            excluded_files_extensions = {
-                '.DS_Store', '.xls', '.xlsx', '.log', '.tmp', '.pyc', '.pyo', '.pyd', '.so', '.dll',
-                '.exe', '.db', '.sqlite', '.csv', '.json', '.xml', '.md', '.yaml',
-                '.yml', '.cfg', '.conf', '.ini', '.htm', '.css', '.js', '.map',
-                '.class', '.jar', '.war', '.ear', '.zip', '.tar', '.gz', '.bz2', '.rar',
-                '.7z', '.xz', '.iso', '.img', '.mov', '.mp4', '.flv', '.mpeg', '.pdf',
-                '.jpeg', '.jpg', '.png', '.gif'
-            }
-
-            for name in sorted(os.listdir(path)):
-                abspath = os.path.join(path, name)
-                isdir = os.path.isdir(abspath)
-                file_extension = os.path.splitext(name)[1]
-
-                if isdir and name not in excluded_dirs:
-                    oid = self.tree.insert(parent, 'end', text=name, open=False, tags=('dir',))
-                    insert_items(oid, abspath)
-                elif not isdir and name not in excluded_files and file_extension not in excluded_files_extensions:
-                    oid = self.tree.insert(parent, 'end', text=name, open=False, tags=('file',))
-                    if name.endswith('.py') and self.toggle_functions.get():
-                        self.insert_functions(oid, abspath)
-
         root_node = self.tree.insert('', 'end', text=startpath, open=True, tags=('dir',))
-        insert_items(root_node, startpath)
+        self.add_placeholder(root_node)
+        self.load_children(root_node)
+
+    def add_placeholder(self, node):
+        """Give an unloaded directory a placeholder child so that it can be opened."""
+        self.tree.insert(node, 'end', text=PLACEHOLDER, tags=('placeholder',))
+
+    def is_placeholder(self, item):
+        return 'placeholder' in self.tree.item(item, 'tags')
+
+    def is_loaded(self, node):
+        children = self.tree.get_children(node)
+        return not (children and self.is_placeholder(children[0]))
+
+    def on_open(self, event):
+        node = self.tree.focus()
+        if node and not self.is_loaded(node):
+            self.load_children(node)
+
+    def load_children(self, node, expand=False):
+        """Read a directory on a worker thread; its entries are inserted by process_results."""
+        if node in self.pending:
+            self.pending[node] = self.pending[node] or expand
+            return
+        for child in self.tree.get_children(node):
+            if not self.is_placeholder(child):
+                self.tree.delete(child)  # Left over from a cancelled load
+        self.pending[node] = expand
+        self.executor.submit(self.scan, self.generation, node, self.get_full_path(node))
+        self.update_status()
+
+    def scan(self, generation, node, path):
+        """Worker thread: list a directory and hand the entries to the Tk loop (never touches the widgets)."""
+        entries = scan_directory(path, lambda: generation != self.generation)
+        symbols = None  # Not looked up; the Tk loop requests them if the view is switched on meanwhile
+        if entries and self.show_functions:
+            symbols = self.index.lookup([os.path.join(path, name) for name, isdir in entries
+                                         if not isdir and name.endswith('.py')])
+        self.results.put((generation, node, path, entries, symbols))
+
+    def index_files(self, generation, files):
+        """Worker thread: look up the symbols of already listed Python files."""
+        symbols = self.index.lookup([file_path for _, file_path in files])
+        self.results.put((generation, None, None, [(oid, symbols.get(file_path, [])) for oid, file_path in files],
+                          None))
+
+    def process_results(self):
+        """Insert at most BATCH_SIZE scanned entries per run of the Tk loop."""
+        while True:
+            try:
+                self.batches.append(self.results.get_nowait())
+            except queue.Empty:
+                break
+
+        budget = BATCH_SIZE
+        while self.symbol_batches and budget:
+            generation, oid, symbols = self.symbol_batches.popleft()
+            if (generation == self.generation and self.show_functions and oid not in self.symbol_nodes
+                    and self.tree.exists(oid)):
+                self.symbol_nodes[oid] = self.insert_symbols(oid, symbols)
+                budget -= 1
+
+        while self.batches and budget:
+            generation, node, path, entries, symbols = self.batches[0]
+            if generation == self.generation and node is None:
+                # Symbols requested by toggle_functions_view or for entries scanned without them
+                self.symbol_batches.extend((generation, oid, symbols) for oid, symbols in entries)
+                self.batches.popleft()
+                continue
+            if generation != self.generation or entries is None or not self.tree.exists(node):
+                self.batches.popleft()
+                continue
+            expand = self.pending.get(node, False)
+            for name, isdir in entries[:budget]:
+                self.insert_entry(node, path, name, isdir, expand, symbols)
+            if len(entries) > budget:
+                self.batches[0] = (generation, node, path, entries[budget:], symbols)
+                budget = 0
+            else:
+                budget -= len(entries)
+                self.batches.popleft()
+                for child in self.tree.get_children(node):
+                    if self.is_placeholder(child):
+                        self.tree.delete(child)
+                self.pending.pop(node, None)
+
+        if self.unindexed:
+            self.executor.submit(self.index_files, self.generation, self.unindexed)
+            self.unindexed = []
+
+        self.update_status()
+        self.after(POLL_INTERVAL, self.process_results)
+
+    def insert_entry(self, parent, path, name, isdir, expand=False, symbols=None):
+        abspath = os.path.join(path, name)
+        if isdir:
+            oid = self.tree.insert(parent, 'end', text=name, open=expand, tags=('dir',))
+            self.add_placeholder(oid)
+            if expand:
+                self.load_children(oid, expand=True)
+        else:
+            oid = self.tree.insert(parent, 'end', text=name, open=False, tags=('file',))
+            if name.endswith('.py'):
+                self.python_files[oid] = abspath
+                if self.show_functions and symbols is None:
+                    self.unindexed.append((oid, abspath))  # View switched on after the directory was scanned
+                elif self.show_functions and abspath in symbols:
+                    self.symbol_nodes[oid] = self.insert_symbols(oid, symbols[abspath])
+
+    def cancel_loading(self):
+        """Stop all running loads; partially loaded directories are read again when reopened."""
+        self.generation += 1
+        self.pending.clear()
+        self.batches.clear()
+        self.symbol_batches.clear()
+        self.unindexed = []
+        self.update_status()
+
+    def update_status(self):
+        self.status.set(f"Loading {len(self.pending)} directories..." if self.pending else "")
+
+    def on_close(self):
+        self.cancel_loading()
+        self.executor.shutdown(wait=False)
+        self.index.close()
+        self.destroy()
 
     def copy_path(self):
         selected_item = self.tree.focus()
@@ -118,24 +408,45 @@ class DirectoryTreeApp(tk.Tk):
         return os.path.join(*path_parts)
 
     def toggle_functions_view(self):
-        if self.tree.get_children():
-            root_path = self.tree.item(self.tree.get_children()[0], 'text')
-            self.clear_tree()
-            self.populate_tree(root_path)
-
-    def insert_functions(self, parent, file_path):
-        try:
-            with open(file_path, "r", encoding="utf-8") as file:
-                node = ast.parse(file.read(), filename=file_path)
-                for item in node.body:
-                    if isinstance(item, ast.FunctionDef):
-                        self.tree.insert(parent, 'end', text=f"def {item.name}()", tags=('function',))
-        except Exception as e:
-            print(f"Error parsing {file_path}: {e}")
+        """Show or hide the symbols of the loaded Python files without reading the directories again."""
+        self.show_functions = self.toggle_functions.get()
+        for oid in [oid for oid in self.python_files if not self.tree.exists(oid)]:
+            del self.python_files[oid]
+            self.symbol_nodes.pop(oid, None)
+
+        if not self.show_functions:
+            for nodes in self.symbol_nodes.values():
+                if nodes:
+                    self.tree.detach(*nodes)
+            return
+
+        missing = []
+        for oid, file_path in self.python_files.items():
+            if oid in self.symbol_nodes:
+                for node in self.symbol_nodes[oid]:
+                    self.tree.move(node, oid, 'end')
+            else:
+                missing.append((oid, file_path))
+        if missing:
+            self.executor.submit(self.index_files, self.generation, missing)
+
+    def insert_symbols(self, parent, symbols):
+        """Insert symbol nodes (classes with their methods, functions) and return the top-level ones."""
+        nodes = []
+        for kind, name, children in symbols:
+            text = f"class {name}" if kind == 'class' else f"{kind} {name}()"
+            oid = self.tree.insert(parent, 'end', text=text, tags=('class' if kind == 'class' else 'function',))
+            self.insert_symbols(oid, children)
+            nodes.append(oid)
+        return nodes
 
     def toggle_expand(self, expand=True):
         def toggle_node(node):
+            if self.is_placeholder(node):
+                return
             self.tree.item(node, open=expand)
+            if expand and not self.is_loaded(node):
+                self.load_children(node, expand=True)  # Opens the subdirectories as they arrive
             for child in self.tree.get_children(node):
                 toggle_node(child)
 
@@ -152,7 +463,8 @@ class DirectoryTreeApp(tk.Tk):
         def recurse_tree(item, depth=0):
             structure = "    " * depth + self.tree.item(item, "text") + "\n"
             for child in self.tree.get_children(item):
-                structure += recurse_tree(child, depth + 1)
+                if not self.is_placeholder(child):
+                    structure += recurse_tree(child, depth + 1)
             return structure
 
         structure = ""
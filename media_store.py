@@ -0,0 +1,117 @@
+import os
+import re
+import json
+import shutil
+import hashlib
+import logging
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+MEDIA_STORE_DIRECTORY = '.media'  # Name des gemeinsamen Medienspeichers im Download-Verzeichnis
+HASH_CHUNK_SIZE = 1024 * 1024  # Bytes pro Lesevorgang beim Hashen
+
+
+def kaltura_entry_id(url):
+    """Return the Kaltura entry ID of a playManifest URL, or None for other URLs."""
+    match = re.search(r'/entryId/([^/?#]+)', urlsplit(url).path)
+    return match.group(1) if match else None
+
+
+def media_key(url):
+    """
+    Return a normalized key identifying the media behind a URL.
+
+    Kaltura URLs are identified by entry ID and flavor, independent of the delivery format and
+    protocol; other URLs are normalized (lower-case scheme/host, sorted query, no fragment).
+    """
+    entry_id = kaltura_entry_id(url)
+    if entry_id:
+        flavor = re.search(r'/flavorParamIds?/([^/?#]+)', urlsplit(url).path)
+        return f"kaltura:{entry_id}:{flavor.group(1) if flavor else 'default'}"
+    parts = urlsplit(url.strip())
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or '/', query, ''))
+
+
+def file_sha256(filepath):
+    """Return the SHA-256 of a file."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as file:
+        while chunk := file.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MediaStore:
+    """
+    Content-addressed store for processed media shared by all lessons.
+
+    Files live once under ``objects/<sha256><ext>``; ``keys/`` maps normalized media keys to their
+    object, and lesson directories only receive links to the objects.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.objects_directory = os.path.join(root, 'objects')
+        self.keys_directory = os.path.join(root, 'keys')
+        self.staging_directory = os.path.join(root, 'staging')
+        for directory in (self.objects_directory, self.keys_directory, self.staging_directory):
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def staging_counter(key):
+        """Return a stable file name prefix for staging the media of a key."""
+        return hashlib.sha1(key.encode()).hexdigest()[:12]
+
+    def _key_filepath(self, key, audio_format):
+        return os.path.join(self.keys_directory, f"{self.staging_counter(key)}-{audio_format}.json")
+
+    def lookup(self, key, audio_format):
+        """Return the stored object of a media key, or None if it was not processed yet."""
+        try:
+            with open(self._key_filepath(key, audio_format), 'r') as file:
+                record = json.load(file)
+        except (OSError, ValueError):
+            return None
+        object_path = os.path.join(self.objects_directory, record['object'])
+        return object_path if os.path.exists(object_path) else None
+
+    def add(self, key, audio_format, filepath):
+        """Move a processed file into the store and record it under the media key."""
+        sha256 = file_sha256(filepath)
+        object_path = os.path.join(self.objects_directory, sha256 + os.path.splitext(filepath)[1])
+        if os.path.exists(object_path):
+            os.remove(filepath)  # Same content already stored under another key
+        else:
+            os.replace(filepath, object_path)
+
+        key_filepath = self._key_filepath(key, audio_format)
+        with open(key_filepath + '.tmp', 'w') as file:
+            json.dump({'key': key, 'format': audio_format, 'sha256': sha256,
+                       'object': os.path.basename(object_path)}, file)
+        os.replace(key_filepath + '.tmp', key_filepath)
+        return object_path
+
+    @staticmethod
+    def link(object_path, target_path):
+        """
+        Make the object available at the target path (hard link, else symlink, else copy).
+
+        Raises FileNotFoundError if the object does not exist, so no dangling link is left behind.
+        """
+        if not os.path.isfile(object_path):
+            raise FileNotFoundError(f"Media object {object_path} does not exist.")
+        if os.path.lexists(target_path):
+            if os.path.exists(target_path) and os.path.samefile(object_path, target_path):
+                return target_path
+            os.remove(target_path)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        try:
+            os.link(object_path, target_path)
+        except OSError:
+            try:
+                os.symlink(os.path.abspath(object_path), target_path)
+            except OSError:
+                shutil.copy2(object_path, target_path)
+        return target_path
@@ -0,0 +1,259 @@
+"""
+Script Name: metrics.py
+
+Zweck des Skripts:
+Gemeinsame Messung für alle Stufen (Extraktion, Download, ffmpeg, Transkription). Jede Verarbeitung eines Elements
+wird als "Span" mit Stufe, Element, Dauer und Attributen (z.B. Bytes, CPU-Zeit von ffmpeg, Audiodauer) erfasst.
+Zusätzlich werden Messwerte wie Warteschlangenlänge und ausgelastete Worker festgehalten. Die Spans werden in eine
+JSONL-Datei geschrieben, die Summen als Datei für den Prometheus "textfile collector".
+
+Hauptfunktionen und -methoden:
+- configure: Aktiviert die Ausgabe in eine JSONL-Datei und/oder eine Prometheus-Datei.
+- span: Misst die Verarbeitung eines Elements in einer Stufe.
+- gauge: Setzt einen Messwert (z.B. Warteschlangenlänge).
+- Metrics.write_prometheus: Schreibt die aktuellen Summen im Prometheus-Textformat.
+
+Hinweise auf spezielle Implementierungsentscheidungen oder Sicherheitsaspekte:
+- Ohne configure werden nur Summen im Speicher geführt; die Messung kostet dann praktisch nichts.
+- configure hinterlegt die Pfade in Umgebungsvariablen, sodass auch Worker-Prozesse (Extraktion, Transkription)
+  ihre Spans in dieselbe JSONL-Datei schreiben. Die Prometheus-Datei schreibt nur der konfigurierende Prozess;
+  Worker-Prozesse werden dort über die Spans des Hauptprozesses erfasst, die ihre Aufträge umschliessen.
+- Die Prometheus-Datei wird atomar ersetzt, damit der Collector nie eine halb geschriebene Datei liest.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+TRACE_FILE_VARIABLE = 'STUDIUM_TRACE_FILE'
+METRIC_PREFIX = 'studium'
+PROMETHEUS_INTERVAL = 15.0  # Seconds between rewrites of the Prometheus file
+# Span attributes that are summed per stage; all other attributes only appear in the trace file
+SUMMED_ATTRIBUTES = ('bytes', 'urls', 'audio_seconds', 'cpu_seconds')
+
+
+class Span:
+    """
+    One measured unit of work; attributes can be set and counted while the span is open.
+    """
+
+    def __init__(self, stage: str, item: Optional[str], attributes: Dict[str, Any]):
+        self.stage = stage
+        self.item = item
+        self.attributes = attributes
+        self.start = time.time()
+        self.started = time.perf_counter()
+        self.duration: Optional[float] = None
+
+    def set(self, **attributes: Any) -> None:
+        """Set attributes of the span."""
+        self.attributes.update(attributes)
+
+    def add(self, name: str, value: float) -> None:
+        """Add a value to a numeric attribute, e.g. transferred bytes."""
+        self.attributes[name] = self.attributes.get(name, 0) + value
+
+    def elapsed(self) -> float:
+        """Seconds since the span started."""
+        return time.perf_counter() - self.started
+
+
+class Metrics:
+    """
+    Collects spans and gauges, appends spans to a JSONL trace file and writes a Prometheus textfile.
+    """
+
+    def __init__(self, trace_file: Optional[str] = None, prometheus_file: Optional[str] = None):
+        self.trace_file = trace_file
+        self.prometheus_file = prometheus_file
+        self._lock = threading.Lock()
+        self._trace = open(trace_file, 'a', encoding='utf-8', buffering=1) if trace_file else None
+        self._spans: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self._gauges: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self._written = time.monotonic()
+
+    @contextmanager
+    def span(self, stage: str, item: Optional[str] = None, **attributes: Any) -> Iterator[Span]:
+        """
+        Measure the processing of one item in a stage.
+
+        :param stage: Name of the stage, e.g. "download" or "inference".
+        :param item: The processed item, e.g. a URL or file path.
+        :param attributes: Initial attributes of the span.
+        :return: A context manager yielding the open span.
+        """
+        span = Span(stage, item, attributes)
+        try:
+            yield span
+        except BaseException as e:
+            span.set(error=type(e).__name__)
+            raise
+        finally:
+            span.duration = span.elapsed()
+            if span.attributes.get('bytes') and span.duration > 0:
+                span.set(bytes_per_second=span.attributes['bytes'] / span.duration)
+            self._record(span)
+
+    def _record(self, span: Span) -> None:
+        with self._lock:
+            totals = self._spans[span.stage]
+            totals['count'] += 1
+            totals['seconds'] += span.duration
+            totals['errors'] += 'error' in span.attributes
+            for name in SUMMED_ATTRIBUTES:
+                value = span.attributes.get(name)
+                if isinstance(value, (int, float)):
+                    totals[name] += value
+            if self._trace is not None:
+                record = {
+                    'stage': span.stage, 'item': span.item, 'start': span.start, 'duration': span.duration,
+                    'pid': os.getpid(), 'thread': threading.current_thread().name, **span.attributes,
+                }
+                self._trace.write(json.dumps(record, default=str) + '\n')
+            due = self.prometheus_file and time.monotonic() - self._written >= PROMETHEUS_INTERVAL
+        if due:
+            self.write_prometheus()
+
+    def gauge(self, name: str, value: float, **labels: Any) -> None:
+        """
+        Set a gauge, e.g. the depth of a queue or the number of busy workers.
+
+        :param name: Name of the gauge.
+        :param value: Current value.
+        :param labels: Labels distinguishing series of the gauge, e.g. stage="download".
+        """
+        with self._lock:
+            self._gauges[name, tuple(sorted((key, str(label)) for key, label in labels.items()))] = value
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        :return: The per-stage totals and the current gauges.
+        """
+        with self._lock:
+            return {
+                'stages': {stage: dict(totals) for stage, totals in self._spans.items()},
+                'gauges': {f"{name}{dict(labels)}": value for (name, labels), value in self._gauges.items()},
+            }
+
+    def write_prometheus(self, path: Optional[str] = None) -> None:
+        """
+        Write the per-stage totals and gauges in the Prometheus text format (atomically).
+
+        :param path: Target file; defaults to the configured Prometheus file.
+        """
+        path = path or self.prometheus_file
+        if not path:
+            return
+        with self._lock:
+            self._written = time.monotonic()
+            stages = {stage: dict(totals) for stage, totals in self._spans.items()}
+            gauges = dict(self._gauges)
+
+        lines = []
+        metrics = [('count', 'items_total', 'Processed items'), ('errors', 'errors_total', 'Failed items'),
+                   ('seconds', 'seconds_total', 'Time spent processing items')]
+        metrics += [(name, f"{name}_total", f"Sum of the {name} attribute") for name in SUMMED_ATTRIBUTES]
+        for key, suffix, description in metrics:
+            samples = [(stage, totals[key]) for stage, totals in sorted(stages.items()) if key in totals]
+            if not samples:
+                continue
+            metric = f"{METRIC_PREFIX}_stage_{suffix}"
+            lines += [f"# HELP {metric} {description} per stage.", f"# TYPE {metric} counter"]
+            lines += [f'{metric}{{stage="{_escape(stage)}"}} {value:g}' for stage, value in samples]
+
+        for name in sorted({name for name, _ in gauges}):
+            metric = f"{METRIC_PREFIX}_{_metric_name(name)}"
+            lines.append(f"# TYPE {metric} gauge")
+            for (gauge_name, labels), value in sorted(gauges.items()):
+                if gauge_name == name:
+                    rendered = ','.join(f'{_metric_name(key)}="{_escape(label)}"' for key, label in labels)
+                    lines.append(f"{metric}{{{rendered}}} {value:g}" if rendered else f"{metric} {value:g}")
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        temporary_file = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_file, 'w', encoding='utf-8') as file:
+            file.write('\n'.join(lines) + '\n')
+        os.replace(temporary_file, path)
+
+    def close(self) -> None:
+        """Write the Prometheus file a last time and close the trace file."""
+        self.write_prometheus()
+        with self._lock:
+            if self._trace is not None:
+                self._trace.close()
+                self._trace = None
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+_metrics: Optional[Metrics] = None
+_metrics_lock = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    global _metrics, _metrics_lock
+    _metrics = None  # A forked worker starts with its own metrics and never writes the parent's Prometheus file
+    _metrics_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def configure(trace_file: Optional[str] = None, prometheus_file: Optional[str] = None) -> Metrics:
+    """
+    Enable the trace and/or Prometheus output for this process and its worker processes.
+
+    :param trace_file: JSONL file receiving one line per span.
+    :param prometheus_file: File for the Prometheus textfile collector (should end in ".prom").
+    :return: The configured metrics.
+    """
+    global _metrics
+    with _metrics_lock:
+        if _metrics is not None:
+            _metrics.close()
+        if trace_file:
+            os.makedirs(os.path.dirname(os.path.abspath(trace_file)), exist_ok=True)
+            os.environ[TRACE_FILE_VARIABLE] = os.path.abspath(trace_file)
+        else:
+            os.environ.pop(TRACE_FILE_VARIABLE, None)
+        _metrics = Metrics(trace_file, prometheus_file)
+        return _metrics
+
+
+def get_metrics() -> Metrics:
+    """
+    :return: The metrics of this process; worker processes inherit the trace file of their parent.
+    """
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = Metrics(os.environ.get(TRACE_FILE_VARIABLE))
+    return _metrics
+
+
+def span(stage: str, item: Optional[str] = None, **attributes: Any):
+    """
+    Measure the processing of one item in a stage (see Metrics.span).
+    """
+    return get_metrics().span(stage, item, **attributes)
+
+
+def gauge(name: str, value: float, **labels: Any) -> None:
+    """
+    Set a gauge (see Metrics.gauge).
+    """
+    get_metrics().gauge(name, value, **labels)
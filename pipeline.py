@@ -0,0 +1,391 @@
+"""
+Script Name: pipeline.py
+
+Zweck des Skripts:
+Führt Extraktion, Download, Audio-Extraktion und Transkription als durchgehende Pipeline aus. Statt dass jede Stufe
+erst startet, wenn die vorherige alle Dateien geschrieben hat, fliesst jede gefundene Video-URL sofort weiter: die
+ersten Transkriptionen laufen bereits, während noch Seiten gelesen und Videos heruntergeladen werden. Die Laufzeit
+nähert sich so der langsamsten Stufe statt der Summe aller Stufen.
+
+Hauptfunktionen und -methoden:
+- PipelineStage: Eine Stufe mit eigener Worker-Anzahl und begrenzter Eingangswarteschlange.
+- Pipeline: Verbindet die Stufen "extract", "download", "audio" und "transcribe".
+- run_pipeline: Verarbeitet ein Quellverzeichnis mit HTML-Dateien vollständig.
+
+Hinweise auf spezielle Implementierungsentscheidungen oder Sicherheitsaspekte:
+- Die Warteschlangen zwischen den Stufen sind begrenzt. Ist eine Stufe ausgelastet, blockieren die vorherigen,
+  sodass z.B. nicht hunderte Videos auf der Platte liegen, während die Transkription hinterherhinkt.
+- I/O-lastige Stufen (Download) laufen in Threads, CPU-lastige Stufen (Extraktion, Transkription) in eigenen
+  Prozess-Pools; die Audio-Extraktion startet ffmpeg-Prozesse und ist deshalb nach der Anzahl der Kerne bemessen.
+- Im Streaming-Modus (Standard) liefert bereits die Download-Stufe die Audiodatei; die Audio-Stufe reicht sie
+  dann nur weiter.
+- Wie process_directory in download_videos.py lädt die Download-Stufe jedes Medium über den gemeinsamen
+  MediaStore (siehe media_store.py) nur einmal und verlinkt es in alle Lektionen, die darauf verweisen. Das Medium
+  wird dabei gleich in das Audioformat umgewandelt, die Audio-Stufe reicht die Dateien dann ebenfalls nur weiter.
+- Auch transkribiert wird jedes Medium nur einmal: weitere Lektionen mit demselben Medium warten auf die erste
+  Transkription und erhalten eine Kopie ihrer Ausgabedateien.
+- Mit einem JobLedger (siehe job_ledger.py) wird jeder Schritt je Medium festgehalten; nach einem Absturz setzt ein
+  erneuter Lauf bei den unerledigten Schritten fort.
+- Jede Stufe erfasst pro Element einen Span sowie Warteschlangenlänge und ausgelastete Worker (siehe metrics.py);
+  main schreibt diese als JSONL-Trace und als Prometheus-Datei neben die Kursverzeichnisse.
+- Die Ausgaben entsprechen denen der einzelnen Skripte (Link-Dateien, Audiodateien, Transkriptionen), sodass
+  diese weiterhin einzeln verwendet werden können.
+"""
+
+import logging
+import multiprocessing
+import os
+import queue
+import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import metrics
+from download_videos import (AUDIO_FORMATS, MAX_PER_HOST, DownloadEngine, audio_filepath_for, convert_audio,
+                             download_and_convert, fetch_into_store, video_filepath_for)
+from extract_videos import DEFAULT_FLAVOR_POLICY, process_file
+from job_ledger import JobLedger
+from media_store import MEDIA_STORE_DIRECTORY, MediaStore, media_key
+from transcribe_videos import (DEFAULT_MODEL_NAME, LEDGER_STAGE, _index_transcription, _init_process_worker,
+                               _record_outputs, _restore_from_cache, get_transcription_directory, save_transcription,
+                               transcribe_mp4)
+from transcript_cache import TranscriptCache
+from transcript_index import TranscriptIndex
+from transcript_writers import DEFAULT_OUTPUT_FORMATS, atomic_output, check_formats, output_path
+
+# Logging configuration
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DEFAULT_AUDIO_FORMAT = 'm4a'  # Kopiert die AAC-Spur ohne Neukodierung
+DEFAULT_QUEUE_SIZE = 32  # Elemente, die höchstens vor einer Stufe warten
+_DONE = object()  # Markiert das Ende der Eingabe einer Stufe
+
+
+def _worker_context() -> multiprocessing.context.BaseContext:
+    """
+    Start method for the worker processes of the pipeline.
+
+    The pools start their workers from stage threads while other stages launch ffmpeg. A plain fork at
+    that moment copies the pipe subprocess uses to report the exec of ffmpeg into the long-lived worker,
+    so the launching thread waits forever; "forkserver" starts workers from a clean, single-threaded process.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context()
+
+
+class PipelineStage:
+    """
+    One stage of the pipeline: a fixed number of worker threads reading from a bounded input queue.
+
+    The function of a stage maps one item to any number of items for the next stage. When the input is
+    finished and all workers are done, the next stage is finished as well.
+    """
+
+    def __init__(self, name: str, function: Callable[[Any], Optional[Iterable[Any]]], workers: int,
+                 next_stage: Optional["PipelineStage"] = None, queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.name = name
+        self.function = function
+        self.workers = max(1, workers)
+        self.next_stage = next_stage
+        self.input: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+        self.processed = 0
+        self.failed = 0
+        self._running = 0
+        self._busy = 0
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        """Start the worker threads."""
+        self._running = self.workers
+        metrics.gauge('pipeline_workers', self.workers, stage=self.name)
+        self._threads = [
+            threading.Thread(target=self._work, name=f"{self.name}-{index}", daemon=True)
+            for index in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def put(self, item: Any) -> None:
+        """
+        Hand an item to the stage, blocking while its input queue is full.
+
+        :param item: The item to process.
+        """
+        self.input.put(item)
+        metrics.gauge('pipeline_queue_depth', self.input.qsize(), stage=self.name)
+
+    def finish(self) -> None:
+        """Signal that no further items will arrive."""
+        for _ in range(self.workers):
+            self.input.put(_DONE)
+
+    def join(self) -> None:
+        """Wait until all workers of the stage have stopped."""
+        for thread in self._threads:
+            thread.join()
+
+    def _work(self) -> None:
+        try:
+            while True:
+                item = self.input.get()
+                metrics.gauge('pipeline_queue_depth', self.input.qsize(), stage=self.name)
+                if item is _DONE:
+                    break
+                with self._lock:
+                    self._busy += 1
+                    metrics.gauge('pipeline_busy_workers', self._busy, stage=self.name)
+                results = None
+                try:
+                    with metrics.span(f"pipeline.{self.name}", str(item)):
+                        results = list(self.function(item) or ())
+                except Exception as e:
+                    logging.error(f"Stage '{self.name}' failed for {item}: {e}")
+                finally:
+                    with self._lock:
+                        self._busy -= 1
+                        metrics.gauge('pipeline_busy_workers', self._busy, stage=self.name)
+                        self.processed += 1
+                        self.failed += results is None
+                if self.next_stage is not None:
+                    for result in results or ():
+                        self.next_stage.put(result)
+        finally:
+            # Also when a worker dies, the last one to stop must finish the next stage or the pipeline never ends
+            with self._lock:
+                self._running -= 1
+                last = not self._running
+            if last and self.next_stage is not None:
+                self.next_stage.finish()
+
+
+class Pipeline:
+    """
+    Streaming pipeline from HTML pages to transcriptions.
+
+    Items flowing between the stages:
+    extract: HTML file -> download: (url, lesson directory, counter) -> audio: media file -> transcribe: audio file
+    """
+
+    def __init__(self, source_directory: str, links_directory: str, download_directory: str,
+                 flavor_policy: str = DEFAULT_FLAVOR_POLICY, stream: bool = True,
+                 audio_format: str = DEFAULT_AUDIO_FORMAT, model_name: str = DEFAULT_MODEL_NAME,
+                 extract_workers: Optional[int] = None, download_workers: int = 16,
+                 max_per_host: int = MAX_PER_HOST, audio_workers: Optional[int] = None,
+                 transcribe_workers: int = 2, queue_size: int = DEFAULT_QUEUE_SIZE,
+                 cache: Optional[TranscriptCache] = None, ledger: Optional[JobLedger] = None,
+                 index: Optional[TranscriptIndex] = None, formats: Iterable[str] = DEFAULT_OUTPUT_FORMATS,
+                 use_store: bool = True):
+        cpu_count = os.cpu_count() or 1
+        self.source_directory = source_directory
+        self.links_directory = links_directory
+        self.download_directory = download_directory
+        self.flavor_policy = flavor_policy
+        self.stream = stream
+        self.audio_format = audio_format
+        self.model_name = model_name
+        self.cache = cache
+        self.ledger = ledger
+        self.index = index
+        self.formats = check_formats(formats)
+        self.store = MediaStore(os.path.join(download_directory, MEDIA_STORE_DIRECTORY)) if use_store else None
+        self._cache_keys: Dict[str, str] = {}  # One entry per audio file, written only by its transcribe worker
+        self._media_keys: Dict[str, str] = {}  # Downloaded or converted file -> media key
+        self._transcribed: Dict[str, Tuple[str, Optional[Dict[str, Any]]]] = {}  # Media key -> (file, transcription)
+        self._media_locks: Dict[str, threading.Lock] = {}
+        self._media_locks_lock = threading.Lock()
+
+        transcribe_workers = max(1, transcribe_workers)
+        extract_workers = extract_workers or max(1, cpu_count // 4)
+        self.extract_executor = ProcessPoolExecutor(max_workers=extract_workers, mp_context=_worker_context())
+        self.transcribe_executor = ProcessPoolExecutor(
+            max_workers=transcribe_workers, mp_context=_worker_context(), initializer=_init_process_worker,
+            initargs=(model_name, max(1, cpu_count // transcribe_workers))
+        )
+        self.engine = DownloadEngine(download_workers, max_per_host)
+
+        self.transcribe_stage = PipelineStage('transcribe', self._transcribe, transcribe_workers, None, queue_size)
+        self.audio_stage = PipelineStage('audio', self._convert, audio_workers or cpu_count, self.transcribe_stage,
+                                         queue_size)
+        self.download_stage = PipelineStage('download', self._download, download_workers, self.audio_stage,
+                                            queue_size)
+        self.extract_stage = PipelineStage('extract', self._extract, extract_workers, self.download_stage,
+                                           queue_size)
+        self.stages = [self.extract_stage, self.download_stage, self.audio_stage, self.transcribe_stage]
+
+    def _extract(self, html_file: str) -> List[Tuple[str, str, int]]:
+        """Extract the video URLs of a page and write its link file."""
+        video_urls = self.extract_executor.submit(
+            process_file, html_file, self.source_directory, self.links_directory, self.flavor_policy
+        ).result()
+        # One directory per page, like collect_video_urls_files
+        lesson_directory = os.path.join(self.download_directory,
+                                        os.path.splitext(os.path.relpath(html_file, self.source_directory))[0])
+        os.makedirs(lesson_directory, exist_ok=True)
+        return [(url, lesson_directory, counter) for counter, url in enumerate(video_urls, 1)]
+
+    def _job(self, stage: str, asset: str, function: Callable[..., Optional[str]], *args: Any) -> str:
+        """
+        Run one step of an asset, recorded in the job ledger if there is one.
+
+        :return: The result of the step (a file or directory path).
+        """
+        result = function(*args) if self.ledger is None else self.ledger.run(stage, asset, function, *args)
+        if result is None:
+            raise RuntimeError(f"{stage} of {asset} failed or is in progress elsewhere")
+        return result
+
+    def _download(self, job: Tuple[str, str, int]) -> List[str]:
+        """Fetch a video; in streaming mode or through the media store directly as audio file."""
+        url, lesson_directory, counter = job
+        audio_file = audio_filepath_for(video_filepath_for(url, lesson_directory, counter), self.audio_format)
+        key = media_key(url)
+        if self.store is None:
+            media_file = self._job('download', audio_file, self._fetch, url, lesson_directory, counter)
+            self._media_keys[media_file] = key
+            return [media_file]
+
+        self._media_keys[audio_file] = key
+        with self._media_lock(key):  # Further links to the same media wait for the first fetch and reuse it
+            object_path = self._job('download', f"{key}:{self.audio_format}", fetch_into_store, self.store, key,
+                                    url, self.engine, self.stream, self.audio_format)
+        return [self.store.link(object_path, audio_file)]
+
+    def _media_lock(self, key: str) -> threading.Lock:
+        with self._media_locks_lock:
+            return self._media_locks.setdefault(key, threading.Lock())
+
+    def _fetch(self, url: str, lesson_directory: str, counter: int) -> Optional[str]:
+        if self.stream:
+            return download_and_convert(url, lesson_directory, counter, self.engine, True, self.audio_format)
+        audio_file = audio_filepath_for(video_filepath_for(url, lesson_directory, counter), self.audio_format)
+        return audio_file if os.path.exists(audio_file) else self.engine.download(url, lesson_directory, counter)
+
+    def _convert(self, media_file: str) -> List[str]:
+        """Extract the audio of a downloaded video; audio files are passed on unchanged."""
+        if os.path.splitext(media_file)[1] == AUDIO_FORMATS[self.audio_format]['extension']:
+            return [media_file]
+        audio_file = self._job('audio', media_file, convert_audio, media_file, self.audio_format)
+        if media_file in self._media_keys:
+            self._media_keys[audio_file] = self._media_keys[media_file]
+        return [audio_file]
+
+    def _transcribe(self, audio_file: str) -> List[str]:
+        """Transcribe an audio file."""
+        self._job(LEDGER_STAGE, audio_file, self._transcribe_file, audio_file)
+        return []
+
+    def _transcribe_file(self, audio_file: str) -> Optional[str]:
+        """Transcribe an audio file once per media; further lessons with the same media get a copy."""
+        key = self._media_keys.get(audio_file)
+        if key is None:
+            return self._transcribe_media(audio_file)[0]
+        with self._media_lock(f"transcribe:{key}"):  # Wait for a transcription of the same media in progress
+            if key in self._transcribed:
+                return self._copy_transcription(*self._transcribed[key], audio_file)
+            transcription_directory, transcription = self._transcribe_media(audio_file)
+            if transcription_directory is not None:
+                self._transcribed[key] = (audio_file, transcription)
+            return transcription_directory
+
+    def _copy_transcription(self, source_file: str, transcription: Optional[Dict[str, Any]],
+                            audio_file: str) -> str:
+        """Copy the output files of another lesson's transcription of the same media and index them."""
+        source_directory = get_transcription_directory(source_file, self.download_directory)
+        transcription_directory = get_transcription_directory(audio_file, self.download_directory)
+        os.makedirs(transcription_directory, exist_ok=True)
+        for name in self.formats:
+            with atomic_output(output_path(transcription_directory, name)) as temporary_path:
+                shutil.copy2(output_path(source_directory, name), temporary_path)
+        if transcription is not None:
+            _index_transcription(audio_file, transcription, self.download_directory, self.index)
+        logging.info(f"Copied the transcription of {source_file} to {transcription_directory}.")
+        return transcription_directory
+
+    def _transcribe_media(self, audio_file: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        Transcribe an audio file unless its transcription can be restored from the cache.
+
+        :return: The transcription directory (None on failure) and, if known, the transcription result.
+        """
+        cache_options = {'model_name': self.model_name, 'chunked': False}
+        transcription_directory = get_transcription_directory(audio_file, self.download_directory)
+        if _restore_from_cache(audio_file, self.download_directory, self.cache, self._cache_keys, self.index,
+                               self.formats, **cache_options):
+            return transcription_directory, self.cache.get(self._cache_keys[audio_file])
+
+        transcription = self.transcribe_executor.submit(transcribe_mp4, audio_file, model_name=self.model_name).result()
+        if not transcription:
+            return None, None
+        output_files = save_transcription(audio_file, transcription, self.download_directory, self.formats)
+        _record_outputs(audio_file, transcription, output_files, self.download_directory, self.cache,
+                        self._cache_keys.get(audio_file), self.index)
+        return transcription_directory, transcription
+
+    def run(self) -> Dict[str, Dict[str, int]]:
+        """
+        Feed all HTML files of the source directory into the pipeline and wait until everything is processed.
+
+        :return: Number of processed and failed items per stage.
+        """
+        for stage in self.stages:
+            stage.start()
+        try:
+            for root, _, files in os.walk(self.source_directory):
+                for file in sorted(files):
+                    if file.endswith('.html'):
+                        self.extract_stage.put(os.path.join(root, file))
+            self.extract_stage.finish()
+            for stage in self.stages:
+                stage.join()
+        finally:
+            self.extract_executor.shutdown()
+            self.transcribe_executor.shutdown()
+            self.engine.close()
+            metrics.get_metrics().write_prometheus()
+
+        statistics = {stage.name: {'processed': stage.processed, 'failed': stage.failed} for stage in self.stages}
+        for name, counts in statistics.items():
+            logging.info(f"Stage '{name}': {counts['processed']} processed, {counts['failed']} failed.")
+        return statistics
+
+
+def run_pipeline(source_directory: str, links_directory: str, download_directory: str,
+                 **options: Any) -> Dict[str, Dict[str, int]]:
+    """
+    Extract, download, convert and transcribe all videos of a source directory in one streaming run.
+
+    :param source_directory: Directory with the HTML files of the course.
+    :param links_directory: Directory receiving the link files.
+    :param download_directory: Directory receiving the audio files and, below "transcriptions", the transcriptions.
+    :param options: Further options of Pipeline (worker counts, queue size, audio format, model, cache, ledger,
+                    search index, output formats, media store).
+    :return: Number of processed and failed items per stage.
+    """
+    return Pipeline(source_directory, links_directory, download_directory, **options).run()
+
+
+def main() -> None:
+    """
+    Main function running the whole pipeline on the course directories.
+    """
+    base_directory = "/Users/python/Python Projekte/Studium Digitale"
+    tracing = metrics.configure(os.path.join(base_directory, "trace.jsonl"),
+                                os.path.join(base_directory, "pipeline.prom"))
+    cache = TranscriptCache()
+    ledger = JobLedger()
+    index = TranscriptIndex()
+    try:
+        run_pipeline(os.path.join(base_directory, "source"), os.path.join(base_directory, "links"),
+                     os.path.join(base_directory, "Downloads"), cache=cache, ledger=ledger, index=index)
+    finally:
+        index.close()
+        ledger.close()
+        cache.close()
+        tracing.close()
+
+
+if __name__ == "__main__":
+    main()
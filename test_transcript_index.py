@@ -0,0 +1,41 @@
+import os
+
+from download_videos import audio_filepath_for, collect_video_urls_files, read_video_urls, video_filepath_for
+from transcript_index import TranscriptIndex, lesson_path
+
+CHAPTER = "a) Daten und Information"
+URL = "https://cdnapisec.kaltura.com/p/1/sp/100/playManifest/entryId/1_abcdef12/format/url/protocol/https"
+
+
+def _download_layout(tmp_path):
+    """Write a link file like extract_videos and return the audio file download_videos would produce for it."""
+    links_directory = tmp_path / "links"
+    download_directory = tmp_path / "Downloads"
+    (links_directory / CHAPTER).mkdir(parents=True)
+    (links_directory / CHAPTER / "5 Statistik.txt").write_text(URL + "\n", encoding='utf-8')
+
+    [(video_urls_file, audio_download_path)] = collect_video_urls_files(str(links_directory), str(download_directory))
+    [url] = read_video_urls(video_urls_file)
+    return audio_filepath_for(video_filepath_for(url, audio_download_path, 1), 'mp3'), str(download_directory)
+
+
+def test_lesson_path_keeps_the_page(tmp_path):
+    audio_file, download_directory = _download_layout(tmp_path)
+    assert os.path.isdir(os.path.dirname(audio_file))
+    assert lesson_path(audio_file, download_directory) == f"{CHAPTER}/5 Statistik"
+
+
+def test_search_by_page_lesson(tmp_path):
+    audio_file, download_directory = _download_layout(tmp_path)
+    transcription = {'text': "Der Median ist robust.",
+                     'segments': [{'start': 1.5, 'end': 4.0, 'text': " Der Median ist robust."}]}
+    index = TranscriptIndex(str(tmp_path / "index.sqlite"))
+    try:
+        assert index.add(audio_file, transcription, lesson_path(audio_file, download_directory))
+        [hit] = index.search("Median", lesson=f"{CHAPTER}/5 Statistik")
+        assert hit['lesson'] == f"{CHAPTER}/5 Statistik"
+        assert hit['start_ms'] == 1500
+        assert index.search("Median", lesson=f"{CHAPTER}/6 Qualitative Datenanalyse") == []
+        assert len(index.search("Median", lesson=CHAPTER)) == 1
+    finally:
+        index.close()
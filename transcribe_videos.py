@@ -3,15 +3,23 @@ Script Name: transcription.py
 
 Zweck des Skripts:
 Dieses Skript dient zur parallelen Transkription von MP4-Dateien im Ordner "Downloads" mittels der Whisper API.
-Die parallele Verarbeitung erfolgt mit Hilfe der Bibliotheken "dask" und "concurrent.futures", um eine effiziente und schnelle
-Verarbeitung der Dateien zu gewährleisten. Die Transkriptionen werden in einer Ordnerstruktur gespeichert, die der Struktur im
+Die parallele Verarbeitung erfolgt mit Hilfe von "concurrent.futures" (Prozess- oder Thread-Pool), um eine effiziente und
+schnelle Verarbeitung der Dateien zu gewährleisten. Die Transkriptionen werden in einer Ordnerstruktur gespeichert, die der Struktur im
 "Downloads" Ordner entspricht, und sowohl als .txt als auch .docx Dateien gespeichert.
 
 Hauptfunktionen und -methoden:
 - find_mp4_files: Sucht alle MP4-Dateien im angegebenen Verzeichnis.
+- load_worker_model / ModelPool: Laden das Whisper-Modell einmal pro Worker und verwenden es für alle Dateien wieder.
+- decode_audio: Dekodiert die Tonspur mit ffmpeg direkt in den Speicher (16 kHz, mono, float32).
+- iter_audio_segments: Zerlegt lange Aufnahmen an Sprechpausen in Segmente begrenzter Länge.
 - transcribe_mp4: Führt die Transkription einer einzelnen MP4-Datei durch.
-- save_transcription: Speichert die Transkription im gewünschten Format und Verzeichnis.
+- save_transcription: Speichert die Transkription in den gewünschten Formaten (siehe transcript_writers.py).
 - parallel_transcription: Verarbeitet alle gefundenen MP4-Dateien parallel.
+  Mit einem TranscriptCache (siehe transcript_cache.py) werden unveränderte Dateien nicht erneut transkribiert,
+  mit einem JobLedger (siehe job_ledger.py) überspringt ein erneuter Lauf die bereits erledigten Dateien.
+  Mit einem TranscriptIndex (siehe transcript_index.py) wird jede Transkription samt Zeitstempeln durchsuchbar.
+  Die Ausgabedateien (standardmässig .txt und .docx, auf Wunsch auch .srt, .vtt und .json) schreibt ein eigener
+  Writer-Pool.
 
 Übersicht über den Ablauf des Skripts:
 1. Importieren der benötigten Bibliotheken.
@@ -22,26 +30,55 @@ Hauptfunktionen und -methoden:
 6. Aufrufen der Hauptfunktion zur Ausführung des Skripts.
 
 Hinweise auf spezielle Implementierungsentscheidungen oder Sicherheitsaspekte:
-- Die Verwendung von "dask" und "concurrent.futures" gewährleistet eine effiziente Parallelverarbeitung.
+- Jeder Worker lädt das Whisper-Modell genau einmal. Im Prozess-Backend (Standard) besitzt jeder Prozess sein eigenes
+  Modell und umgeht so den GIL; im Thread-Backend teilen sich die Threads einen Pool mit einer festen Anzahl Modelle.
+- Die Tonspur wird ohne temporäre WAV-Datei und ohne Dekodierung des Videobildes an Whisper übergeben.
+- Laden des Modells, Dekodierung und Inferenz (mit Echtzeitfaktor) werden als Spans erfasst (siehe metrics.py).
+- Im segmentierten Modus werden lange Vorlesungen an Pausen geteilt, parallel transkribiert und mit korrigierten
+  Zeitstempeln wieder zusammengesetzt; der Speicherbedarf bleibt dabei unabhängig von der Länge der Aufnahme begrenzt.
 - Typannotationen und umfassende Fehlerbehandlung erhöhen die Robustheit und Lesbarkeit des Codes.
 - Die Transkriptionen werden in einer Ordnerstruktur gespeichert, die der Struktur im "Downloads" Ordner entspricht.
 - Die Transkriptionen berücksichtigen Anglizismen und versuchen, diese korrekt zu transkribieren.
 """
 
 import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import List
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from functools import partial
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
 import whisper
 import logging
-
-from dask.dataframe.io.tests.test_sql import db
-from docx import Document
-import moviepy.editor as mp
 import re
 
+import metrics
+from job_ledger import JobLedger
+from transcript_cache import TranscriptCache
+from transcript_index import TranscriptIndex, lesson_path
+from transcript_writers import (DEFAULT_OUTPUT_FORMATS, DEFAULT_WRITER_WORKERS, OutputWriter, output_path,
+                                write_outputs)
+
 # Logging configuration
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+DEFAULT_MODEL_NAME = "base"
+SAMPLE_RATE = 16000  # Whisper operates on 16 kHz mono audio
+READ_CHUNK_SIZE = 1 << 20  # Bytes read from the ffmpeg pipe at once
+TRANSCRIPTION_BACKENDS = ("process", "thread")
+LEDGER_STAGE = "transcribe"  # Stage name of the transcription jobs in the job ledger
+
+# Splitting of long recordings into segments
+DEFAULT_SEGMENT_SECONDS = 300  # Upper bound for the length of one segment
+SILENCE_SEARCH_SECONDS = 30  # Look for the quietest spot within the last seconds of a segment
+SILENCE_FRAME_SECONDS = 0.1  # Frame length for the energy analysis
+
+# Models loaded by this process, keyed by model name (one per process worker)
+_worker_models: Dict[str, whisper.Whisper] = {}
+_worker_models_lock = threading.Lock()
+
 def find_mp4_files(directory: str) -> List[str]:
     """
     Find all MP4 files in the specified directory and its subdirectories.
@@ -55,17 +92,233 @@ def find_mp4_files(directory: str) -> List[str]:
     logging.info(f"Found {len(mp4_files)} MP4 files.")
     return mp4_files
 
-def extract_audio_from_video(file_path: str) -> str:
+def load_worker_model(model_name: str = DEFAULT_MODEL_NAME) -> whisper.Whisper:
     """
-    Extract audio from the given MP4 file and save it as a temporary WAV file.
+    Return the Whisper model of the current worker process, loading it on first use.
 
-    :param file_path: Path to the MP4 file.
-    :return: Path to the extracted audio WAV file.
+    :param model_name: Name of the Whisper model (e.g. "tiny", "base", "small").
+    :return: The loaded Whisper model.
+    """
+    with _worker_models_lock:
+        if model_name not in _worker_models:
+            logging.info(f"Loading Whisper model '{model_name}' in process {os.getpid()}.")
+            with metrics.span('model_load', model_name):
+                _worker_models[model_name] = whisper.load_model(model_name)
+        return _worker_models[model_name]
+
+def _init_process_worker(model_name: str, torch_threads: int) -> None:
+    """
+    Initializer for process pool workers: split the cores between the workers and preload the model.
+
+    :param model_name: Name of the Whisper model to load.
+    :param torch_threads: Number of intra-op threads torch may use in this worker.
+    """
+    import torch
+    torch.set_num_threads(torch_threads)
+    load_worker_model(model_name)
+
+class ModelPool:
+    """
+    A fixed number of Whisper model instances shared by the threads of a thread pool.
+
+    Each thread borrows a model for the duration of one transcription, so at most
+    ``instances`` models are held in memory regardless of the number of files.
+    Models are loaded on first demand, so a run without any work loads none.
+    """
+
+    def __init__(self, model_name: str = DEFAULT_MODEL_NAME, instances: int = 1):
+        self.model_name = model_name
+        self.instances = instances
+        self._models: List[whisper.Whisper] = []  # Loaded models not borrowed at the moment
+        self._loaded = 0  # Models loaded or being loaded
+        self._available = threading.Condition()
+
+    @contextmanager
+    def model(self) -> Iterator[whisper.Whisper]:
+        """
+        Borrow a model from the pool and return it afterwards.
+
+        A failed load frees its slot again, so a later borrower (or one already waiting) loads the model instead.
+
+        :return: A context manager yielding a Whisper model.
+        """
+        with self._available:
+            while not self._models and self._loaded >= self.instances:
+                self._available.wait()
+            model = self._models.pop() if self._models else None
+            if model is None:
+                self._loaded += 1
+        if model is None:
+            logging.info(f"Loading Whisper model '{self.model_name}' into the model pool.")
+            try:
+                with metrics.span('model_load', self.model_name):
+                    model = whisper.load_model(self.model_name)
+            except BaseException:
+                with self._available:
+                    self._loaded -= 1
+                    self._available.notify()
+                raise
+        try:
+            yield model
+        finally:
+            with self._available:
+                self._models.append(model)
+                self._available.notify()
+
+    def transcribe(self, file_path: str) -> Dict[str, Any]:
+        """
+        Transcribe a file with a borrowed model.
+
+        :param file_path: Path to the MP4 file.
+        :return: The transcription result (see transcribe_mp4).
+        """
+        with self.model() as model:
+            return transcribe_mp4(file_path, model=model)
+
+    def transcribe_audio(self, audio: np.ndarray, offset: float = 0.0) -> Dict[str, Any]:
+        """
+        Transcribe decoded audio with a borrowed model.
+
+        :param audio: The audio samples.
+        :param offset: Position of the audio within the recording in seconds.
+        :return: The transcription result (see transcribe_audio).
+        """
+        with self.model() as model:
+            return transcribe_audio(audio, offset=offset, model=model)
+
+def _open_audio_stream(file_path: str, sample_rate: int = SAMPLE_RATE) -> Tuple[subprocess.Popen, IO[bytes]]:
+    """
+    Start ffmpeg decoding the audio track of a media file to raw mono float32 samples on stdout.
+
+    The error messages go to a temporary file rather than a pipe: a damaged file can produce more of them
+    than a pipe holds, and ffmpeg would block on them while the caller is still reading stdout.
+
+    :param file_path: Path to the media file.
+    :param sample_rate: Target sample rate in Hz.
+    :return: The running ffmpeg process and the temporary file receiving its error messages.
+    """
+    command = [
+        'ffmpeg', '-nostdin', '-loglevel', 'error', '-threads', '0',
+        '-i', file_path, '-vn', '-sn', '-dn',
+        '-f', 'f32le', '-acodec', 'pcm_f32le', '-ac', '1', '-ar', str(sample_rate), 'pipe:1'
+    ]
+    stderr = tempfile.TemporaryFile()
+    try:
+        return subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr), stderr
+    except BaseException:
+        stderr.close()
+        raise
+
+def _close_audio_stream(process: subprocess.Popen, stderr_file: IO[bytes], file_path: str) -> None:
+    """
+    Wait for an ffmpeg decoding process and raise if it failed.
+
+    :param process: The ffmpeg process started by _open_audio_stream.
+    :param stderr_file: The file receiving the error messages of the process.
+    :param file_path: Path to the decoded media file (for the error message).
     """
-    video = mp.VideoFileClip(file_path)
-    audio_path = file_path.replace('.mp4', '.wav')
-    video.audio.write_audiofile(audio_path)
-    return audio_path
+    if process.wait() != 0:
+        stderr_file.seek(0)
+        stderr = stderr_file.read()
+        raise RuntimeError(f"ffmpeg failed to decode {file_path}: {stderr.decode(errors='replace').strip()}")
+
+def _stop_audio_stream(process: subprocess.Popen, stderr_file: IO[bytes]) -> None:
+    """
+    Kill an ffmpeg decoding process that is still running (its output was not read to the end) and clean up.
+
+    :param process: The ffmpeg process started by _open_audio_stream.
+    :param stderr_file: The file receiving the error messages of the process.
+    """
+    if process.poll() is None:
+        process.kill()
+        process.wait()
+    process.stdout.close()
+    stderr_file.close()
+
+def decode_audio(file_path: str, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    Decode the audio track of a media file into memory as mono float32 samples.
+
+    ffmpeg only demuxes and decodes the audio stream and writes raw samples to a pipe,
+    so neither the video frames are decoded nor a temporary file is written.
+
+    :param file_path: Path to the media file.
+    :param sample_rate: Target sample rate in Hz.
+    :return: The audio samples in the range [-1, 1].
+    """
+    with metrics.span('decode', file_path) as span:
+        process, stderr_file = _open_audio_stream(file_path, sample_rate)
+        try:
+            buffer = bytearray()
+            while chunk := process.stdout.read(READ_CHUNK_SIZE):
+                buffer += chunk
+            _close_audio_stream(process, stderr_file, file_path)
+        finally:
+            _stop_audio_stream(process, stderr_file)
+        audio = np.frombuffer(buffer, dtype=np.float32)
+        span.set(audio_seconds=len(audio) / sample_rate)
+    return audio
+
+def find_silence(audio: np.ndarray, start: int, end: int, sample_rate: int = SAMPLE_RATE) -> int:
+    """
+    Find the quietest position of the audio between two sample indices.
+
+    :param audio: The audio samples.
+    :param start: First sample index to consider.
+    :param end: Sample index after the last one to consider.
+    :param sample_rate: Sample rate of the audio in Hz.
+    :return: Sample index in the middle of the frame with the lowest energy.
+    """
+    frame = max(1, int(SILENCE_FRAME_SECONDS * sample_rate))
+    frames = (end - start) // frame
+    if frames < 1:
+        return end
+    window = audio[start:start + frames * frame].reshape(frames, frame)
+    energy = np.square(window).mean(axis=1)
+    return start + int(np.argmin(energy)) * frame + frame // 2
+
+def iter_audio_segments(file_path: str, max_segment_seconds: float = DEFAULT_SEGMENT_SECONDS,
+                        sample_rate: int = SAMPLE_RATE) -> Iterator[Tuple[float, np.ndarray]]:
+    """
+    Decode a media file progressively and split its audio at pauses into segments of bounded length.
+
+    Only one segment is buffered at a time, so memory use does not depend on the length of the recording.
+
+    :param file_path: Path to the media file.
+    :param max_segment_seconds: Maximum length of a segment in seconds.
+    :param sample_rate: Target sample rate in Hz.
+    :return: An iterator of (offset in seconds, audio samples) tuples in recording order.
+    """
+    max_samples = max(1, int(max_segment_seconds * sample_rate))
+    search_samples = min(int(SILENCE_SEARCH_SECONDS * sample_rate), max_samples // 2)
+    buffer = np.empty(max_samples, dtype=np.float32)
+    view = memoryview(buffer).cast('B')
+    filled = 0  # Bytes in the buffer
+    offset = 0  # Samples already yielded
+
+    process, stderr_file = _open_audio_stream(file_path, sample_rate)
+    try:
+        while True:
+            read = process.stdout.readinto(view[filled:])
+            filled += read
+            if read and filled < len(view):
+                continue
+
+            samples = filled // buffer.itemsize
+            if not read:
+                if samples:
+                    yield offset / sample_rate, buffer[:samples].copy()
+                break
+
+            cut = find_silence(buffer, samples - search_samples, samples, sample_rate)
+            yield offset / sample_rate, buffer[:cut].copy()
+            remainder = samples - cut
+            buffer[:remainder] = buffer[cut:samples]
+            filled = remainder * buffer.itemsize
+            offset += cut
+        _close_audio_stream(process, stderr_file, file_path)
+    finally:
+        _stop_audio_stream(process, stderr_file)
 
 def clean_transcription(text: str) -> str:
     """
@@ -80,70 +333,416 @@ def clean_transcription(text: str) -> str:
     logging.info("Cleaned transcription text.")
     return text
 
-def transcribe_mp4(file_path: str) -> str:
+def transcribe_audio(audio: np.ndarray, offset: float = 0.0, model: Optional[whisper.Whisper] = None,
+                     model_name: str = DEFAULT_MODEL_NAME) -> Dict[str, Any]:
+    """
+    Transcribe decoded audio and shift the segment timestamps by its position in the recording.
+
+    :param audio: The audio samples.
+    :param offset: Position of the audio within the recording in seconds.
+    :param model: Already loaded Whisper model; if omitted, the model of the current worker is used.
+    :param model_name: Name of the Whisper model to use when no model is given.
+    :return: A dict with the raw "text" and the Whisper "segments".
+    """
+    if model is None:
+        model = load_worker_model(model_name)
+    audio_seconds = len(audio) / SAMPLE_RATE
+    with metrics.span('inference', offset=offset, audio_seconds=audio_seconds) as span:
+        result = model.transcribe(audio)
+        if audio_seconds:
+            span.set(real_time_factor=span.elapsed() / audio_seconds)
+    segments = [
+        dict(segment, start=segment['start'] + offset, end=segment['end'] + offset)
+        for segment in result['segments']
+    ]
+    return {'text': result['text'], 'segments': segments}
+
+def stitch_transcriptions(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Join the transcriptions of consecutive segments into one transcription.
+
+    :param results: Results of transcribe_audio in recording order.
+    :return: A dict with the cleaned "text" and the renumbered "segments".
+    """
+    text = ' '.join(result['text'].strip() for result in results)
+    segments = [segment for result in results for segment in result['segments']]
+    for index, segment in enumerate(segments):
+        segment['id'] = index
+    return {'text': clean_transcription(text), 'segments': segments}
+
+def transcribe_mp4(file_path: str, model: Optional[whisper.Whisper] = None,
+                   model_name: str = DEFAULT_MODEL_NAME) -> Dict[str, Any]:
     """
     Transcribe the given MP4 file using Whisper API.
 
     :param file_path: Path to the MP4 file.
-    :return: The transcription result as a string.
+    :param model: Already loaded Whisper model; if omitted, the model of the current worker is used.
+    :param model_name: Name of the Whisper model to use when no model is given.
+    :return: A dict with the cleaned "text" and the Whisper "segments", or an empty dict on failure.
     """
     try:
-        audio_path = extract_audio_from_video(file_path)
-        model = whisper.load_model("base")
-        result = model.transcribe(audio_path)
-        transcription = result['text']
-        transcription = clean_transcription(transcription)
-        os.remove(audio_path)  # Clean up the temporary audio file
+        audio = decode_audio(file_path)
+        transcription = stitch_transcriptions([transcribe_audio(audio, model=model, model_name=model_name)])
         logging.info(f"Transcription completed for {file_path}.")
         return transcription
     except Exception as e:
         logging.error(f"Error transcribing {file_path}: {e}")
-        return ""
+        return {}
 
-def save_transcription(file_path: str, transcription: str, base_directory: str) -> None:
+def get_transcription_directory(file_path: str, base_directory: str) -> str:
     """
-    Save the transcription to a .txt and .docx file in a structured directory.
+    Return the directory receiving the transcription files of an MP4 file.
 
     :param file_path: Path to the original MP4 file.
-    :param transcription: The transcription text.
     :param base_directory: The base directory to save the transcriptions.
+    :return: Path to the transcription directory.
     """
     relative_path = os.path.relpath(file_path, base_directory)
-    transcription_path = os.path.join(base_directory, 'transcriptions', os.path.splitext(relative_path)[0])
+    return os.path.join(base_directory, 'transcriptions', os.path.splitext(relative_path)[0])
+
+def save_transcription(file_path: str, transcription: Any, base_directory: str,
+                       formats: Iterable[str] = DEFAULT_OUTPUT_FORMATS) -> List[str]:
+    """
+    Save the transcription in the given formats in a structured directory.
+
+    :param file_path: Path to the original MP4 file.
+    :param transcription: The transcription result (text and segments) or only the transcription text.
+    :param base_directory: The base directory to save the transcriptions.
+    :param formats: Names of the output formats (see transcript_writers.OUTPUT_FORMATS).
+    :return: Paths of the written files.
+    """
+    if isinstance(transcription, str):
+        transcription = {'text': transcription, 'segments': []}
+    output_files = write_outputs(transcription, get_transcription_directory(file_path, base_directory), formats)
+    logging.info(f"Transcription saved to {', '.join(output_files)}.")
+    return output_files
+
+def _record_outputs(file_path: str, transcription: Dict[str, Any], output_files: List[str], base_directory: str,
+                    cache: Optional[TranscriptCache], cache_key: Optional[str],
+                    index: Optional[TranscriptIndex]) -> None:
+    """
+    Add the written transcription to the transcript cache and the search index.
+
+    :param file_path: Path to the original MP4 file.
+    :param transcription: The transcription result (text and segments).
+    :param output_files: Paths of the written output files.
+    :param base_directory: The base directory to save the transcriptions.
+    :param cache: The transcript cache, if caching is enabled.
+    :param cache_key: Cache key of the file.
+    :param index: The transcript search index, if transcripts are indexed.
+    """
+    if cache is not None and cache_key is not None:
+        cache.put(cache_key, transcription, output_files)
+    _index_transcription(file_path, transcription, base_directory, index)
+
+class _PendingOutputs:
+    """
+    Transcriptions handed to the writer pool whose files are not written yet.
+
+    The files are written on the writer threads; the cache, the search index and the ledger are only updated
+    once all files of a transcription exist, from the thread collecting the finished writes.
+    """
+
+    def __init__(self, writer: OutputWriter, base_directory: str, cache: Optional[TranscriptCache],
+                 cache_keys: Dict[str, str], ledger: Optional[JobLedger] = None,
+                 index: Optional[TranscriptIndex] = None):
+        self.writer = writer
+        self.base_directory = base_directory
+        self.cache = cache
+        self.cache_keys = cache_keys
+        self.ledger = ledger
+        self.index = index
+        self._pending: Dict[Future, Tuple[str, Dict[str, Any]]] = {}
+
+    def submit(self, file_path: str, transcription: Dict[str, Any]) -> None:
+        """
+        Queue the output files of a finished transcription.
+
+        :param file_path: Path to the original MP4 file.
+        :param transcription: The transcription result (text and segments).
+        """
+        directory = get_transcription_directory(file_path, self.base_directory)
+        self._pending[self.writer.submit(transcription, directory)] = (file_path, transcription)
+
+    def collect(self, block: bool = False) -> None:
+        """
+        Record the transcriptions whose files are written.
+
+        :param block: Wait for all queued writes instead of only collecting those already finished.
+        """
+        futures = as_completed(list(self._pending)) if block else [f for f in list(self._pending) if f.done()]
+        for future in futures:
+            file_path, transcription = self._pending.pop(future)
+            try:
+                output_files = future.result()
+            except Exception as e:
+                logging.error(f"Error saving the transcription of {file_path}: {e}")
+                _record_transcription(file_path, self.base_directory, self.ledger, f"{type(e).__name__}: {e}")
+                continue
+            logging.info(f"Transcription saved to {', '.join(output_files)}.")
+            _record_outputs(file_path, transcription, output_files, self.base_directory, self.cache,
+                            self.cache_keys.get(file_path), self.index)
+            _record_transcription(file_path, self.base_directory, self.ledger)
+
+def _index_transcription(file_path: str, transcription: Dict[str, Any], base_directory: str,
+                         index: Optional[TranscriptIndex]) -> None:
+    """
+    Add a transcription to the search index; a failing index never fails the transcription.
+
+    :param file_path: Path to the original MP4 file.
+    :param transcription: The transcription result (text and segments).
+    :param base_directory: The base directory to save the transcriptions.
+    :param index: The transcript search index, if transcripts are indexed.
+    """
+    if index is None:
+        return
+    try:
+        index.add(file_path, transcription, lesson_path(file_path, base_directory))
+    except Exception as e:
+        logging.error(f"Error indexing the transcription of {file_path}: {e}")
+
+def _restore_from_cache(file_path: str, base_directory: str, cache: Optional[TranscriptCache],
+                        cache_keys: Dict[str, str], index: Optional[TranscriptIndex] = None,
+                        formats: Iterable[str] = DEFAULT_OUTPUT_FORMATS, **options: Any) -> bool:
+    """
+    Restore the transcription files of an unchanged MP4 file from the cache.
+
+    The cache key of a miss is remembered in ``cache_keys`` so the result can be stored later.
+    Only the requested formats are restored; those the cached entry lacks are written from the cached transcription.
+
+    :param file_path: Path to the MP4 file.
+    :param base_directory: The base directory to save the transcriptions.
+    :param cache: The transcript cache, if caching is enabled.
+    :param cache_keys: Mapping of MP4 files to their cache keys.
+    :param index: The transcript search index; restored transcriptions are indexed as well.
+    :param formats: Names of the output formats to restore.
+    :param options: Model name and transcription options that make up the cache key.
+    :return: True if the file was restored and needs no transcription.
+    """
+    if cache is None:
+        return False
+    try:
+        cache_keys[file_path] = cache.key(file_path, **options)
+    except OSError as e:
+        logging.error(f"Cannot compute cache key for {file_path}: {e}")
+        return False
+    transcription_directory = get_transcription_directory(file_path, base_directory)
+    if cache.restore(cache_keys[file_path], transcription_directory, formats):
+        logging.info(f"Restored transcription of {file_path} from the cache.")
+        missing = [name for name in formats if not os.path.exists(output_path(transcription_directory, name))]
+        if index is not None or missing:
+            transcription = cache.get(cache_keys[file_path])
+            if transcription:
+                write_outputs(transcription, transcription_directory, missing)
+                _index_transcription(file_path, transcription, base_directory, index)
+        return True
+    return False
 
-    os.makedirs(transcription_path, exist_ok=True)
+def _claim_transcription(file_path: str, ledger: Optional[JobLedger]) -> bool:
+    """
+    Claim the transcription job of a file in the job ledger.
 
-    txt_file = os.path.join(transcription_path, 'transcription.txt')
-    docx_file = os.path.join(transcription_path, 'transcription.docx')
+    :param file_path: Path to the MP4 file.
+    :param ledger: The job ledger, if jobs are recorded.
+    :return: True if the file should be transcribed, False if it is done or processed by another worker.
+    """
+    if ledger is None or ledger.begin(LEDGER_STAGE, file_path)[0]:  # Reruns done jobs whose directory is gone
+        return True
+    logging.info(f"Skipping {file_path}: transcription already done or in progress.")
+    return False
 
-    with open(txt_file, 'w', encoding='utf-8') as f:
-        f.write(transcription)
+def _record_transcription(file_path: str, base_directory: str, ledger: Optional[JobLedger],
+                          error: Optional[str] = None) -> None:
+    """
+    Record the outcome of a claimed transcription job in the job ledger.
 
-    doc = Document()
-    doc.add_heading('Transcription', 0)
-    doc.add_paragraph(transcription)
-    doc.save(docx_file)
+    :param file_path: Path to the MP4 file.
+    :param base_directory: The base directory to save the transcriptions.
+    :param ledger: The job ledger, if jobs are recorded.
+    :param error: Description of the failure, or None on success.
+    """
+    if ledger is None:
+        return
+    if error is None:
+        # Stored as absolute path, so a later claim can tell whether the transcription still exists
+        ledger.complete(LEDGER_STAGE, file_path,
+                        os.path.abspath(get_transcription_directory(file_path, base_directory)),
+                        os.path.getsize(file_path))
+    else:
+        ledger.fail(LEDGER_STAGE, file_path, error)
+
+def _gather_futures(futures: List[Future]) -> Future:
+    """
+    Combine several futures into one that resolves to the list of their results in order.
+
+    :param futures: The futures to combine.
+    :return: A future that completes once all given futures have completed.
+    """
+    combined: Future = Future()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def on_done(_: Future) -> None:
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        try:
+            combined.set_result([future.result() for future in futures])
+        except Exception as e:
+            combined.set_exception(e)
 
-    logging.info(f"Transcription saved to {txt_file} and {docx_file}.")
+    if not futures:
+        combined.set_result([])
+    for future in futures:
+        future.add_done_callback(on_done)
+    return combined
+
+def _save_finished(pending: Dict[Future, str], outputs: _PendingOutputs, block: bool) -> None:
+    """
+    Stitch the segment transcriptions of all files whose segments are finished and queue their output files.
 
-def parallel_transcription(mp4_files: List[str], base_directory: str, max_workers: int = 8) -> None:
+    :param pending: Mapping of combined segment futures to their MP4 file; finished entries are removed.
+    :param outputs: The transcriptions waiting for their output files.
+    :param block: Wait for all pending files and writes instead of only collecting those already finished.
+    """
+    futures = as_completed(pending) if block else [future for future in pending if future.done()]
+    for future in futures:
+        file = pending.pop(future)
+        try:
+            results = future.result()
+            if results:
+                outputs.submit(file, stitch_transcriptions(results))
+                logging.info(f"Transcription completed for {file} ({len(results)} segments).")
+            else:
+                _record_transcription(file, outputs.base_directory, outputs.ledger, "no audio")
+        except Exception as e:
+            logging.error(f"Error processing file {file}: {e}")
+            _record_transcription(file, outputs.base_directory, outputs.ledger, f"{type(e).__name__}: {e}")
+    outputs.collect(block)
+
+def _transcribe_in_segments(mp4_files: List[str], submit_segment: Callable[..., Future], max_in_flight: int,
+                            max_segment_seconds: float, outputs: _PendingOutputs,
+                            cache_options: Dict[str, Any]) -> None:
+    """
+    Split every file at pauses and distribute the segments over the workers.
+
+    :param mp4_files: List of paths to MP4 files.
+    :param submit_segment: Submits transcribe_audio(audio, offset=...) to the workers.
+    :param max_in_flight: Maximum number of decoded segments waiting for or in transcription.
+    :param max_segment_seconds: Maximum length of a segment in seconds.
+    :param outputs: The transcriptions waiting for their output files, with the cache, ledger and index.
+    :param cache_options: Model name and transcription options that make up the cache key.
+    """
+    slots = threading.BoundedSemaphore(max_in_flight)
+    pending: Dict[Future, str] = {}
+    base_directory, ledger = outputs.base_directory, outputs.ledger
+
+    for file in mp4_files:
+        if not _claim_transcription(file, ledger):
+            continue
+        if _restore_from_cache(file, base_directory, outputs.cache, outputs.cache_keys, outputs.index,
+                               outputs.writer.formats, **cache_options):
+            _record_transcription(file, base_directory, ledger)
+            continue
+        futures = []
+        try:
+            for offset, segment in iter_audio_segments(file, max_segment_seconds):
+                slots.acquire()
+                future = submit_segment(segment, offset=offset)
+                future.add_done_callback(lambda _: slots.release())
+                futures.append(future)
+        except Exception as e:
+            logging.error(f"Error transcribing {file}: {e}")
+            _record_transcription(file, base_directory, ledger, f"{type(e).__name__}: {e}")
+            continue
+        pending[_gather_futures(futures)] = file
+        _save_finished(pending, outputs, False)
+
+    _save_finished(pending, outputs, True)
+
+def parallel_transcription(mp4_files: List[str], base_directory: str, max_workers: int = 8,
+                           model_name: str = DEFAULT_MODEL_NAME, backend: str = "process",
+                           chunked: bool = False, max_segment_seconds: float = DEFAULT_SEGMENT_SECONDS,
+                           cache: Optional[TranscriptCache] = None, ledger: Optional[JobLedger] = None,
+                           index: Optional[TranscriptIndex] = None, formats: Iterable[str] = DEFAULT_OUTPUT_FORMATS,
+                           writer_workers: int = DEFAULT_WRITER_WORKERS,
+                           model_instances: Optional[int] = None) -> None:
     """
     Transcribe MP4 files in parallel and save the transcriptions.
 
+    Every worker process loads the model once and reuses it for all files it receives; the threads of
+    the thread backend share ``model_instances`` models. The output files are written by a separate
+    writer pool while the next results are collected.
+
     :param mp4_files: List of paths to MP4 files.
     :param base_directory: The base directory to save the transcriptions.
-    :param max_workers: Maximum number of parallel workers.
+    :param max_workers: Maximum number of parallel workers (model instances of the process backend).
+    :param model_name: Name of the Whisper model to use.
+    :param backend: "process" to run one worker process per model, "thread" to share a model pool between threads.
+    :param chunked: Split long recordings at pauses and transcribe the segments in parallel.
+    :param max_segment_seconds: Maximum length of a segment in chunked mode.
+    :param cache: Transcript cache; files with a cached transcription are restored instead of transcribed.
+    :param ledger: Job ledger; files transcribed by an earlier run are skipped and every outcome is recorded.
+    :param index: Transcript search index receiving every new or restored transcription.
+    :param formats: Names of the output formats, e.g. ("txt", "json") to skip the Word documents.
+    :param writer_workers: Number of threads writing output files.
+    :param model_instances: Number of models shared by the threads of the thread backend (default: one per
+        worker); ignored by the process backend.
     """
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_file = {executor.submit(transcribe_mp4, file): file for file in mp4_files}
+    if backend not in TRANSCRIPTION_BACKENDS:
+        raise ValueError(f"Unknown transcription backend '{backend}', expected one of {TRANSCRIPTION_BACKENDS}.")
+    if not mp4_files:
+        return
+    if not chunked:
+        max_workers = min(max_workers, len(mp4_files))
+    max_workers = max(1, max_workers)
+
+    if backend == "process":
+        torch_threads = max(1, (os.cpu_count() or 1) // max_workers)
+        executor = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_process_worker,
+                                       initargs=(model_name, torch_threads))
+        submit_file = partial(executor.submit, transcribe_mp4, model_name=model_name)
+        submit_segment = partial(executor.submit, transcribe_audio, model_name=model_name)
+    else:
+        pool = ModelPool(model_name, instances=max(1, min(model_instances or max_workers, max_workers)))
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        submit_file = partial(executor.submit, pool.transcribe)
+        submit_segment = partial(executor.submit, pool.transcribe_audio)
+
+    cache_options: Dict[str, Any] = {'model_name': model_name, 'chunked': chunked}
+    if chunked:
+        cache_options['max_segment_seconds'] = max_segment_seconds
+
+    with executor, OutputWriter(formats, writer_workers) as writer:
+        cache_keys: Dict[str, str] = {}
+        outputs = _PendingOutputs(writer, base_directory, cache, cache_keys, ledger, index)
+        if chunked:
+            _transcribe_in_segments(mp4_files, submit_segment, 2 * max_workers, max_segment_seconds, outputs,
+                                    cache_options)
+            return
+
+        future_to_file = {}
+        for file in mp4_files:
+            if not _claim_transcription(file, ledger):
+                continue
+            if _restore_from_cache(file, base_directory, cache, cache_keys, index, writer.formats, **cache_options):
+                _record_transcription(file, base_directory, ledger)
+                continue
+            future_to_file[submit_file(file)] = file
         for future in as_completed(future_to_file):
             file = future_to_file[future]
             try:
                 transcription = future.result()
                 if transcription:
-                    save_transcription(file, transcription, base_directory)
+                    outputs.submit(file, transcription)
+                else:
+                    _record_transcription(file, base_directory, ledger, "no transcription")
             except Exception as e:
                 logging.error(f"Error processing file {file}: {e}")
+                _record_transcription(file, base_directory, ledger, f"{type(e).__name__}: {e}")
+            outputs.collect()
+        outputs.collect(block=True)
 
 def main():
     """
@@ -152,13 +751,17 @@ def main():
     directory = os.path.expanduser("~/Downloads")
     mp4_files = find_mp4_files(directory)
 
-    # Using dask bag to parallelize the transcription task
-    bag = db.from_sequence(mp4_files).map(transcribe_mp4)
-    transcriptions = bag.compute()
-
-    # Save transcriptions
-    for file, transcription in zip(mp4_files, transcriptions):
-        save_transcription(file, transcription, directory)
+    # One worker process per model instance, each loading the model only once
+    cache = TranscriptCache()
+    ledger = JobLedger()
+    index = TranscriptIndex()
+    try:
+        parallel_transcription(mp4_files, directory, max_workers=4, model_name=DEFAULT_MODEL_NAME, backend="process",
+                               chunked=True, cache=cache, ledger=ledger, index=index)
+    finally:
+        index.close()
+        ledger.close()
+        cache.close()
 
 if __name__ == "__main__":
     main()
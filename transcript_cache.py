@@ -0,0 +1,295 @@
+"""
+Script Name: transcript_cache.py
+
+Zweck des Skripts:
+Inhaltsadressierter Cache für Transkriptionen. Der Schlüssel eines Eintrags besteht aus dem Hash des Medieninhalts,
+dem Namen des Whisper-Modells und den Transkriptionsoptionen. Bei einem Treffer werden Dekodierung und Inferenz
+vollständig übersprungen und die gespeicherten Ausgabedateien der gewünschten Formate wiederhergestellt.
+
+Hauptfunktionen und -methoden:
+- TranscriptCache.key: Berechnet den Cache-Schlüssel einer Mediendatei.
+- TranscriptCache.restore: Stellt die Ausgabedateien eines Eintrags wieder her.
+- TranscriptCache.put: Legt das Ergebnis und die Ausgabedateien einer Transkription im Cache ab.
+- TranscriptCache.invalidate: Entfernt Einträge einzelner Dateien oder den gesamten Cache.
+- main: Kommandozeile ("stats", "invalidate", "evict").
+
+Hinweise auf spezielle Implementierungsentscheidungen oder Sicherheitsaspekte:
+- Die Inhalts-Hashes werden zusätzlich nach Pfad, Grösse und Änderungszeit gemerkt, damit unveränderte Dateien bei
+  einem erneuten Durchlauf nicht noch einmal vollständig gelesen werden müssen.
+- Überschreitet der Cache die maximale Grösse, werden die am längsten nicht verwendeten Einträge entfernt.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from transcript_writers import OUTPUT_FORMATS, atomic_output
+
+# Logging configuration
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DEFAULT_CACHE_DIRECTORY = os.path.expanduser("~/.cache/studium-digitale/transcripts")
+DEFAULT_MAX_CACHE_BYTES = 2 * 1024 ** 3  # 2 GiB
+HASH_CHUNK_SIZE = 1 << 20  # Bytes read at once while hashing media files
+RESULT_FILE = 'result.json'
+
+
+class TranscriptCache:
+    """
+    Persistent transcript cache keyed by media content, model name and transcription options.
+
+    Entries live in ``<directory>/entries/<key>/`` together with the produced output files;
+    an SQLite index keeps track of their size and last use for the eviction. The cache may be shared
+    by several threads; the index is guarded by an internal lock, hashing and file copies run outside it.
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIRECTORY, max_bytes: int = DEFAULT_MAX_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(directory, 'entries'), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, 'index.sqlite'), check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                content TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_content ON entries (content);
+            CREATE TABLE IF NOT EXISTS file_hashes (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                digest TEXT NOT NULL
+            );
+        """)
+
+    def close(self) -> None:
+        """Close the index database."""
+        with self._lock:
+            self._db.close()
+
+    def content_hash(self, file_path: str) -> str:
+        """
+        Return the SHA-256 of a media file, reusing the stored hash while size and mtime are unchanged.
+
+        :param file_path: Path to the media file.
+        :return: The hex digest of the file content.
+        """
+        path = os.path.abspath(file_path)
+        stat = os.stat(path)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT digest FROM file_hashes WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (path, stat.st_size, stat.st_mtime_ns)
+            ).fetchone()
+        if row:
+            return row[0]
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            while chunk := file.read(HASH_CHUNK_SIZE):
+                digest.update(chunk)
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, digest) VALUES (?, ?, ?, ?)",
+                (path, stat.st_size, stat.st_mtime_ns, digest.hexdigest())
+            )
+        return digest.hexdigest()
+
+    def key(self, file_path: str, model_name: str, **options: Any) -> str:
+        """
+        Compute the cache key of a media file.
+
+        :param file_path: Path to the media file.
+        :param model_name: Name of the Whisper model.
+        :param options: Transcription options that influence the result.
+        :return: The cache key.
+        """
+        description = {'content': self.content_hash(file_path), 'model': model_name, 'options': options}
+        return f"{description['content']}-{hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()[:16]}"
+
+    def _entry_directory(self, key: str) -> str:
+        return os.path.join(self.directory, 'entries', key)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up the transcription result of a cache entry.
+
+        :param key: The cache key.
+        :return: The stored transcription result, or None on a cache miss.
+        """
+        result_file = os.path.join(self._entry_directory(key), RESULT_FILE)
+        if not self._touch(key) or not os.path.exists(result_file):
+            return None
+        with open(result_file, 'r', encoding='utf-8') as file:
+            return json.load(file)
+
+    def restore(self, key: str, output_directory: str, formats: Optional[Iterable[str]] = None) -> bool:
+        """
+        Copy the output files of a cache entry into the given directory, each file atomically.
+
+        :param key: The cache key.
+        :param output_directory: Directory receiving the output files.
+        :param formats: Names of the output formats to restore (see transcript_writers.OUTPUT_FORMATS);
+            all stored files if omitted. Formats the entry lacks are skipped.
+        :return: True on a cache hit, False on a miss.
+        """
+        entry_directory = self._entry_directory(key)
+        if not self._touch(key) or not os.path.isdir(entry_directory):
+            return False
+        if formats is None:
+            names = [name for name in os.listdir(entry_directory) if name != RESULT_FILE]
+        else:
+            names = [OUTPUT_FORMATS[name][0] for name in formats]
+        os.makedirs(output_directory, exist_ok=True)
+        for name in names:
+            cached_file = os.path.join(entry_directory, name)
+            if os.path.exists(cached_file):
+                with atomic_output(os.path.join(output_directory, name)) as temporary_path:
+                    shutil.copy2(cached_file, temporary_path)
+        return True
+
+    def put(self, key: str, result: Dict[str, Any], output_files: List[str]) -> None:
+        """
+        Store a transcription result and its output files, evicting old entries if necessary.
+
+        :param key: The cache key.
+        :param result: The transcription result (text and segments).
+        :param output_files: Paths of the written output files.
+        """
+        entry_directory = self._entry_directory(key)
+        temporary_directory = f"{entry_directory}.tmp-{os.getpid()}-{threading.get_ident()}"
+        shutil.rmtree(temporary_directory, ignore_errors=True)
+        os.makedirs(temporary_directory)
+        for output_file in output_files:
+            shutil.copy2(output_file, temporary_directory)
+        with open(os.path.join(temporary_directory, RESULT_FILE), 'w', encoding='utf-8') as file:
+            json.dump(result, file, ensure_ascii=False)
+
+        size = sum(entry.stat().st_size for entry in os.scandir(temporary_directory))
+
+        # Move an older entry aside instead of deleting it in place: a concurrent writer of the same key may
+        # store its entry in between, which is then kept (both hold the same transcription)
+        stale_directory = f"{entry_directory}.old-{os.getpid()}-{threading.get_ident()}"
+        try:
+            os.replace(entry_directory, stale_directory)
+        except FileNotFoundError:
+            pass
+        try:
+            os.replace(temporary_directory, entry_directory)
+        except OSError:
+            if not os.path.isdir(entry_directory):
+                raise
+            shutil.rmtree(temporary_directory, ignore_errors=True)
+        shutil.rmtree(stale_directory, ignore_errors=True)
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, content, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, key.split('-')[0], size, time.time())
+            )
+        self.evict()
+
+    def _touch(self, key: str) -> bool:
+        with self._lock, self._db:
+            return self._db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key)).rowcount > 0
+
+    def _remove(self, keys: List[str]) -> None:
+        for key in keys:
+            shutil.rmtree(self._entry_directory(key), ignore_errors=True)
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key in keys])
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def size(self) -> int:
+        """
+        :return: The total size of all cache entries in bytes.
+        """
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def evict(self, max_bytes: Optional[int] = None) -> int:
+        """
+        Remove the least recently used entries until the cache fits into the size limit.
+
+        :param max_bytes: Size limit in bytes; defaults to the limit of the cache.
+        :return: The number of removed entries.
+        """
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        excess = self.size() - limit
+        victims = []
+        with self._lock:
+            for key, size in self._db.execute("SELECT key, size FROM entries ORDER BY last_used"):
+                if excess <= 0:
+                    break
+                victims.append(key)
+                excess -= size
+        self._remove(victims)
+        if victims:
+            logging.info(f"Evicted {len(victims)} transcript cache entries.")
+        return len(victims)
+
+    def invalidate(self, file_paths: Optional[List[str]] = None) -> int:
+        """
+        Remove the entries of the given media files (for all models and options), or all entries.
+
+        :param file_paths: Paths to media files; if omitted, the whole cache is cleared.
+        :return: The number of removed entries.
+        """
+        digests = None if file_paths is None else [self.content_hash(file_path) for file_path in file_paths]
+        with self._lock:
+            if digests is None:
+                keys = [row[0] for row in self._db.execute("SELECT key FROM entries")]
+            else:
+                keys = [
+                    row[0]
+                    for digest in digests
+                    for row in self._db.execute("SELECT key FROM entries WHERE content = ?", (digest,))
+                ]
+        self._remove(keys)
+        logging.info(f"Invalidated {len(keys)} transcript cache entries.")
+        return len(keys)
+
+
+def main() -> None:
+    """
+    Command line interface to inspect, invalidate and shrink the transcript cache.
+    """
+    parser = argparse.ArgumentParser(description="Manage the transcript cache.")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIRECTORY, help="Directory of the cache.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('stats', help="Show number and size of the cache entries.")
+    invalidate = commands.add_parser('invalidate', help="Remove the entries of media files.")
+    invalidate.add_argument('files', nargs='*', help="Media files whose transcripts should be invalidated.")
+    invalidate.add_argument('--all', action='store_true', help="Clear the whole cache.")
+    evict = commands.add_parser('evict', help="Shrink the cache to a size limit.")
+    evict.add_argument('--max-bytes', type=int, default=DEFAULT_MAX_CACHE_BYTES, help="Size limit in bytes.")
+    args = parser.parse_args()
+
+    cache = TranscriptCache(args.cache_dir)
+    try:
+        if args.command == 'stats':
+            print(f"{len(cache)} entries, {cache.size() / 1024 ** 2:.1f} MiB in {cache.directory}")
+        elif args.command == 'invalidate':
+            if not args.files and not args.all:
+                parser.error("invalidate needs media files or --all")
+            cache.invalidate(None if args.all else args.files)
+        elif args.command == 'evict':
+            cache.evict(args.max_bytes)
+    finally:
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Script Name: transcript_index.py
+
+Zweck des Skripts:
+Volltextindex über alle erzeugten Transkriptionen. Jedes Whisper-Segment wird mit seinen Zeitstempeln und dem Pfad der
+Lektion (aus der Ordnerstruktur, z.B. "a) Daten und Information/5 Statistik") in einer SQLite-FTS5-Tabelle abgelegt.
+Eine Suche liefert die passenden Stellen nach Relevanz sortiert mit ihrer Position im Video in Millisekunden.
+
+Hauptfunktionen und -methoden:
+- TranscriptIndex.add: Nimmt die Transkription einer Mediendatei auf oder ersetzt sie.
+- TranscriptIndex.search: Sucht Segmente und liefert Treffer mit Lektion, Datei und Zeitversatz.
+- TranscriptIndex.remove: Entfernt die Transkriptionen einzelner Mediendateien.
+- main: Kommandozeile ("search", "stats", "remove").
+
+Hinweise auf spezielle Implementierungsentscheidungen oder Sicherheitsaspekte:
+- Der Index wird fortlaufend aktualisiert: jede neue Transkription ersetzt nur die Segmente ihrer eigenen Datei,
+  unveränderte Transkriptionen werden anhand eines Hashes übersprungen.
+- Die Segmente liegen in einer gewöhnlichen Tabelle, die FTS5-Tabelle verweist darauf ("external content") und wird
+  über Trigger synchron gehalten. So bleibt das Ersetzen einer Transkription unabhängig von der Grösse des Index.
+- Suchbegriffe werden standardmässig als einzelne Wörter gesucht; mit --raw steht die FTS5-Syntax zur Verfügung
+  (z.B. Präfixe "statist*", "OR", "NEAR").
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+# Logging configuration
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DEFAULT_INDEX_PATH = os.path.expanduser("~/.cache/studium-digitale/transcripts.sqlite")
+DEFAULT_SEARCH_LIMIT = 20
+
+
+def lesson_path(file_path: str, base_directory: str) -> str:
+    """
+    Return the lesson of a media file, i.e. its directory relative to the download directory.
+
+    The downloads of a page are kept in a directory named after it (see collect_video_urls_files),
+    so the lesson ends with the page.
+
+    :param file_path: Path to the media file.
+    :param base_directory: The download directory mirroring the course structure.
+    :return: The lesson path with "/" as separator, e.g. "a) Daten und Information/5 Statistik".
+    """
+    return os.path.dirname(os.path.relpath(file_path, base_directory)).replace(os.sep, '/')
+
+
+def format_offset(milliseconds: int) -> str:
+    """
+    Format a time offset as [h:]mm:ss.
+
+    :param milliseconds: The offset in milliseconds.
+    :return: The formatted offset.
+    """
+    minutes, seconds = divmod(milliseconds // 1000, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+
+class TranscriptIndex:
+    """
+    SQLite FTS5 index of transcript segments with their time offsets and lessons.
+
+    The index may be shared by several threads; every access is serialized by an internal lock.
+    """
+
+    def __init__(self, path: str = DEFAULT_INDEX_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS transcripts (
+                id INTEGER PRIMARY KEY,
+                media TEXT NOT NULL UNIQUE,
+                lesson TEXT NOT NULL,
+                title TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                indexed REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS segments (
+                id INTEGER PRIMARY KEY,
+                transcript_id INTEGER NOT NULL REFERENCES transcripts (id) ON DELETE CASCADE,
+                start_ms INTEGER NOT NULL,
+                end_ms INTEGER NOT NULL,
+                text TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS segments_transcript ON segments (transcript_id);
+            CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts USING fts5(
+                text, content='segments', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+            );
+            CREATE TRIGGER IF NOT EXISTS segments_insert AFTER INSERT ON segments BEGIN
+                INSERT INTO segments_fts (rowid, text) VALUES (new.id, new.text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS segments_delete AFTER DELETE ON segments BEGIN
+                INSERT INTO segments_fts (segments_fts, rowid, text) VALUES ('delete', old.id, old.text);
+            END;
+        """)
+
+    def close(self) -> None:
+        """Close the index database."""
+        with self._lock:
+            self._db.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM transcripts").fetchone()[0]
+
+    def add(self, file_path: str, transcription: Dict[str, Any], lesson: str) -> bool:
+        """
+        Add the transcription of a media file to the index, replacing an earlier one.
+
+        :param file_path: Path to the media file.
+        :param transcription: The transcription result with "text" and Whisper "segments".
+        :param lesson: The lesson of the file (see lesson_path).
+        :return: True if the index changed, False if the same transcription was already indexed.
+        """
+        media = os.path.abspath(file_path)
+        segments = [
+            (round(segment['start'] * 1000), round(segment['end'] * 1000), segment['text'].strip())
+            for segment in transcription.get('segments') or ()
+            if segment.get('text', '').strip()
+        ]
+        if not segments and transcription.get('text', '').strip():
+            segments = [(0, 0, transcription['text'].strip())]  # No timestamps: index the text as a whole
+        digest = hashlib.sha256(json.dumps([lesson, segments]).encode()).hexdigest()
+        title = os.path.splitext(os.path.basename(media))[0]
+
+        with self._lock, self._db:
+            row = self._db.execute("SELECT id, digest FROM transcripts WHERE media = ?", (media,)).fetchone()
+            if row and row[1] == digest:
+                return False
+            if row:
+                self._db.execute("DELETE FROM segments WHERE transcript_id = ?", (row[0],))
+                self._db.execute(
+                    "UPDATE transcripts SET lesson = ?, title = ?, digest = ?, indexed = ? WHERE id = ?",
+                    (lesson, title, digest, time.time(), row[0])
+                )
+                transcript_id = row[0]
+            else:
+                transcript_id = self._db.execute(
+                    "INSERT INTO transcripts (media, lesson, title, digest, indexed) VALUES (?, ?, ?, ?, ?)",
+                    (media, lesson, title, digest, time.time())
+                ).lastrowid
+            self._db.executemany(
+                "INSERT INTO segments (transcript_id, start_ms, end_ms, text) VALUES (?, ?, ?, ?)",
+                [(transcript_id, *segment) for segment in segments]
+            )
+        logging.info(f"Indexed {len(segments)} segments of {media}.")
+        return True
+
+    def remove(self, file_paths: List[str]) -> int:
+        """
+        Remove the transcriptions of the given media files.
+
+        :param file_paths: Paths to media files.
+        :return: The number of removed transcriptions.
+        """
+        with self._lock, self._db:
+            return sum(
+                self._db.execute("DELETE FROM transcripts WHERE media = ?", (os.path.abspath(path),)).rowcount
+                for path in file_paths
+            )
+
+    def search(self, query: str, limit: int = DEFAULT_SEARCH_LIMIT, lesson: Optional[str] = None,
+               raw: bool = False) -> List[Dict[str, Any]]:
+        """
+        Search the transcript segments, best matches first.
+
+        :param query: Words that must all occur in a segment, or an FTS5 query if ``raw`` is set.
+        :param limit: Maximum number of hits.
+        :param lesson: Only search lessons starting with this path.
+        :param raw: Pass the query to FTS5 unchanged.
+        :return: Hits with lesson, media file, title, start_ms, end_ms, snippet and score (lower is better).
+        """
+        if not raw:
+            query = ' '.join('"' + word.replace('"', '""') + '"' for word in query.split())
+        if not query:
+            return []
+        sql = """
+            SELECT t.lesson, t.media, t.title, s.start_ms, s.end_ms,
+                   snippet(segments_fts, 0, '[', ']', '...', 16), bm25(segments_fts)
+            FROM segments_fts
+            JOIN segments s ON s.id = segments_fts.rowid
+            JOIN transcripts t ON t.id = s.transcript_id
+            WHERE segments_fts MATCH ?
+        """
+        parameters: List[Any] = [query]
+        if lesson:
+            sql += " AND (t.lesson = ? OR t.lesson LIKE ? ESCAPE '\\')"
+            escaped = lesson.rstrip('/').replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            parameters += [lesson.rstrip('/'), escaped + '/%']
+        sql += " ORDER BY bm25(segments_fts) LIMIT ?"
+        parameters.append(limit)
+
+        with self._lock:
+            rows = self._db.execute(sql, parameters).fetchall()
+        keys = ('lesson', 'media', 'title', 'start_ms', 'end_ms', 'snippet', 'score')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def stats(self) -> Dict[str, int]:
+        """
+        :return: Number of indexed transcripts, segments and lessons.
+        """
+        with self._lock:
+            transcripts, lessons = self._db.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT lesson) FROM transcripts"
+            ).fetchone()
+            segments = self._db.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+        return {'transcripts': transcripts, 'segments': segments, 'lessons': lessons}
+
+
+def main() -> None:
+    """
+    Command line interface to search the transcript index.
+    """
+    parser = argparse.ArgumentParser(description="Search the transcripts of all lessons.")
+    parser.add_argument('--index', default=DEFAULT_INDEX_PATH, help="Path of the index database.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    search = commands.add_parser('search', help="Find the segments mentioning a topic.")
+    search.add_argument('query', nargs='+', help="Words to search for.")
+    search.add_argument('--lesson', help="Only search below this lesson path.")
+    search.add_argument('--limit', type=int, default=DEFAULT_SEARCH_LIMIT, help="Maximum number of hits.")
+    search.add_argument('--raw', action='store_true', help="Use the FTS5 query syntax (prefix*, OR, NEAR).")
+    search.add_argument('--json', action='store_true', help="Print the hits as JSON lines.")
+    commands.add_parser('stats', help="Show the size of the index.")
+    remove = commands.add_parser('remove', help="Remove the transcripts of media files.")
+    remove.add_argument('files', nargs='+', help="Media files whose transcripts should be removed.")
+    args = parser.parse_args()
+
+    index = TranscriptIndex(args.index)
+    try:
+        if args.command == 'search':
+            try:
+                hits = index.search(' '.join(args.query), args.limit, args.lesson, args.raw)
+            except sqlite3.OperationalError as e:
+                parser.error(f"invalid query: {e}")
+            for hit in hits:
+                if args.json:
+                    print(json.dumps(hit, ensure_ascii=False))
+                else:
+                    print(f"{hit['lesson']}/{hit['title']} @ {format_offset(hit['start_ms'])} "
+                          f"({hit['start_ms']}-{hit['end_ms']} ms)\n    {hit['snippet']}")
+        elif args.command == 'stats':
+            stats = index.stats()
+            print(f"{stats['transcripts']} transcripts, {stats['segments']} segments, "
+                  f"{stats['lessons']} lessons in {index.path}")
+        elif args.command == 'remove':
+            print(f"Removed {index.remove(args.files)} transcripts.")
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
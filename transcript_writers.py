@@ -0,0 +1,228 @@
+"""
+Script Name: transcript_writers.py
+
+Zweck des Skripts:
+Ausgabestufe der Transkription. Aus dem Ergebnis von Whisper (Text und Segmente) werden die gewünschten Dateien
+erzeugt: Text (.txt), Word (.docx), Untertitel mit Zeitstempeln (.srt, .vtt) und die vollständigen Segmente als JSON.
+Das Schreiben läuft auf einem eigenen Thread-Pool, sodass die Schleife, die die Ergebnisse der Transkription
+entgegennimmt, nicht auf den Aufbau der Word-Dokumente warten muss.
+
+Hauptfunktionen und -methoden:
+- OUTPUT_FORMATS / register_format: Verzeichnis der Ausgabeformate; weitere Formate lassen sich registrieren.
+- write_outputs: Schreibt eine Transkription in den gewählten Formaten.
+- OutputWriter: Thread-Pool, der Transkriptionen im Hintergrund schreibt.
+
+Hinweise auf spezielle Implementierungsentscheidungen oder Sicherheitsaspekte:
+- Jede Datei wird zuerst unter einem temporären Namen geschrieben und dann atomar umbenannt; nach einem Abbruch
+  liegen nie halb geschriebene Transkriptionen im Ausgabeordner.
+- Jede geschriebene Datei wird als Span der Stufe "write" erfasst (siehe metrics.py).
+- Standardmässig entstehen wie bisher nur .txt und .docx; .srt, .vtt und .json werden auf Wunsch zusätzlich
+  geschrieben. Formate sind einzeln abwählbar. Schlägt ein Format fehl, werden die übrigen trotzdem geschrieben.
+  Für Massenläufe genügen z.B. "txt" und "json"; python-docx wird nur geladen,
+  wenn das Format "docx" tatsächlich geschrieben wird.
+"""
+
+import json
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+import metrics
+
+# Logging configuration
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DEFAULT_WRITER_WORKERS = 2  # Threads, die Ausgabedateien schreiben
+
+
+class OutputWriteError(Exception):
+    """Raised if some output formats could not be written; the other formats were written nonetheless."""
+
+    def __init__(self, failures: Dict[str, Exception], written: List[str]):
+        super().__init__("; ".join(f"{name}: {type(error).__name__}: {error}" for name, error in failures.items()))
+        self.failures = failures
+        self.written = written
+
+
+@contextmanager
+def atomic_output(path: str) -> Iterator[str]:
+    """
+    Provide a temporary path that replaces ``path`` once the block finished without error.
+
+    The temporary name is unique per process and thread, so concurrent writers of the same file never share it.
+
+    :param path: Final path of the file.
+    :return: A context manager yielding the temporary path to write to.
+    """
+    temporary_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    try:
+        yield temporary_path
+        os.replace(temporary_path, path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+
+def _timestamp(seconds: float, separator: str) -> str:
+    milliseconds = max(0, round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600 * 1000)
+    minutes, milliseconds = divmod(milliseconds, 60 * 1000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{milliseconds:03d}"
+
+
+def _cues(transcription: Dict[str, Any]) -> List[Tuple[float, float, str]]:
+    return [
+        (segment['start'], segment['end'], segment['text'].strip())
+        for segment in transcription.get('segments') or ()
+        if segment.get('text', '').strip()
+    ]
+
+
+def write_txt(transcription: Dict[str, Any], path: str) -> None:
+    """Write the cleaned transcription text."""
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(transcription['text'])
+
+
+def write_docx(transcription: Dict[str, Any], path: str) -> None:
+    """Write the transcription text as Word document."""
+    from docx import Document  # Only needed if Word documents are requested
+
+    doc = Document()
+    doc.add_heading('Transcription', 0)
+    doc.add_paragraph(transcription['text'])
+    doc.save(path)
+
+
+def write_srt(transcription: Dict[str, Any], path: str) -> None:
+    """Write the segments as SubRip subtitles."""
+    with open(path, 'w', encoding='utf-8') as file:
+        for number, (start, end, text) in enumerate(_cues(transcription), 1):
+            file.write(f"{number}\n{_timestamp(start, ',')} --> {_timestamp(end, ',')}\n{text}\n\n")
+
+
+def write_vtt(transcription: Dict[str, Any], path: str) -> None:
+    """Write the segments as WebVTT subtitles."""
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write("WEBVTT\n\n")
+        for start, end, text in _cues(transcription):
+            file.write(f"{_timestamp(start, '.')} --> {_timestamp(end, '.')}\n{text}\n\n")
+
+
+def write_json(transcription: Dict[str, Any], path: str) -> None:
+    """Write the text together with the complete Whisper segments."""
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump({'text': transcription['text'], 'segments': transcription.get('segments') or []}, file,
+                  ensure_ascii=False, indent=1)
+
+
+# Format name -> (file name, writer)
+OUTPUT_FORMATS: Dict[str, Tuple[str, Callable[[Dict[str, Any], str], None]]] = {
+    'txt': ('transcription.txt', write_txt),
+    'docx': ('transcription.docx', write_docx),
+    'srt': ('transcription.srt', write_srt),
+    'vtt': ('transcription.vtt', write_vtt),
+    'json': ('transcription.json', write_json),
+}
+DEFAULT_OUTPUT_FORMATS = ('txt', 'docx')  # Wie bisher; srt, vtt und json werden nur auf Wunsch geschrieben
+
+
+def register_format(name: str, file_name: str, writer: Callable[[Dict[str, Any], str], None]) -> None:
+    """
+    Add an output format or replace an existing one.
+
+    :param name: Name of the format, as used in the ``formats`` options.
+    :param file_name: Name of the file written into the transcription directory.
+    :param writer: Function writing a transcription (text and segments) to the given path.
+    """
+    OUTPUT_FORMATS[name] = (file_name, writer)
+
+
+def check_formats(formats: Iterable[str]) -> Tuple[str, ...]:
+    """
+    Validate output format names.
+
+    :param formats: Names of output formats.
+    :return: The formats as tuple.
+    """
+    formats = tuple(formats)
+    unknown = [name for name in formats if name not in OUTPUT_FORMATS]
+    if unknown:
+        raise ValueError(f"Unknown output formats {unknown}, expected some of {tuple(OUTPUT_FORMATS)}.")
+    return formats
+
+
+def output_path(directory: str, name: str) -> str:
+    """
+    Return the path of an output format inside a transcription directory.
+
+    :param directory: The transcription directory.
+    :param name: Name of the output format.
+    :return: Path of the output file.
+    """
+    return os.path.join(directory, OUTPUT_FORMATS[name][0])
+
+
+def write_outputs(transcription: Dict[str, Any], directory: str,
+                  formats: Iterable[str] = DEFAULT_OUTPUT_FORMATS) -> List[str]:
+    """
+    Write a transcription into a directory in the given formats, each file atomically.
+
+    A failing format does not stop the others; the failures are raised together once all formats were tried.
+
+    :param transcription: The transcription result with "text" and "segments".
+    :param directory: The transcription directory.
+    :param formats: Names of the output formats to write.
+    :return: Paths of the written files.
+    :raises OutputWriteError: If any format could not be written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    written, failures = [], {}
+    for name in check_formats(formats):
+        path = output_path(directory, name)
+        try:
+            with metrics.span('write', path, format=name) as span, atomic_output(path) as temporary_path:
+                OUTPUT_FORMATS[name][1](transcription, temporary_path)
+                span.set(bytes=os.path.getsize(temporary_path))
+        except Exception as e:
+            logging.error(f"Error writing {path}: {e}")
+            failures[name] = e
+            continue
+        written.append(path)
+    if failures:
+        raise OutputWriteError(failures, written)
+    return written
+
+
+class OutputWriter:
+    """
+    Writer pool producing the output files of transcriptions in the background.
+    """
+
+    def __init__(self, formats: Iterable[str] = DEFAULT_OUTPUT_FORMATS, max_workers: int = DEFAULT_WRITER_WORKERS):
+        self.formats = check_formats(formats)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='writer')
+
+    def __enter__(self) -> "OutputWriter":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def submit(self, transcription: Dict[str, Any], directory: str) -> "Future[List[str]]":
+        """
+        Queue a transcription for writing.
+
+        :param transcription: The transcription result with "text" and "segments".
+        :param directory: The transcription directory.
+        :return: A future resolving to the paths of the written files.
+        """
+        return self._executor.submit(write_outputs, transcription, directory, self.formats)
+
+    def close(self) -> None:
+        """Wait for all queued writes and stop the writer threads."""
+        self._executor.shutdown(wait=True)